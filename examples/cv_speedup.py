@@ -0,0 +1,58 @@
+import multiprocessing
+import logging
+import time
+
+from protodata import datasets
+
+from validation.tuning import _cross_validate
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)-8s %(message)s',
+)
+
+# Folds are validated with the same fixed setting sequentially and in
+# parallel so wall-clock times can be compared
+PARAMS = {
+    'batch_size': 16,
+    'l2_ratio': 1e-2,
+    'lr': 1e-3,
+    'kernel_size': 64,
+    'kernel_std': 0.1,
+    'hidden_units': 128,
+    'max_layers': 2,
+    'lr_decay': 0.5,
+    'lr_decay_epochs': 250,
+    'n_threads': 2,
+    'strip_length': 5,
+    'memory_factor': 1,
+    'max_epochs': 500,
+    'progress_thresh': 0.1
+}
+
+
+if __name__ == '__main__':
+
+    workers = multiprocessing.cpu_count()
+
+    times, n_folds = {}, None
+    for fold_workers in [1, workers]:
+        before = time.time()
+        result = _cross_validate(
+            datasets.Datasets.SONAR,
+            datasets.SonarSettings,
+            fold_workers=fold_workers,
+            **PARAMS
+        )
+        times[fold_workers] = time.time() - before
+        n_folds = len(result['all'])
+        logger.info(
+            '[%d workers] %fs, validation error %f'
+            % (fold_workers, times[fold_workers], result['loss'])
+        )
+
+    logger.info(
+        'Fold-parallel speedup on %d folds: %.2fx'
+        % (n_folds, times[1] / times[workers])
+    )
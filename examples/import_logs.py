@@ -0,0 +1,21 @@
+import logging
+import sys
+
+from validation.trial_store import TrialStore, import_logs
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)-8s %(message)s',
+)
+
+
+if __name__ == '__main__':
+
+    # Usage: import_logs.py [logs folder] [store path]
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'logs'
+    path = sys.argv[2] if len(sys.argv) > 2 else 'trials.db'
+
+    store = TrialStore(path)
+    n_trials = import_logs(store, folder)
+    logger.info('Stored %d trials from %s in %s' % (n_trials, folder, path))
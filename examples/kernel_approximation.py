@@ -0,0 +1,71 @@
+import tensorflow as tf
+import numpy as np
+import logging
+
+from kernels import GaussianRFF, OrthogonalRFF, StructuredORF, \
+                    QuasiMonteCarloRFF, FastfoodRFF, KERNEL_ASSIGN_OPS
+
+N_SAMPLES = 256
+INPUT_DIMS = 32
+KERNEL_STD = 0.25
+REPETITIONS = 5
+KERNEL_SIZES = [32, 64, 128, 256, 512, 1024, 2048]
+SAMPLERS = [
+    GaussianRFF, OrthogonalRFF, StructuredORF, QuasiMonteCarloRFF, FastfoodRFF
+]
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)-8s %(message)s',
+)
+
+
+def gaussian_kernel(x, std):
+    """
+    Exact kernel whose Fourier transform is N(0, std^2)
+    """
+    sq_norms = np.sum(x ** 2, axis=1)
+    dists = sq_norms[:, None] + sq_norms[None, :] - 2 * np.dot(x, x.T)
+    return np.exp(-0.5 * std ** 2 * dists)
+
+
+def approximation_error(kernel_fn, x, kernel_size):
+    """
+    Returns the relative Frobenius error of the approximated Gram matrix
+    """
+    exact = gaussian_kernel(x, KERNEL_STD)
+
+    with tf.Graph().as_default():
+        inputs = tf.placeholder(shape=[None, INPUT_DIMS], dtype=tf.float32)
+        kernel = kernel_fn(
+            name='approx_kernel',
+            input_dims=INPUT_DIMS,
+            kernel_size=kernel_size,
+            kernel_std=KERNEL_STD
+        )
+        z_op = kernel.apply_kernel(inputs, 'approximation')
+
+        with tf.Session() as sess:
+            sess.run(tf.get_collection(KERNEL_ASSIGN_OPS))
+            z = sess.run(z_op, feed_dict={inputs: x})
+
+    approx = np.dot(z, z.T)
+    return np.linalg.norm(approx - exact) / np.linalg.norm(exact)
+
+
+if __name__ == '__main__':
+
+    x = np.random.randn(N_SAMPLES, INPUT_DIMS)
+
+    for kernel_size in KERNEL_SIZES:
+        for kernel_fn in SAMPLERS:
+            errors = [
+                approximation_error(kernel_fn, x, kernel_size)
+                for _ in range(REPETITIONS)
+            ]
+            logger.info(
+                '[%d] %s relative error: %f +- %f'
+                % (kernel_size, kernel_fn.__name__,
+                   np.mean(errors), np.std(errors))
+            )
@@ -0,0 +1,63 @@
+import tensorflow as tf
+import numpy as np
+import logging
+import time
+
+from kernels import GaussianRFF, FastfoodRFF, KERNEL_ASSIGN_OPS
+
+BATCH_SIZE = 128
+REPETITIONS = 50
+SIZES = [(256, 256), (512, 512), (1024, 1024), (2048, 2048), (2048, 4096)]
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)-8s %(message)s',
+)
+
+
+def benchmark(kernel_fn, input_dims, kernel_size):
+    """
+    Returns the mean time in milliseconds of a forward pass of the kernel
+    mapping and the number of kernel parameters stored
+    """
+    with tf.Graph().as_default():
+
+        x = tf.placeholder(shape=[None, input_dims], dtype=tf.float32)
+        kernel = kernel_fn(
+            name='bench_kernel',
+            input_dims=input_dims,
+            kernel_size=kernel_size,
+            kernel_std=0.5
+        )
+        z = kernel.apply_kernel(x, 'benchmark')
+
+        stored = np.sum([
+            np.prod(v.get_shape().as_list())
+            for v in tf.global_variables()
+        ])
+
+        with tf.Session() as sess:
+            sess.run(tf.get_collection(KERNEL_ASSIGN_OPS))
+            batch = np.random.random((BATCH_SIZE, input_dims))
+
+            # Warm up
+            sess.run(z, feed_dict={x: batch})
+
+            before = time.time()
+            for _ in range(REPETITIONS):
+                sess.run(z, feed_dict={x: batch})
+            elapsed = (time.time() - before) / REPETITIONS
+
+    return elapsed * 1000, stored
+
+
+if __name__ == '__main__':
+
+    for input_dims, kernel_size in SIZES:
+        for kernel_fn in [GaussianRFF, FastfoodRFF]:
+            millis, stored = benchmark(kernel_fn, input_dims, kernel_size)
+            logger.info(
+                '%s (%d -> %d): %.3f ms per batch, %d stored values'
+                % (kernel_fn.__name__, input_dims, kernel_size, millis, stored)
+            )
@@ -0,0 +1,109 @@
+import tensorflow as tf
+import numpy as np
+import resource
+import logging
+import sys
+import time
+
+from layout.base import kernel_block, _fully_connected
+from ops import loss_ops_list, train_ops_list
+from variables import get_trainable_params, summarize_gradients
+
+N_LAYERS = 4
+N_CLASSES = 10
+INPUT_DIMS = 64
+BATCH_SIZE = 128
+PARAMS = {
+    'hidden_units': 2048,
+    'kernel_size': 2048,
+    'kernel_std': 0.5,
+    'l2_ratio': 1e-3,
+}
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)-8s %(message)s',
+)
+
+
+def legacy_train_ops_list(lr, loss_ops, n_layers, tag):
+    """
+    Previous version: one optimizer and gradient graph per position
+    """
+    def train_op(loss_op, opt_vars):
+        optimizer = tf.train.AdamOptimizer(learning_rate=lr)
+        grads = optimizer.compute_gradients(loss_op, var_list=opt_vars)
+        summarize_gradients(grads, tag)
+        return optimizer.apply_gradients(grads)
+
+    train_ops = [train_op(loss_ops[0], tf.trainable_variables())]
+    for i in range(1, n_layers + 1):
+        train_ops.append(
+            train_op(loss_ops[i], get_trainable_params([i], True))
+        )
+    return train_ops
+
+
+def build(train_ops_fn):
+    x = tf.placeholder(shape=[None, INPUT_DIMS], dtype=tf.float32)
+    y = tf.placeholder(shape=[None, 1], dtype=tf.int32)
+
+    with tf.variable_scope('network'):
+        hidden = x
+        for i in range(1, N_LAYERS + 1):
+            hidden = kernel_block(
+                hidden, '%d_nk' % i, 'benchmark', False, **PARAMS
+            )
+        logits = _fully_connected(
+            hidden, N_CLASSES, 'output', 'benchmark', activation_fn=None
+        )
+
+        loss_ops = loss_ops_list(
+            logits=logits,
+            y=y,
+            sum_collection='benchmark',
+            n_classes=N_CLASSES,
+            num_layers=N_LAYERS,
+            **PARAMS
+        )
+        train_ops = train_ops_fn(0.001, loss_ops, N_LAYERS, 'benchmark')
+
+    return x, y, train_ops
+
+
+if __name__ == '__main__':
+
+    # Run each mode in a separate process so resident memory is comparable
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'shared'
+    train_ops_fn = legacy_train_ops_list if mode == 'legacy' \
+        else train_ops_list
+
+    with tf.Graph().as_default() as graph:
+
+        before = time.time()
+        x, y, train_ops = build(train_ops_fn)
+        build_time = time.time() - before
+
+        variable_bytes = np.sum([
+            np.prod(v.get_shape().as_list()) * v.dtype.size
+            for v in tf.global_variables()
+        ])
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(
+                train_ops[N_LAYERS],
+                feed_dict={
+                    x: np.random.random((BATCH_SIZE, INPUT_DIMS)),
+                    y: np.random.randint(N_CLASSES, size=(BATCH_SIZE, 1))
+                }
+            )
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        logger.info(
+            '[%s] Graph build: %.2fs, %d ops, %d variables (%.1f MB), '
+            % (mode, build_time, len(graph.get_operations()),
+               len(tf.global_variables()), variable_bytes / 2 ** 20) +
+            'max resident memory: %.1f MB' % (max_rss / 1024.0)
+        )
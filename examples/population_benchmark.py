@@ -0,0 +1,125 @@
+import tensorflow as tf
+import numpy as np
+import logging
+import sys
+import time
+
+from layout.base import kernel_block, _fully_connected
+from layout.replicated import replicate_input, replicated_kernel_block, \
+                              replicated_fully_connected
+from ops import init_kernel_ops, loss_ops_list, train_ops_list
+from training.population import build_member_mask, PopulationAdamOptimizer
+
+N_LAYERS = 2
+N_CLASSES = 10
+INPUT_DIMS = 64
+BATCH_SIZE = 128
+N_STEPS = 200
+LEARNING_RATES = [1e-4, 3e-4, 1e-3, 3e-3]
+PARAMS = {
+    'hidden_units': 512,
+    'kernel_size': 512,
+    'kernel_std': 0.5,
+    'l2_ratio': 1e-3,
+}
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)-8s %(message)s',
+)
+
+
+def build(learning_rates):
+    """
+    Builds a network trained with the given learning rates, as the members
+    of a replicated network if there is more than one
+    """
+    x = tf.placeholder(shape=[None, INPUT_DIMS], dtype=tf.float32)
+    y = tf.placeholder(shape=[None, 1], dtype=tf.int32)
+
+    replicas = len(learning_rates) if len(learning_rates) > 1 else None
+    params = dict(PARAMS, replicas=replicas)
+
+    with tf.variable_scope('network'):
+        if replicas is not None:
+            hidden = replicate_input(x, replicas)
+            block_fn, output_fn = replicated_kernel_block, \
+                replicated_fully_connected
+        else:
+            hidden = x
+            block_fn, output_fn = kernel_block, _fully_connected
+
+        for i in range(1, N_LAYERS + 1):
+            hidden = block_fn(
+                hidden, '%d_nk' % i, 'benchmark', False, **params
+            )
+        logits = output_fn(
+            hidden, N_CLASSES, 'output', 'benchmark', activation_fn=None
+        )
+
+        loss_ops = loss_ops_list(
+            logits=logits,
+            y=y,
+            sum_collection='benchmark',
+            n_classes=N_CLASSES,
+            num_layers=N_LAYERS,
+            **params
+        )
+
+        if replicas is not None:
+            lr = tf.constant(learning_rates, dtype=tf.float32)
+            optimizer = PopulationAdamOptimizer(
+                lr, build_member_mask(replicas)
+            )
+        else:
+            lr = learning_rates[0]
+            optimizer = tf.train.AdamOptimizer(learning_rate=lr)
+        train_ops = train_ops_list(
+            lr, loss_ops, N_LAYERS, 'benchmark', optimizer=optimizer
+        )
+
+    return x, y, train_ops[0]
+
+
+def train(learning_rates, batches):
+    """ Returns the seconds taken to train the network on the batches """
+    with tf.Graph().as_default():
+        x, y, train_op = build(learning_rates)
+
+        with tf.Session() as sess:
+            sess.run([
+                tf.global_variables_initializer(),
+                tf.local_variables_initializer()
+            ])
+            init_kernel_ops(sess)
+
+            before = time.time()
+            for batch_x, batch_y in batches:
+                sess.run(train_op, feed_dict={x: batch_x, y: batch_y})
+            return time.time() - before
+
+
+if __name__ == '__main__':
+
+    # Trials trained one after another or as the members of a population
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'population'
+
+    batches = [
+        (np.random.random((BATCH_SIZE, INPUT_DIMS)),
+         np.random.randint(N_CLASSES, size=(BATCH_SIZE, 1)))
+        for _ in range(N_STEPS)
+    ]
+
+    if mode == 'sequential':
+        elapsed = np.sum([train([lr], batches) for lr in LEARNING_RATES])
+    else:
+        elapsed = train(LEARNING_RATES, batches)
+
+    trial_steps = len(LEARNING_RATES) * N_STEPS
+    logger.info(
+        '[%s] %d trials of %d steps in %.2fs: %.1f trial steps/s, '
+        % (mode, len(LEARNING_RATES), N_STEPS, elapsed,
+           trial_steps / elapsed) +
+        '%.1f trial examples/s' % (trial_steps * BATCH_SIZE / elapsed)
+    )
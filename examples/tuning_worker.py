@@ -0,0 +1,22 @@
+import logging
+import sys
+
+from validation.trial_queue import connect_queue, run_worker
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)-8s %(message)s',
+)
+
+
+if __name__ == '__main__':
+
+    # Usage: tuning_worker.py [queue url or path] [max idle seconds]
+    # Run on every node, e.g. against mongodb://coordinator:27017/tuning
+    # while tune_model is called with the same queue on the coordinator
+    url = sys.argv[1] if len(sys.argv) > 1 else 'queue.db'
+    max_idle = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    n_jobs = run_worker(connect_queue(url), max_idle_secs=max_idle)
+    logger.info('Worker finished after %d jobs' % n_jobs)
@@ -1,20 +1,45 @@
 import abc
+import zlib
 
 import numpy as np
 import tensorflow as tf
 
 KERNEL_COLLECTION = 'KERNEL_VARS'
 KERNEL_ASSIGN_OPS = 'KERNEL_ASSIGN_OPS'
+LANDMARK_ASSIGN_OPS = 'LANDMARK_ASSIGN_OPS'
+SEEDED_KERNEL_COLLECTION = 'SEEDED_KERNEL_VARS'
+MAX_SEED = 2 ** 30
+QMC_EPSILON = 1e-6
+NYSTROM_EPSILON = 1e-6
 
 
 class RandomFourierFeatures(object):
 
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, name, input_dims, kernel_size):
+    def __init__(self, name, input_dims, kernel_size, seed=None):
         self._name = name
         self._input_dims = input_dims
         self._kernel_size = kernel_size
+        self._seed = seed
+        self._op_count = 0
+
+    def _op_seed(self):
+        """
+        Returns a different seed for each random op so draws are a
+        deterministic function of the kernel seed, or None if not seeded
+        """
+        if self._seed is None:
+            return None
+        self._op_count += 1
+        return self._seed + self._op_count
+
+    def _collections(self):
+        # Seeded kernels are regenerated at init instead of checkpointed
+        collections = [KERNEL_COLLECTION, tf.GraphKeys.GLOBAL_VARIABLES]
+        if self._seed is not None:
+            collections.append(SEEDED_KERNEL_COLLECTION)
+        return collections
 
     @abc.abstractmethod
     def draw_w(self):
@@ -37,14 +62,14 @@ class RandomFourierFeatures(object):
             w_name,
             [self._kernel_size, self._input_dims],
             trainable=False,  # Important: this is constant!
-            collections=[KERNEL_COLLECTION, tf.GraphKeys.GLOBAL_VARIABLES]
+            collections=self._collections()
         )
 
         b = tf.get_variable(
             b_name,
             [self._kernel_size],
             trainable=False,  # Important: this is constant!
-            collections=[KERNEL_COLLECTION, tf.GraphKeys.GLOBAL_VARIABLES]
+            collections=self._collections()
         )
 
         w_value, b_value = self.draw_w(), self.draw_b()
@@ -77,38 +102,515 @@ class GaussianRFF(RandomFourierFeatures):
                  input_dims,
                  kernel_size,
                  kernel_std,
+                 kernel_seed=None,
                  **params):
         super(GaussianRFF, self).__init__(
-            name, input_dims, kernel_size
+            name, input_dims, kernel_size, layer_seed(kernel_seed, name)
         )
         self._std = kernel_std
 
     def draw_w(self):
         return tf.random_normal(
             stddev=self._std,
-            shape=[self._kernel_size, self._input_dims]
+            shape=[self._kernel_size, self._input_dims],
+            seed=self._op_seed()
         )
 
     def draw_b(self):
         return tf.random_uniform(
-            shape=[self._kernel_size], minval=0, maxval=2*np.pi
+            shape=[self._kernel_size], minval=0, maxval=2*np.pi,
+            seed=self._op_seed()
+        )
+
+
+class OrthogonalRFF(GaussianRFF):
+    """
+    Gaussian random features where the rows of each square block of w are
+    forced to be orthogonal, which gives lower variance kernel estimates
+    than i.i.d. Gaussian rows. As detailed in:
+        Orthogonal Random Features. Felix Yu et al. (2016)
+    """
+
+    def _num_blocks(self, dims):
+        return int(np.ceil(self._kernel_size / dims))
+
+    def _block(self):
+        gauss = tf.random_normal(
+            [self._input_dims, self._input_dims], seed=self._op_seed()
+        )
+        q, r = tf.qr(gauss)
+
+        # Fix the signs so Q is uniformly distributed over orthogonal matrices
+        q = q * tf.sign(tf.diag_part(r))
+        return q
+
+    def _row_norms(self, dims):
+        # Rows of a Gaussian matrix have chi-distributed norms
+        return tf.sqrt(
+            tf.random_gamma(
+                [dims], alpha=dims/2.0, beta=0.5, seed=self._op_seed()
+            )
+        )
+
+    def draw_w(self):
+        blocks = [
+            self._block() * tf.expand_dims(
+                self._row_norms(self._input_dims), 1
+            )
+            for _ in range(self._num_blocks(self._input_dims))
+        ]
+        w = tf.concat(blocks, axis=0)[:self._kernel_size, :]
+        return w * self._std
+
+
+class StructuredORF(OrthogonalRFF):
+    """
+    Structured variant of orthogonal random features where each block is
+    sqrt(d) * H D1 H D2 H D3, with H the normalized Walsh-Hadamard matrix
+    and Di diagonal sign matrices. Input dimensions are zero-padded to the
+    next power of two d and each block is computed in O(d^2 log d) instead
+    of the O(d^3) QR decomposition.
+    """
+
+    def _block(self):
+        dims = _next_power_of_two(self._input_dims)
+        norm = np.sqrt(dims)
+
+        # Right multiplications by H are Hadamard transforms of the rows
+        x = hadamard_transform(tf.eye(dims)) / norm
+        for i in range(3):
+            signs = tf.sign(tf.random_uniform(
+                [dims], minval=-1, maxval=1, seed=self._op_seed()
+            ))
+            x = x * signs
+            if i < 2:
+                x = hadamard_transform(x) / norm
+
+        return x * norm
+
+    def draw_w(self):
+        dims = _next_power_of_two(self._input_dims)
+        blocks = [
+            self._block()[:, :self._input_dims]
+            for _ in range(self._num_blocks(dims))
+        ]
+        w = tf.concat(blocks, axis=0)[:self._kernel_size, :]
+        return w * self._std
+
+
+class QuasiMonteCarloRFF(GaussianRFF):
+    """
+    Gaussian random features where frequencies are drawn from a scrambled
+    Halton sequence mapped through the inverse Gaussian CDF, which converges
+    faster than Monte Carlo sampling in the number of features. As detailed
+    in:
+        Quasi-Monte Carlo Feature Maps for Shift-Invariant Kernels.
+        Jiyan Yang et al. (2014)
+
+    Each draw applies a new random shift (Cranley-Patterson rotation) to
+    the sequence so kernel dropout still gets fresh samples
+    """
+
+    def __init__(self,
+                 name,
+                 input_dims,
+                 kernel_size,
+                 kernel_std,
+                 qmc_seed=None,
+                 **params):
+        super(QuasiMonteCarloRFF, self).__init__(
+            name, input_dims, kernel_size, kernel_std, **params
+        )
+        # Scrambling must also be reproducible for seeded kernels
+        self._qmc_seed = qmc_seed if qmc_seed is not None else self._seed
+
+    def _shifted(self, points):
+        shift = tf.random_uniform([points.shape[1]], seed=self._op_seed())
+        u = tf.mod(tf.constant(points, dtype=tf.float32) + shift, 1.0)
+        # Keep away from the infinite tails of the inverse CDF
+        return tf.clip_by_value(u, QMC_EPSILON, 1.0 - QMC_EPSILON)
+
+    def draw_w(self):
+        points = halton_sequence(
+            self._kernel_size, self._input_dims, self._qmc_seed
         )
+        normal = tf.distributions.Normal(loc=0.0, scale=self._std)
+        return normal.quantile(self._shifted(points))
+
+    def draw_b(self):
+        points = halton_sequence(self._kernel_size, 1, self._qmc_seed)
+        return tf.squeeze(self._shifted(points), 1) * 2 * np.pi
+
+
+class FastfoodRFF(GaussianRFF):
+    """
+    Gaussian random features where the dense projection is replaced by the
+    structured Fastfood product:
+        V = std/sqrt(d) * S H G P H B
+
+    Where H is the Walsh-Hadamard matrix and B, G, P and S are diagonal
+    binary, diagonal Gaussian, permutation and diagonal scaling matrices.
+    As detailed in:
+        Fastfood - Approximating Kernel Expansions in Loglinear Time.
+        Quoc Le, Tamas Sarlos, Alex Smola (2013)
+
+    Input dimensions are zero-padded to the next power of two d and
+    ceil(kernel_size/d) independent blocks are stacked, so the projection
+    costs O(kernel_size log d) time and O(kernel_size) storage. Note that
+    there is no dense w matrix, so kernel dropout leaves these untouched
+    """
+
+    def __init__(self,
+                 name,
+                 input_dims,
+                 kernel_size,
+                 kernel_std,
+                 **params):
+        super(FastfoodRFF, self).__init__(
+            name, input_dims, kernel_size, kernel_std, **params
+        )
+        self._padded_dims = _next_power_of_two(input_dims)
+        self._blocks = int(np.ceil(kernel_size / self._padded_dims))
+
+    def draw_w(self):
+        """
+        Returns the binary, Gaussian, permutation and scaling diagonals
+        for all stacked blocks
+        """
+        shape = [self._blocks, self._padded_dims]
+
+        binary = tf.sign(tf.random_uniform(
+            shape, minval=-1.0, maxval=1.0, seed=self._op_seed()
+        ))
+        gauss = tf.random_normal(shape, seed=self._op_seed())
+
+        # Permutation indices over the flattened blocks
+        offsets = tf.expand_dims(
+            tf.range(self._blocks) * self._padded_dims, 1
+        )
+        perm = tf.stack([
+            tf.random_shuffle(
+                tf.range(self._padded_dims), seed=self._op_seed()
+            )
+            for _ in range(self._blocks)
+        ])
+        perm = tf.reshape(perm + offsets, [-1])
+
+        # Rows of a Gaussian matrix have chi-distributed norms
+        chi = tf.sqrt(
+            tf.random_gamma(
+                shape, alpha=self._padded_dims/2.0, beta=0.5,
+                seed=self._op_seed()
+            )
+        )
+        scale = chi / tf.norm(gauss, axis=1, keep_dims=True)
+
+        return binary, gauss, perm, scale
+
+    def apply_kernel(self, x, tag):
+
+        b_name = '_'.join([self._name, 'b'])  # Name is important, dont change
+        shape = [self._blocks, self._padded_dims]
+
+        binary, gauss, perm, scale = [
+            tf.get_variable(
+                '_'.join([self._name, suffix]),
+                var_shape,
+                dtype=dtype,
+                initializer=tf.zeros_initializer(),
+                trainable=False,  # Important: this is constant!
+                collections=self._collections()
+            )
+            for suffix, var_shape, dtype in [
+                ('binary', shape, tf.float32),
+                ('gauss', shape, tf.float32),
+                ('perm', [self._blocks * self._padded_dims], tf.int32),
+                ('scale', shape, tf.float32),
+            ]
+        ]
+
+        b = tf.get_variable(
+            b_name,
+            [self._kernel_size],
+            trainable=False,  # Important: this is constant!
+            collections=self._collections()
+        )
+
+        for var, value in zip([binary, gauss, perm, scale], self.draw_w()):
+            tf.add_to_collection(KERNEL_ASSIGN_OPS, var.assign(value))
+        tf.add_to_collection(KERNEL_ASSIGN_OPS, b.assign(self.draw_b()))
+
+        # Let's store the structured matrices so we have them if needed
+        self._binary, self._gauss, self._perm, self._scale = \
+            binary, gauss, perm, scale
+        self._b = b
+
+        tf.summary.histogram('_'.join([self._name, 'gauss']), gauss, [tag])
+        tf.summary.histogram(b_name, b, [tag])
+
+        # Flatten leading dimensions and pad input to a power of two
+        x_shape = x.get_shape().as_list()
+        flat = tf.reshape(x, [-1, self._input_dims])
+        flat = tf.pad(
+            flat, [[0, 0], [0, self._padded_dims - self._input_dims]]
+        )
+
+        # Apply H B for each block
+        blocks = tf.expand_dims(flat, 1) * binary
+        blocks = hadamard_transform(blocks)
+
+        # Apply G P
+        blocks = tf.reshape(blocks, [-1, self._blocks * self._padded_dims])
+        blocks = tf.gather(blocks, perm, axis=1)
+        blocks = tf.reshape(blocks, [-1, self._blocks, self._padded_dims])
+        blocks = hadamard_transform(blocks * gauss)
+
+        # Scale so rows behave as draws from N(0, std^2)
+        blocks = blocks * scale * (self._std / np.sqrt(self._padded_dims))
+        projected = tf.reshape(
+            blocks, [-1, self._blocks * self._padded_dims]
+        )[:, :self._kernel_size]
+
+        dot = tf.add(projected, b)
+        dot = tf.reshape(
+            dot, tf.concat([tf.shape(x)[:-1], [self._kernel_size]], axis=0)
+        )
+        dot.set_shape(x_shape[:-1] + [self._kernel_size])
+        tf.summary.histogram(self._name + '_dot', dot, [tag])
+
+        z = tf.cos(dot) * np.sqrt(2/self._kernel_size)
+        tf.summary.histogram(self._name + '_z', z, [tag])
+
+        return z
+
+
+class NystromFeatures(object):
+    """
+    Data-dependent feature map for the Gaussian kernel
+        k(x, y) = exp(-std^2 * ||x - y||^2 / 2)
+    (the one approximated by GaussianRFF with the same std) built from m
+    landmark points L:
+        z(x) = k(x, L) K_LL^(-1/2)
+
+    Landmarks are distinct rows of the first batch seen after the session
+    starts (see init_landmark_ops), so batches must have at least m rows
+    """
+
+    def __init__(self,
+                 name,
+                 input_dims,
+                 kernel_size,
+                 kernel_std,
+                 landmark_selection='uniform',
+                 **params):
+        if landmark_selection not in LANDMARK_SELECTION:
+            raise ValueError(
+                'Unknown landmark selection %s' % landmark_selection
+            )
+        self._name = name
+        self._input_dims = input_dims
+        self._kernel_size = kernel_size
+        self._std = kernel_std
+        self._selection = landmark_selection
+
+    def _kernel(self, x, landmarks):
+        sq_dists = tf.reduce_sum(tf.square(x), 1, keep_dims=True) \
+            - 2 * tf.matmul(x, landmarks, transpose_b=True) \
+            + tf.reduce_sum(tf.square(landmarks), 1)
+        return tf.exp(-0.5 * self._std ** 2 * tf.maximum(sq_dists, 0.0))
+
+    def draw_landmarks(self, x):
+        """
+        Returns the landmarks drawn from the rows of x and their whitening
+        matrix
+        """
+        enough_rows = tf.assert_greater_equal(
+            tf.shape(x)[0], self._kernel_size,
+            message='Batch has fewer rows than Nystrom landmarks'
+        )
+        with tf.control_dependencies([enough_rows]):
+            indices = LANDMARK_SELECTION[self._selection](
+                x, self._kernel_size
+            )
+        landmarks = tf.gather(x, indices)
+
+        # Inverse square root of the landmark kernel matrix
+        eigvals, eigvecs = tf.self_adjoint_eig(
+            self._kernel(landmarks, landmarks)
+        )
+        inv_sqrt = tf.rsqrt(tf.maximum(eigvals, NYSTROM_EPSILON))
+        whitening = tf.matmul(eigvecs * inv_sqrt, eigvecs, transpose_b=True)
+
+        return landmarks, whitening
+
+    def apply_kernel(self, x, tag, init_landmarks=True):
+
+        l_name = '_'.join([self._name, 'landmarks'])  # Name is important
+        m_name = '_'.join([self._name, 'whitening'])  # Name is important
+
+        landmarks = tf.get_variable(
+            l_name,
+            [self._kernel_size, self._input_dims],
+            initializer=tf.zeros_initializer(),
+            trainable=False,  # Important: this is constant!
+            collections=[KERNEL_COLLECTION, tf.GraphKeys.GLOBAL_VARIABLES]
+        )
+
+        whitening = tf.get_variable(
+            m_name,
+            [self._kernel_size, self._kernel_size],
+            initializer=tf.zeros_initializer(),
+            trainable=False,  # Important: this is constant!
+            collections=[KERNEL_COLLECTION, tf.GraphKeys.GLOBAL_VARIABLES]
+        )
+
+        flat = tf.reshape(x, [-1, self._input_dims])
+
+        if init_landmarks:
+            l_value, m_value = self.draw_landmarks(flat)
+            tf.add_to_collection(
+                LANDMARK_ASSIGN_OPS, landmarks.assign(l_value)
+            )
+            tf.add_to_collection(
+                LANDMARK_ASSIGN_OPS, whitening.assign(m_value)
+            )
+
+        # Let's store the map so we have it if needed
+        self._landmarks = landmarks
+        self._whitening = whitening
+
+        tf.summary.histogram(l_name, landmarks, [tag])
+
+        z = tf.matmul(self._kernel(flat, landmarks), whitening)
+        z = tf.reshape(
+            z, tf.concat([tf.shape(x)[:-1], [self._kernel_size]], axis=0)
+        )
+        z.set_shape(x.get_shape().as_list()[:-1] + [self._kernel_size])
+        tf.summary.histogram(self._name + '_z', z, [tag])
+
+        return z
+
+
+def _uniform_landmarks(x, m):
+    # Without replacement, repeated landmarks make K_LL singular
+    return tf.random_shuffle(tf.range(tf.shape(x)[0]))[:m]
+
+
+def _kmeans_pp_landmarks(x, m):
+    """
+    Returns indices of x chosen by k-means++ seeding: each new landmark is
+    drawn with probability proportional to its squared distance to the
+    closest landmark already chosen
+    """
+    def sq_dists(idx):
+        return tf.reduce_sum(tf.square(x - x[idx]), 1)
+
+    first = tf.random_uniform([], maxval=tf.shape(x)[0], dtype=tf.int32)
+    chosen = tf.TensorArray(tf.int32, size=m).write(0, first)
+
+    def body(i, chosen, dists):
+        logits = tf.expand_dims(tf.log(dists + NYSTROM_EPSILON), 0)
+        idx = tf.cast(tf.multinomial(logits, 1)[0, 0], tf.int32)
+        return i + 1, chosen.write(i, idx), tf.minimum(dists, sq_dists(idx))
+
+    _, chosen, _ = tf.while_loop(
+        lambda i, *_: i < m, body, [1, chosen, sq_dists(first)]
+    )
+    return chosen.stack()
+
+
+LANDMARK_SELECTION = {
+    'uniform': _uniform_landmarks,
+    'kmeans++': _kmeans_pp_landmarks,
+}
+
+
+def hadamard_transform(x):
+    """
+    Returns the unnormalized Walsh-Hadamard transform of x along its last
+    dimension, which must be a power of two, in O(d log d)
+    """
+    dims = x.get_shape().as_list()[-1]
+    out_shape = tf.shape(x)
+
+    h = 1
+    while h < dims:
+        pairs = tf.reshape(x, [-1, dims // (2 * h), 2, h])
+        first, second = pairs[:, :, 0, :], pairs[:, :, 1, :]
+        x = tf.stack([first + second, first - second], axis=2)
+        h *= 2
+
+    return tf.reshape(x, out_shape)
+
+
+def halton_sequence(n, dims, seed=None):
+    """
+    Returns the first n points (skipping the origin) of the
+    dims-dimensional Halton sequence with random digit permutations,
+    which avoids the correlations between coordinates of plain Halton
+    for large prime bases
+    """
+    state = np.random.RandomState(seed)
+    indices = np.arange(1, n + 1)
+    points = np.zeros((n, dims))
+
+    for j, base in enumerate(_first_primes(dims)):
+        # Digit zero is kept fixed so trailing zeros add nothing
+        perm = np.concatenate([[0], state.permutation(base - 1) + 1])
+
+        current, factor = indices.copy(), 1.0 / base
+        while np.any(current > 0):
+            points[:, j] += perm[current % base] * factor
+            current //= base
+            factor /= base
+
+    return points
+
+
+def _first_primes(n):
+    primes, candidate = [], 2
+    while len(primes) < n:
+        if all(candidate % p != 0 for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def _next_power_of_two(n):
+    return 1 << (int(n) - 1).bit_length()
+
+
+# Suffixes of the kernel variables that are not dense w matrices
+NON_W_SUFFIXES = [
+    'b', 'binary', 'gauss', 'perm', 'scale', 'landmarks', 'whitening'
+]
 
 
 def is_w(name):
     suffix = name.split(':')[0].split('_')[-1]
     if suffix == 'w':
         return True
-    elif suffix == 'b':
+    elif suffix in NON_W_SUFFIXES:
         return False
     else:
         raise ValueError('Unexpected variable name')
 
 
+def layer_seed(seed, name):
+    """
+    Returns a seed for the given layer name derived from a global kernel
+    seed, or None if no seed is given
+    """
+    if seed is None:
+        return None
+    return zlib.crc32(('%d_%s' % (seed, name)).encode()) % MAX_SEED
+
+
 def sample_w(kernel_fn, var, **params):
     _, input_dims = var.get_shape().as_list()
+    # Naming after the variable gives each layer its own seed
     kernel = kernel_fn(
-        '', input_dims=input_dims, **params
+        var.op.name, input_dims=input_dims, **params
     )
     return kernel.draw_w()
 
@@ -116,12 +618,12 @@ def sample_w(kernel_fn, var, **params):
 def sample_b(kernel_fn, var, **params):
     input_dims = 128  # This is arbitrary
     kernel = kernel_fn(
-        '', input_dims=input_dims, **params
+        var.op.name, input_dims=input_dims, **params
     )
     return kernel.draw_b()
 
 
-def _generate_w_mask(x, keep_ratio=0.50):
+def _generate_w_mask(x, keep_ratio=0.50, seed=None):
     """
     Returns two masks:
         - A binary mask indicating the values to keep from the input matrix
@@ -131,7 +633,7 @@ def _generate_w_mask(x, keep_ratio=0.50):
     height, width = x_shape
 
     # Draw numbers in [0,1] and check if x < keep_ratio
-    rands = tf.random_uniform(shape=[height], dtype=tf.float32)
+    rands = tf.random_uniform(shape=[height], dtype=tf.float32, seed=seed)
     to_keep = tf.less(rands, tf.ones(tf.shape(rands)) * keep_ratio)
     to_keep = tf.cast(to_keep, tf.int32)
 
@@ -142,7 +644,7 @@ def _generate_w_mask(x, keep_ratio=0.50):
     return mask, tf.subtract(1.0, mask)
 
 
-def _generate_b_mask(x, keep_ratio=0.50):
+def _generate_b_mask(x, keep_ratio=0.50, seed=None):
     """
     Returns two masks:
         - A binary mask indicating the values to keep from the input vector
@@ -151,30 +653,30 @@ def _generate_b_mask(x, keep_ratio=0.50):
     length = x.get_shape().as_list()[0]
 
     # Draw numbers in [0,1] and check if x < keep_ratio
-    rands = tf.random_uniform(shape=[length], dtype=tf.float32)
+    rands = tf.random_uniform(shape=[length], dtype=tf.float32, seed=seed)
     to_keep = tf.less(rands, tf.ones(tf.shape(rands)) * keep_ratio)
     mask = tf.cast(to_keep, tf.float32)
 
     return mask, tf.subtract(1.0, mask)
 
 
-def kernel_dropout_w(var, new_sample, keep_ratio):
+def kernel_dropout_w(var, new_sample, keep_ratio, seed=None):
     """
     Returns the matrix resulting from replacing some rows from the
     new sample according to the given probability ratio
     """
-    mask, mask_inv = _generate_w_mask(var, keep_ratio)
+    mask, mask_inv = _generate_w_mask(var, keep_ratio, seed)
     kept = tf.multiply(mask, var)
     sampled = tf.multiply(mask_inv, new_sample)
     return tf.add(kept, sampled)
 
 
-def kernel_dropout_b(var, new_sample, keep_ratio):
+def kernel_dropout_b(var, new_sample, keep_ratio, seed=None):
     """
     Returns the vector resulting from replacing some elements
     from the new sample according to the given probability ratio
     """
-    mask, mask_inv = _generate_b_mask(var, keep_ratio)
+    mask, mask_inv = _generate_b_mask(var, keep_ratio, seed)
     kept = tf.multiply(mask, var)
     sampled = tf.multiply(mask_inv, new_sample)
     return tf.add(kept, sampled)
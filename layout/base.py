@@ -1,13 +1,16 @@
 import tensorflow as tf
 import logging
 
-from kernels import GaussianRFF
+from kernels import GaussianRFF, NystromFeatures
+
+from protodata.data_ops import DataMode
 
 logger = logging.getLogger(__name__)
 
 INPUT_LAYER = 'input'
 OUTPUT_LAYER = 'output'
 BATCH_NORM_COLLECTION = 'BATCH_NORM'
+LAYER_OUTPUT_COLLECTION = 'LAYER_OUTPUTS'
 LAYER_NAME = '{layer_id}_{layer_type}'
 
 
@@ -15,6 +18,14 @@ def get_layer_id(name):
     return float(name.split('_')[0])
 
 
+def layer_outputs_key(tag):
+    """
+    Returns the collection storing, in order, the output of each hidden
+    layer of the network built for the given tag
+    """
+    return '_'.join([LAYER_OUTPUT_COLLECTION, tag])
+
+
 def _fully_connected(x,
                      outputs,
                      idx,
@@ -87,6 +98,7 @@ def kernel_block(x, idx, tag, is_training, batch_norm=False, **params):
     hidden_units = params.get('hidden_units')
     kernel_size = params.get('kernel_size')
     kernel_std = params.get('kernel_std')
+    kernel_fn = params.get('kernel_fn', GaussianRFF)
 
     hidden = _fully_connected(
         x=x,
@@ -108,11 +120,13 @@ def kernel_block(x, idx, tag, is_training, batch_norm=False, **params):
             scope=LAYER_NAME.format(layer_id=idx, layer_type='bn')
         )
 
-    kernel = GaussianRFF(
+    kernel = kernel_fn(
         name=LAYER_NAME.format(layer_id=idx, layer_type='kernel'),
         input_dims=hidden_units,
         kernel_std=kernel_std,
         kernel_size=kernel_size,
+        kernel_seed=params.get('kernel_seed', None),
+        qmc_seed=params.get('qmc_seed', None)
     )
 
     mapped = kernel.apply_kernel(hidden, tag)
@@ -129,3 +143,64 @@ def kernel_block(x, idx, tag, is_training, batch_norm=False, **params):
         )
 
     return mapped
+
+
+def nystrom_block(x, idx, tag, is_training, batch_norm=False, **params):
+
+    hidden_units = params.get('hidden_units')
+    kernel_size = params.get('kernel_size')
+    kernel_std = params.get('kernel_std')
+
+    hidden = _fully_connected(
+        x=x,
+        outputs=hidden_units,
+        idx=idx,
+        tag=tag,
+        activation_fn=None
+    )
+
+    if batch_norm:
+        # Update ops for moving average are automatically
+        # placed in tf.GraphKeys.UPDATE_OPS
+        hidden = tf.contrib.layers.batch_norm(
+            hidden,
+            center=True,
+            scale=True,
+            is_training=is_training,
+            variables_collections=[BATCH_NORM_COLLECTION],
+            scope=LAYER_NAME.format(layer_id=idx, layer_type='bn')
+        )
+
+    # Here kernel_size is the number of landmarks, all from a single batch
+    batch_size = params.get('batch_size', None)
+    if batch_size is not None and batch_size < kernel_size:
+        raise ValueError(
+            'Batch size (%d) must be at least the number of Nystrom '
+            'landmarks (%d)' % (batch_size, kernel_size)
+        )
+
+    kernel = NystromFeatures(
+        name=LAYER_NAME.format(layer_id=idx, layer_type='nystrom'),
+        input_dims=hidden_units,
+        kernel_std=kernel_std,
+        kernel_size=kernel_size,
+        landmark_selection=params.get('landmark_selection', 'uniform')
+    )
+
+    # Landmarks must only be drawn from training data
+    mapped = kernel.apply_kernel(
+        hidden, tag, init_landmarks=tag == DataMode.TRAINING
+    )
+
+    if params.get('fc_dropout_keep_prob', None) is not None:
+        logger.debug(
+            "Enabled dropout (keep rate(%f)) on nystrom_fc %s" %
+            (params.get('fc_dropout_keep_prob'), idx)
+        )
+        mapped = tf.contrib.layers.dropout(
+            mapped,
+            keep_prob=params.get('fc_dropout_keep_prob'),
+            is_training=is_training
+        )
+
+    return mapped
@@ -145,6 +145,7 @@ def cnn_kernel_block(x, idx, tag, is_training, **params):
     cnn_kernel_size = params.get('cnn_kernel_size')
     map_size = params.get('map_size')
     kernel_std = params.get('kernel_std')
+    kernel_fn = params.get('kernel_fn', GaussianRFF)
 
     hidden = tf.contrib.layers.conv2d(
         x,
@@ -158,11 +159,13 @@ def cnn_kernel_block(x, idx, tag, is_training, **params):
         scope=LAYER_NAME.format(layer_type='cnn', layer_id=str(idx))
     )
 
-    kernel = GaussianRFF(
+    kernel = kernel_fn(
         name=LAYER_NAME.format(layer_id=idx, layer_type='cnn_kernel'),
         input_dims=map_size,
         kernel_std=kernel_std,
         kernel_size=cnn_kernel_size,
+        kernel_seed=params.get('kernel_seed', None),
+        qmc_seed=params.get('qmc_seed', None)
     )
 
     if params.get('cnn_batch_norm', False):
@@ -2,7 +2,11 @@ import tensorflow as tf
 import logging
 
 from layout.base import _fully_connected, _map_classes_to_output, \
-                          fc_block, INPUT_LAYER, LAYER_NAME, kernel_block
+                          fc_block, INPUT_LAYER, LAYER_NAME, kernel_block, \
+                          layer_outputs_key
+from layout.replicated import check_replicated, replicate_input, \
+                              replicated_fully_connected, \
+                              replicated_fc_block, replicated_kernel_block
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +21,22 @@ def example_layout_fn(x, dataset, tag, is_training, num_layers=1, **params):
     inputs = _input_layer(x, dataset, name=INPUT_LAYER)
     tf.summary.histogram("input", inputs, [tag])
 
+    # Independent copies of the network trained in the same graph
+    replicas = params.get('replicas', None)
+    if replicas is not None:
+        check_replicated(**params)
+        inputs = replicate_input(inputs, replicas)
+
+    block_fn = replicated_fc_block if replicas is not None else fc_block
+    output_fn = replicated_fully_connected if replicas is not None \
+        else _fully_connected
+
     x = inputs
     for i in range(1, num_layers+1):
-        x = fc_block(x, str(i), tag, is_training, **params)
+        x = block_fn(x, str(i), tag, is_training, **params)
+        tf.add_to_collection(layer_outputs_key(tag), x)
 
-    return _fully_connected(
+    return output_fn(
         x,
         _map_classes_to_output(dataset.get_num_classes()),
         'output',
@@ -45,14 +60,27 @@ def kernel_example_layout_fn(x,
     inputs = _input_layer(x, dataset, name=INPUT_LAYER)
     tf.summary.histogram("input", inputs, [tag])
 
+    # Kernel blocks can be swapped (e.g. by nystrom_block)
+    block_fn = params.get('block_fn', kernel_block)
+    output_fn = _fully_connected
+
+    # Independent copies of the network trained in the same graph
+    replicas = params.get('replicas', None)
+    if replicas is not None:
+        check_replicated(**params)
+        inputs = replicate_input(inputs, replicas)
+        block_fn, output_fn = replicated_kernel_block, \
+            replicated_fully_connected
+
     x = inputs
     for i in range(1, num_layers+1):
         layer_name = LAYER_NAME.format(
             net_id='kernel', layer_id=str(i), layer_type='nk'
         )
-        x = kernel_block(x, layer_name, tag, is_training, **params)
+        x = block_fn(x, layer_name, tag, is_training, **params)
+        tf.add_to_collection(layer_outputs_key(tag), x)
 
-    return _fully_connected(
+    return output_fn(
         x,
         _map_classes_to_output(dataset.get_num_classes()),
         'output',
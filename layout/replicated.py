@@ -0,0 +1,152 @@
+import tensorflow as tf
+import numpy as np
+import logging
+
+from layout.base import LAYER_NAME
+from kernels import GaussianRFF, KERNEL_COLLECTION, KERNEL_ASSIGN_OPS
+
+logger = logging.getLogger(__name__)
+
+
+UNSUPPORTED_PARAMS = [
+    'batch_norm', 'fc_dropout_keep_prob', 'kernel_dropout_rate',
+    'kernel_seed', 'output_warm_start', 'cache_prefix', 'block_fn'
+]
+
+
+def check_replicated(**params):
+    """
+    Raises an error if the parameters use features not available for
+    replicated networks
+    """
+    for param in UNSUPPORTED_PARAMS:
+        if params.get(param, None):
+            raise ValueError(
+                'Parameter %s is not supported by replicated networks' % param
+            )
+
+    kernel_fn = params.get('kernel_fn', GaussianRFF)
+    if kernel_fn is not GaussianRFF:
+        raise ValueError(
+            'Replicated networks only support Gaussian random features'
+        )
+
+
+def member_values(values, ndims):
+    """
+    Returns a constant with the value of each replica along the leading
+    axis and ndims dimensions in total, so it broadcasts against tensors of
+    a replicated network. A single value is shared by all replicas
+    """
+    values = np.asarray(values, dtype=np.float32)
+    return tf.constant(np.reshape(values, [-1] + [1] * (ndims - 1)))
+
+
+def replicate_input(x, replicas):
+    """
+    Stacks copies of the input along a new leading replica axis
+    """
+    return tf.tile(tf.expand_dims(x, 0), [replicas, 1, 1])
+
+
+def replicated_fully_connected(x,
+                               outputs,
+                               idx,
+                               tag,
+                               activation_fn=tf.nn.relu):
+    """
+    Fully connected layer applied independently to each replica. Input has
+    shape [replicas, batch, dims] and each replica has its own weights,
+    stacked along the leading axis of the variables
+    """
+    replicas, input_dims = x.get_shape().as_list()[0], \
+        x.get_shape().as_list()[-1]
+    name = LAYER_NAME.format(layer_id=idx, layer_type='fc')
+
+    with tf.variable_scope(name):
+        # Same scale as the variance scaling used by single networks
+        weights = tf.get_variable(
+            'weights',
+            [replicas, input_dims, outputs],
+            initializer=tf.truncated_normal_initializer(
+                stddev=np.sqrt(1.0 / input_dims)
+            ),
+            collections=[tf.GraphKeys.GLOBAL_VARIABLES, tf.GraphKeys.WEIGHTS]
+        )
+        biases = tf.get_variable(
+            'biases',
+            [replicas, 1, outputs],
+            initializer=tf.zeros_initializer(),
+            collections=[tf.GraphKeys.GLOBAL_VARIABLES, tf.GraphKeys.WEIGHTS]
+        )
+
+    fc_layer = tf.matmul(x, weights) + biases
+    if activation_fn is not None:
+        fc_layer = activation_fn(fc_layer)
+
+    tf.summary.histogram(name, fc_layer, [tag])
+    return fc_layer
+
+
+def replicated_fc_block(x, idx, tag, is_training, **params):
+    hidden = replicated_fully_connected(
+        x=x,
+        outputs=params.get('hidden_units'),
+        idx=idx,
+        tag=tag,
+        activation_fn=None
+    )
+    return params.get('activation_fn', tf.nn.relu)(hidden)
+
+
+def replicated_kernel_block(x, idx, tag, is_training, **params):
+    kernel_size = params.get('kernel_size')
+    kernel_std = params.get('kernel_std')
+
+    hidden = replicated_fully_connected(
+        x=x,
+        outputs=params.get('hidden_units'),
+        idx=idx,
+        tag=tag,
+        activation_fn=None
+    )
+
+    replicas, input_dims = hidden.get_shape().as_list()[0], \
+        hidden.get_shape().as_list()[-1]
+    name = LAYER_NAME.format(layer_id=idx, layer_type='kernel')
+
+    # Each replica draws its own Gaussian random features
+    w = tf.get_variable(
+        '_'.join([name, 'w']),
+        [replicas, kernel_size, input_dims],
+        trainable=False,
+        collections=[KERNEL_COLLECTION, tf.GraphKeys.GLOBAL_VARIABLES]
+    )
+    b = tf.get_variable(
+        '_'.join([name, 'b']),
+        [replicas, 1, kernel_size],
+        trainable=False,
+        collections=[KERNEL_COLLECTION, tf.GraphKeys.GLOBAL_VARIABLES]
+    )
+
+    # Kernel widths may differ among replicas
+    tf.add_to_collection(
+        KERNEL_ASSIGN_OPS,
+        w.assign(
+            tf.random_normal(shape=w.get_shape())
+            * member_values(kernel_std, 3)
+        )
+    )
+    tf.add_to_collection(
+        KERNEL_ASSIGN_OPS,
+        b.assign(
+            tf.random_uniform(
+                shape=b.get_shape(), minval=0, maxval=2*np.pi
+            )
+        )
+    )
+
+    dot = tf.matmul(hidden, w, transpose_b=True) + b
+    z = tf.cos(dot) * np.sqrt(2/kernel_size)
+    tf.summary.histogram(name + '_z', z, [tag])
+    return z
@@ -3,13 +3,17 @@ import logging
 
 import tensorflow as tf
 
-from kernels import KERNEL_ASSIGN_OPS, GaussianRFF, \
-                    is_w, kernel_dropout_w, sample_w
+from kernels import KERNEL_ASSIGN_OPS, LANDMARK_ASSIGN_OPS, GaussianRFF, \
+                    is_w, kernel_dropout_w, sample_w, layer_seed
+from layout.replicated import member_values
 from variables import get_model_weights, get_trainable_params, \
-                    summarize_gradients, get_kernel_vars, get_variable_name
+                    summarize_gradients, get_kernel_vars, get_variable_name, \
+                    KERNEL_GENERATION_COLLECTION
 
 logger = logging.getLogger(__name__)
 
+KERNEL_REPLAY_OPS = 'KERNEL_REPLAY_OPS'
+
 
 def save_model(monitored_sess, saver, folder, step):
     path = os.path.join(folder, 'model_' + str(step) + '.ckpt')
@@ -22,6 +26,37 @@ def init_kernel_ops(sess):
     sess.run(tf.get_collection(KERNEL_ASSIGN_OPS))
 
 
+def init_landmark_ops(sess, restored_vars=None):
+    """
+    Draws the data-dependent kernel maps (e.g. Nystrom landmarks) from
+    a batch. Must run after restoring so landmarks are taken from the
+    outputs of the trained lower layers, and skips restored variables
+    """
+    restored = [v.op for v in restored_vars] \
+        if restored_vars is not None else []
+    ops = [
+        op for op in tf.get_collection(LANDMARK_ASSIGN_OPS)
+        if op.op.inputs[0].op not in restored
+    ]
+    if len(ops) > 0:
+        sess.run(ops)
+
+
+def get_session_config(**params):
+    """
+    Returns the session configuration limiting the threads of the
+    intra and inter op pools, if any of them is set
+    """
+    intra_threads = params.get('intra_op_threads', None)
+    inter_threads = params.get('inter_op_threads', None)
+    if intra_threads is None and inter_threads is None:
+        return None
+    return tf.ConfigProto(
+        intra_op_parallelism_threads=intra_threads or 0,
+        inter_op_parallelism_threads=inter_threads or 0
+    )
+
+
 def get_global_step():
     """ Creates a global step in the VARIABLEs and GLOBAL_STEP collections """
     collections = [tf.GraphKeys.GLOBAL_VARIABLES, tf.GraphKeys.GLOBAL_STEP]
@@ -33,18 +68,23 @@ def get_global_step():
 
 
 def get_accuracy_op(logits, labels, n_classes):
+    """
+    Returns the accuracy of the batch or, for replicated networks, the
+    accuracy of each replica
+    """
     if n_classes == 2:
         # Labels should be either 0 or 1
         predicted = tf.squeeze(
             _binary_activation(tf.nn.sigmoid(logits)),
-            1
+            -1
         )
     else:
-        predicted = tf.argmax(tf.nn.softmax(logits), 1)
+        predicted = tf.argmax(tf.nn.softmax(logits), -1)
 
+    # Labels are broadcast along the replica axis, if any
     casted_labels = tf.squeeze(tf.cast(labels, tf.int64), 1)
     correct_pred = tf.equal(predicted, casted_labels)
-    return tf.reduce_mean(tf.cast(correct_pred, tf.float32))
+    return tf.reduce_mean(tf.cast(correct_pred, tf.float32), axis=-1)
 
 
 def _binary_activation(x):
@@ -55,108 +95,108 @@ def _binary_activation(x):
 
 
 def get_loss_fn(logits, labels, n_classes):
+    replicas = _replicas(logits)
     if n_classes == 2:
+        # Readers produce integer labels, which accuracy ops need, and the
+        # sigmoid loss needs floats. This is the only cast per step, on a
+        # [batch, 1] tensor shared by all positions
+        float_labels = tf.cast(labels, tf.float32)
+        if replicas is not None:
+            float_labels = tf.tile(tf.expand_dims(float_labels, 0),
+                                   [replicas, 1, 1])
         return tf.nn.sigmoid_cross_entropy_with_logits(
-            labels=tf.cast(labels, tf.float32), logits=logits
+            labels=float_labels, logits=logits
         )
     elif n_classes > 2:
-        return tf.nn.softmax_cross_entropy_with_logits(
-            labels=tf.one_hot(labels, depth=n_classes),
-            logits=logits
+        # Sparse labels avoid building a one-hot matrix every step
+        sparse_labels = tf.reshape(labels, [-1])
+        if replicas is not None:
+            sparse_labels = tf.tile(tf.expand_dims(sparse_labels, 0),
+                                    [replicas, 1])
+        return tf.nn.sparse_softmax_cross_entropy_with_logits(
+            labels=sparse_labels, logits=logits
         )
     else:
         raise ValueError('Number of outputs must be at least 2')
 
 
-def get_l2_op(weights, **params):
-    l2_ratio = params.get('l2_ratio', None)
-    return l2_norm(weights) * l2_ratio \
-        if l2_ratio is not None else tf.constant(0.0)
-
-
-def get_loss_op(logits, y, weights, sum_collection, n_classes, **params):
-    loss_term = tf.reduce_mean(
-        get_loss_fn(
-            logits, y, n_classes
-        )
-    )
-    loss_op = loss_term + get_l2_op(weights, **params)
-    return loss_op
+def _replicas(logits):
+    """
+    Returns the number of replicas if logits come from a replicated network
+    """
+    shape = logits.get_shape()
+    return shape.as_list()[0] if shape.ndims == 3 else None
 
 
-def loss_ops_list(logits, y, sum_collection, n_classes, num_layers, **params):
+def loss_ops_list(logits, y, sum_collection, n_classes, num_layers,
+                  l2_ops=None, **params):
     """
     Builds a tensor with loss ops where the ith position
     corresponds to the operation to train layer i. The zero position
-    is the function where we all layers
-    """
-    loss_ops = []
-
-    # First position is for all layers
-    all_weights = get_model_weights(list(range(1, num_layers + 1)))
-    loss_all = get_loss_op(
-        logits,
-        y,
-        all_weights,
-        sum_collection,
-        n_classes,
-        **params
-    )
-    loss_ops.append(loss_all)
-    logger.debug('L2 #{} uses {}'.format(0, all_weights))
-
-    for i in range(1, num_layers + 1):
-        layer_weights = get_model_weights([i])
-        layer_loss = get_loss_op(
-            logits,
-            y,
-            layer_weights,
-            sum_collection,
-            n_classes,
-            **params
+    is the function where we all layers. The data term is computed once
+    and shared by all positions, which only differ in their L2 term
+    """
+    if l2_ops is None:
+        l2_ops = get_l2_ops_list(num_layers=num_layers, **params)
+
+    losses = get_loss_fn(logits, y, n_classes)
+    if _replicas(logits) is not None:
+        # One loss per replica
+        loss_term = tf.reduce_mean(
+            losses, axis=list(range(1, losses.get_shape().ndims))
         )
-        logger.debug('L2 #{} uses {}'.format(i, layer_weights))
-        loss_ops.append(layer_loss)
-
-    return loss_ops
+    else:
+        loss_term = tf.reduce_mean(losses)
+    return [loss_term + l2_op for l2_op in l2_ops]
 
 
-def train_ops_list(lr, loss_ops, n_layers, tag):
+def train_ops_list(lr, loss_ops, n_layers, tag, optimizer=None):
     """
     Builds a tensor with training ops where the ith position
     corresponds to the operation to train layer i. The zero position
-    is the function where we optimize everything
-    """
-    train_ops = []
-
-    # First position is for all
-    train_ops.append(
-        get_train_op(lr, loss_ops[0], tf.trainable_variables(), tag)
-    )
-    logger.debug('Optimizer #{} uses {}'.format(0, tf.trainable_variables()))
+    is the function where we optimize everything.
 
-    for i in range(1, n_layers + 1):
-        opt_vars = get_trainable_params([i], True)
-        logger.debug('Optimizer #{} uses {}'.format(i, opt_vars))
-        train_ops.append(
-            get_train_op(lr, loss_ops[i], opt_vars, tag)
-        )
-
-    return train_ops
-
-
-def get_train_op(lr, loss_op, opt_var_list, tag):
-    optimizer = tf.train.AdamOptimizer(learning_rate=lr)
+    All positions share a single optimizer (and so its slots) and a single
+    gradient computation: the gradient of the loss for layer i with respect
+    to its own variables is the same as the one of the loss for all layers,
+    since the L2 terms of the other layers do not depend on them
+    """
+    if optimizer is None:
+        optimizer = tf.train.AdamOptimizer(learning_rate=lr)
+    all_vars = tf.trainable_variables()
 
     # This is just a safe option if we use update ops such
     # as moving averages (e.g. batch norm)
     update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
     with tf.control_dependencies(update_ops):
-        grads = optimizer.compute_gradients(loss_op, var_list=opt_var_list)
+        # Replicas are independent, so the gradient of the sum of their
+        # losses is the one of each replica for its own variables
+        grads = optimizer.compute_gradients(
+            tf.reduce_sum(loss_ops[0]), var_list=all_vars
+        )
         summarize_gradients(grads, tag)
-        train_op = optimizer.apply_gradients(grads)
 
-    return train_op
+        train_ops = [
+            apply_layer_gradients(optimizer, grads, i)
+            for i in range(0, n_layers + 1)
+        ]
+
+    return train_ops
+
+
+def apply_layer_gradients(optimizer, grads, layer_idx):
+    """
+    Applies the gradients of the variables trained in the given position,
+    where zero stands for all of them
+    """
+    if layer_idx == 0:
+        opt_vars = [v for _, v in grads]
+    else:
+        opt_vars = get_trainable_params([layer_idx], True)
+    logger.debug('Optimizer #{} uses {}'.format(layer_idx, opt_vars))
+    return optimizer.apply_gradients(
+        [(g, v) for g, v in grads if v in opt_vars]
+    )
 
 
 def l2_norm(weights):
@@ -164,67 +204,156 @@ def l2_norm(weights):
 
 
 def get_l2_ops_list(**params):
+    """
+    Returns the L2 terms where the ith position regularizes the weights
+    trained by layer i and the zero position those of all layers. Each
+    layer norm is computed once and shared by the positions using it
+    """
     num_layers = params.get('num_layers')
+    l2_ratio = params.get('l2_ratio', None)
+    replicated = params.get('replicas', None) is not None
 
-    l2_list = []
-    all_weights = get_model_weights(range(1, num_layers+1))
-    logger.debug('L2 stats vars #0: {}'.format(all_weights))
-    l2_list.append(get_l2_op(all_weights, **params))
+    if l2_ratio is None:
+        return [tf.constant(0.0)] * (num_layers + 1)
 
+    layer_norms = []
     for i in range(1, num_layers+1):
-        current_weights = get_model_weights([i])
-        logger.debug('L2 stats vars #{}: {}'.format(i, current_weights))
-        l2_list.append(get_l2_op(current_weights, **params))
+        layer_weights = get_model_weights([i], include_output=False)
+        logger.debug('L2 stats vars #{}: {}'.format(i, layer_weights))
+        layer_norms.append(_optional_l2_norm(layer_weights, replicated))
+
+    # Output weights are trained along with any layer
+    output_norm = _optional_l2_norm(get_model_weights([]), replicated)
 
+    if replicated:
+        # Replicas may be regularized differently
+        l2_ratio = member_values(l2_ratio, 1)
+
+    l2_list = [l2_ratio * (tf.add_n(layer_norms) + output_norm)]
+    for layer_norm in layer_norms:
+        l2_list.append(l2_ratio * (layer_norm + output_norm))
     return l2_list
 
 
-def get_kernel_assign_ops(layers, kernel_dropout_rate, **params):
+def _optional_l2_norm(weights, replicated=False):
+    if len(weights) == 0:
+        return tf.constant(0.0)
+    elif replicated:
+        # Norm of each replica, stacked along the leading axis
+        return tf.add_n([
+            tf.reduce_sum(
+                tf.square(w), axis=list(range(1, w.get_shape().ndims))
+            ) / 2.0
+            for w in weights
+        ])
+    else:
+        return l2_norm(weights)
+
+
+def get_kernel_assign_ops(layers, kernel_dropout_rate, cache=None, **params):
+    """
+    Returns the kernel dropout ops for the given layers. Ops already
+    built for a variable are taken from the cache, so that all lists
+    share the same random ops
+    """
 
     if kernel_dropout_rate < 0.0 or kernel_dropout_rate > 1.0:
         raise ValueError('Persist ratio must be in interval [0,1]')
 
+    cache = cache if cache is not None else {}
+
     ops = []
+    kernel_fn = params.get('kernel_fn', GaussianRFF)
+    kernel_seed = params.get('kernel_seed', None)
     kernel_vars = get_kernel_vars(layers, include_fc=True)
     for var in kernel_vars:
 
         if not is_w(var.name):
             continue
 
+        if var.name in cache:
+            ops.append(cache[var.name])
+            continue
+
         # CNN layers and FC layers have different kernel feature number
         sample_size = params['cnn_kernel_size'] if 'cnn' in var.name \
             else params['kernel_size']
         sample_params = {
             "kernel_size": sample_size,
             "kernel_std": params['kernel_std'],
+            "kernel_seed": kernel_seed,
+            "qmc_seed": params.get('qmc_seed', None)
         }
 
-        w_sample = sample_w(GaussianRFF, var, **sample_params)
+        # Resample with the same sampler used to build the layers
+        w_sample = sample_w(kernel_fn, var, **sample_params)
 
         # Construct a new matrix with some rows updated (new RFF features)
-        new_w = kernel_dropout_w(var, w_sample, kernel_dropout_rate)
+        new_w = kernel_dropout_w(
+            var,
+            w_sample,
+            kernel_dropout_rate,
+            seed=layer_seed(kernel_seed, var.op.name + '_mask')
+        )
 
         # Append assign operation for current layer kernel matrix
         var_name = var.name.split('/')[1]
         var_id = str(get_variable_name(var_name))
         assign_b_op = tf.assign(var, new_w, name='assign_%s' % var_id)
+
+        if kernel_seed is not None:
+            assign_b_op = _count_generation(var_id, assign_b_op)
+
+        cache[var.name] = assign_b_op
         ops.append(assign_b_op)
 
     return ops
 
 
+def _count_generation(var_id, assign_op):
+    """
+    Seeded kernels only store how many times kernel dropout was applied,
+    which is enough to replay it deterministically (see replay_kernel_ops)
+    """
+    generation = tf.get_variable(
+        var_id[:-len('_w')] + '_generation',
+        shape=[],
+        dtype=tf.int32,
+        initializer=tf.constant_initializer(0),
+        trainable=False,
+        collections=[
+            tf.GraphKeys.GLOBAL_VARIABLES, KERNEL_GENERATION_COLLECTION
+        ]
+    )
+    tf.add_to_collection(KERNEL_REPLAY_OPS, (generation, assign_op))
+
+    with tf.control_dependencies([assign_op]):
+        return tf.assign_add(generation, 1)
+
+
+def replay_kernel_ops(sess):
+    """
+    Rebuilds the seeded kernel matrices modified by kernel dropout by
+    replaying it as many times as it was applied. Must run after
+    init_kernel_ops and after restoring the generation counters
+    """
+    for generation, assign_op in tf.get_collection(KERNEL_REPLAY_OPS):
+        for _ in range(sess.run(generation)):
+            sess.run(assign_op)
+
+
 def get_kernel_assign_ops_list(num_layers, **params):
-    ops = []
+    ops, cache = [], {}
 
     # For entry 0, we get all assign ops
     ops.append(
-        get_kernel_assign_ops(range(1, num_layers+1), **params)
+        get_kernel_assign_ops(range(1, num_layers+1), cache=cache, **params)
     )
     logger.debug('Kernel ops for #0: {}'.format(ops[0]))
 
     # Then we get assign ops for each separate layer
     for l in range(1, num_layers+1):
-        layer_kernel_ops = get_kernel_assign_ops([l], **params)
+        layer_kernel_ops = get_kernel_assign_ops([l], cache=cache, **params)
         logger.debug('Kernel ops for #{}: {}'.format(l, layer_kernel_ops))
         ops.append(layer_kernel_ops)
 
@@ -0,0 +1,162 @@
+import unittest
+import threading
+from unittest import mock
+import numpy as np
+import tensorflow as tf
+
+from training.data_pipeline import DatasetReader, clear_fold_cache, \
+                                   _shared_fold
+
+N_FOLDS = 3
+FOLD_SIZE = 5
+BATCH_SIZE = 4
+
+
+class _QueueReader(object):
+    """
+    Queue-based reader with the interface of protodata's DataReader,
+    storing the fold id as label. Settings are only handed to it, as
+    DatasetReader must not rely on them
+    """
+
+    reads = 0
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def read_folded_batch(self,
+                          batch_size,
+                          data_mode,
+                          folds,
+                          memory_factor,
+                          reader_threads,
+                          train_mode=True,
+                          shuffle=True):
+        _QueueReader.reads += 1
+        values = np.tile(np.arange(FOLD_SIZE, dtype=np.float32), len(folds))
+        labels = np.repeat(folds, FOLD_SIZE).astype(np.int64)
+
+        value, label = tf.train.slice_input_producer(
+            [values[:, None], labels[:, None]],
+            num_epochs=None if train_mode else 1,
+            shuffle=shuffle
+        )
+        batch = tf.train.batch(
+            {'value': value, 'label': label},
+            batch_size=batch_size,
+            num_threads=reader_threads,
+            allow_smaller_final_batch=not train_mode
+        )
+        return {'value': batch['value']}, batch['label']
+
+
+class DataPipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        _QueueReader.reads = 0
+        patcher = mock.patch('training.data_pipeline.DataReader', _QueueReader)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_single_pass(self):
+        reader = DatasetReader(object())
+        features, labels = reader.read_folded_batch(
+            BATCH_SIZE, 'training', [0, 2], train_mode=False, shuffle=True
+        )
+
+        read = []
+        with tf.Session() as sess:
+            while True:
+                try:
+                    batch_features, batch_labels = sess.run(
+                        [features, labels]
+                    )
+                except tf.errors.OutOfRangeError:
+                    break
+                self.assertTrue(batch_features['value'].shape[1] == 1)
+                read.extend(batch_labels[:, 0])
+
+        self.assertEqual(sorted(read), [0] * FOLD_SIZE + [2] * FOLD_SIZE)
+
+    def test_repeat(self):
+        reader = DatasetReader(object())
+        _, labels = reader.read_folded_batch(
+            BATCH_SIZE, 'training', [1], train_mode=True, shuffle=False
+        )
+
+        with tf.Session() as sess:
+            batches = [sess.run(labels) for _ in range(FOLD_SIZE)]
+
+        # Full batches keep coming after the fold is exhausted
+        self.assertTrue(all(b.shape == (BATCH_SIZE, 1) for b in batches))
+        self.assertTrue(np.all(np.concatenate(batches) == 1))
+
+    def test_shared_folds(self):
+        clear_fold_cache()
+        key = ('location', None)
+
+        for folds in [[0, 1], [1, 2], [0, 2]]:
+            with tf.Graph().as_default() as graph:
+                reader = DatasetReader(object(), shared_key=key)
+                _, labels = reader.read_folded_batch(
+                    BATCH_SIZE, 'training', folds, train_mode=False
+                )
+
+                # Cached folds are not copied into the graph
+                consts = [
+                    op.get_attr('value').tensor_shape.dim
+                    for op in graph.get_operations() if op.type == 'Const'
+                ]
+                self.assertFalse(any(
+                    len(dims) > 0 and dims[0].size >= FOLD_SIZE
+                    for dims in consts
+                ))
+
+                read = []
+                with tf.Session() as sess:
+                    while True:
+                        try:
+                            read.extend(sess.run(labels)[:, 0])
+                        except tf.errors.OutOfRangeError:
+                            break
+
+            self.assertEqual(
+                sorted(read), sorted(np.repeat(folds, FOLD_SIZE))
+            )
+
+        # Each fold is decoded only once
+        self.assertEqual(_QueueReader.reads, N_FOLDS)
+        clear_fold_cache()
+
+    def test_concurrent_folds(self):
+        clear_fold_cache()
+        barrier = threading.Barrier(2, timeout=5)
+        decoded = []
+
+        def decode(fold):
+            # Fails unless both folds are decoded at the same time
+            barrier.wait()
+            decoded.append(fold)
+            return fold
+
+        threads = [
+            threading.Thread(
+                target=_shared_fold, args=(('key', f), lambda f=f: decode(f))
+            )
+            for f in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(decoded), [0, 1])
+
+        # Cached folds are not decoded again
+        self.assertEqual(_shared_fold(('key', 0), lambda: decode(0)), 0)
+        self.assertEqual(len(decoded), 2)
+        clear_fold_cache()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import tensorflow as tf
+import numpy as np
+
+from kernels import FastfoodRFF, KERNEL_ASSIGN_OPS, hadamard_transform
+
+import unittest
+
+
+def _hadamard(n):
+    h = np.array([[1.0]])
+    while h.shape[0] < n:
+        h = np.block([[h, h], [h, -h]])
+    return h
+
+
+class FastfoodTestCase(unittest.TestCase):
+
+    def test_hadamard(self):
+        x = np.random.random((4, 3, 8))
+        inputs = tf.placeholder(shape=[None, 3, 8], dtype=tf.float32)
+
+        with tf.Session() as sess:
+            out = sess.run(hadamard_transform(inputs), feed_dict={inputs: x})
+
+        self.assertTrue(
+            np.all(np.isclose(out, np.dot(x, _hadamard(8)), atol=1e-4))
+        )
+
+    def test_fastfood(self):
+        n, inp_dim, kernel_size = 5, 3, 6
+        kernel_std = 0.1
+
+        x = np.random.random((n, inp_dim))
+        inputs = tf.placeholder(shape=[None, inp_dim], dtype=tf.float32)
+
+        kernel = FastfoodRFF(
+            name='layer_kernel',
+            input_dims=inp_dim,
+            kernel_std=kernel_std,
+            kernel_size=kernel_size,
+        )
+
+        kernel_op = kernel.apply_kernel(inputs, 'training')
+
+        with tf.Session() as sess:
+
+            sess.run(tf.get_collection(KERNEL_ASSIGN_OPS))
+
+            out, binary, gauss, perm, scale, b = sess.run(
+                [
+                    kernel_op, kernel._binary, kernel._gauss,
+                    kernel._perm, kernel._scale, kernel._b
+                ],
+                feed_dict={inputs: x}
+            )
+
+        # Build the equivalent dense projection block by block
+        blocks, d = gauss.shape
+        h = _hadamard(d)
+        rows = []
+        for i in range(blocks):
+            local_perm = perm[i*d:(i+1)*d] - i*d
+            p = np.eye(d)[local_perm]
+            v = np.diag(scale[i]) @ h @ np.diag(gauss[i]) @ p @ h \
+                @ np.diag(binary[i])
+            rows.append(v * kernel_std / np.sqrt(d))
+        w = np.concatenate(rows)[:kernel_size, :inp_dim]
+
+        gt = np.cos(np.dot(x, w.T) + b) * np.sqrt(2/kernel_size)
+
+        self.assertTrue(out.shape == (n, kernel_size))
+        self.assertTrue(np.all(np.isclose(gt, out, atol=1e-4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import tensorflow as tf
+import numpy as np
+
+from training.fused import build_fused_loop, run_fused_steps
+
+import unittest
+
+BATCH_SIZE = 4
+N_BATCHES = 7
+
+
+class FusedTestCase(unittest.TestCase):
+
+    def test_fused_steps(self):
+        values = np.random.random((BATCH_SIZE * N_BATCHES, 2))
+        labels = np.arange(BATCH_SIZE * N_BATCHES)
+
+        queue = tf.FIFOQueue(
+            capacity=len(labels),
+            dtypes=[tf.float32, tf.int64],
+            shapes=[[2], []],
+        )
+        enqueue_op = queue.enqueue_many([values, labels])
+        batch_values, batch_labels = queue.dequeue_many(BATCH_SIZE)
+
+        total = tf.Variable(0, dtype=tf.int64)
+        layers = tf.Variable(0, dtype=tf.int32)
+
+        def step_fn(features, labels, layer_op):
+            self.assertTrue(features.get_shape().as_list() == [BATCH_SIZE, 2])
+            return [
+                tf.assign_add(total, tf.reduce_sum(labels)),
+                tf.assign_add(layers, layer_op)
+            ]
+
+        fused_loop = build_fused_loop(
+            batch_values, batch_labels, step_fn, steps_per_call=2
+        )
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(enqueue_op)
+
+            # Odd number of steps to exercise the last shorter call
+            run_fused_steps(sess, fused_loop, 3, N_BATCHES - 2)
+            total_value, layers_value, remaining = sess.run(
+                [total, layers, queue.size()]
+            )
+
+        self.assertEqual(
+            total_value, np.sum(labels[:BATCH_SIZE * (N_BATCHES - 2)])
+        )
+        self.assertEqual(layers_value, 3 * (N_BATCHES - 2))
+        self.assertEqual(remaining, 2 * BATCH_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
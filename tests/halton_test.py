@@ -0,0 +1,30 @@
+import unittest
+import numpy as np
+
+from kernels import halton_sequence
+
+VAN_DER_CORPUT = [0.5, 0.25, 0.75, 0.125, 0.625, 0.375, 0.875, 0.0625]
+
+
+class HaltonTestCase(unittest.TestCase):
+
+    def test_range(self):
+        points = halton_sequence(100, 10, seed=3)
+        self.assertTrue(points.shape == (100, 10))
+        self.assertTrue(np.all(points > 0.0) and np.all(points < 1.0))
+
+    def test_base_two(self):
+        # Base 2 only has the identity digit permutation
+        points = halton_sequence(len(VAN_DER_CORPUT), 3, seed=3)
+        self.assertTrue(np.all(np.isclose(points[:, 0], VAN_DER_CORPUT)))
+
+    def test_stratified(self):
+        # Every coordinate hits each interval [k/n, (k+1)/n) once
+        n = 16
+        points = halton_sequence(n - 1, 1, seed=3)
+        bins = np.floor(points[:, 0] * n).astype(int)
+        self.assertTrue(len(set(bins)) == n - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
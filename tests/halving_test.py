@@ -0,0 +1,50 @@
+from validation.halving import AsyncHalving
+
+import unittest
+
+
+class HalvingTestCase(unittest.TestCase):
+
+    def test_rungs(self):
+        scheduler = AsyncHalving(eta=2, min_epochs=10)
+        self.assertEqual(
+            [scheduler.rung_epoch(r) for r in range(3)], [10, 20, 40]
+        )
+
+    def test_first_run_promoted(self):
+        run = AsyncHalving(eta=3, min_epochs=10).new_run()
+        self.assertFalse(run.strip_update(5, 0.9))
+        self.assertFalse(run.strip_update(10, 0.9))
+        self.assertFalse(run.stopped)
+
+    def test_worse_runs_stopped(self):
+        scheduler = AsyncHalving(eta=2, min_epochs=10)
+
+        good = scheduler.new_run()
+        self.assertFalse(good.strip_update(10, 0.2))
+
+        bad = scheduler.new_run()
+        self.assertTrue(bad.strip_update(10, 0.8))
+        self.assertTrue(bad.stopped)
+
+        # Stopped runs stay stopped
+        self.assertTrue(bad.strip_update(15, 0.1))
+
+        better = scheduler.new_run()
+        self.assertFalse(better.strip_update(10, 0.1))
+
+    def test_last_rung(self):
+        scheduler = AsyncHalving(eta=2, min_epochs=10, max_rungs=1)
+
+        first = scheduler.new_run()
+        self.assertFalse(first.strip_update(10, 0.1))
+
+        second = scheduler.new_run()
+        self.assertFalse(second.strip_update(10, 0.05))
+
+        # No rungs after the last one
+        self.assertFalse(first.strip_update(100, 0.9))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import tensorflow as tf
+import numpy as np
+
+from training.handoff import capture_weights
+
+import unittest
+
+
+class HandoffTestCase(unittest.TestCase):
+
+    def _variables(self):
+        with tf.variable_scope('network'):
+            weights = tf.get_variable(
+                'weights', shape=[3, 2],
+                initializer=tf.random_normal_initializer()
+            )
+            biases = tf.get_variable(
+                'biases', shape=[2], initializer=tf.zeros_initializer()
+            )
+        return weights, biases
+
+    def test_handoff(self):
+        with tf.Graph().as_default():
+            weights, biases = self._variables()
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                sess.run(tf.assign_add(biases, [1.0, 2.0]))
+                stage = capture_weights(sess)
+                expected = sess.run([weights, biases])
+
+        with tf.Graph().as_default():
+            weights, biases = self._variables()
+            other = tf.get_variable('other', shape=[1])
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                stage.load(sess, [weights, biases])
+                loaded = sess.run([weights, biases])
+
+                # Variables without a stored value cannot be handed over
+                with self.assertRaises(ValueError):
+                    stage.load(sess, [other])
+
+        for x, y in zip(expected, loaded):
+            self.assertTrue(np.allclose(x, y))
+
+
+if __name__ == '__main__':
+    unittest.main()
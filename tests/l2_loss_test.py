@@ -2,7 +2,9 @@ import unittest
 import tensorflow as tf
 import numpy as np
 
-from ops import l2_norm
+from ops import l2_norm, get_l2_ops_list
+from layout.base import kernel_block, _fully_connected
+from variables import get_model_weights
 
 N_ROWS = 10
 N_COLS = 5
@@ -35,6 +37,34 @@ class AccuracyTestCase(unittest.TestCase):
 
         self.assertAlmostEqual(ours, theirs)
 
+    def test_shared_l2_list(self):
+        n_layers, l2_ratio = 2, 0.1
+        x = tf.placeholder(shape=[None, N_COLS], dtype=tf.float32)
+
+        with tf.variable_scope('network'):
+            hidden = x
+            for i in range(1, n_layers + 1):
+                hidden = kernel_block(
+                    hidden, '%d_nk' % i, 'l2_test', False,
+                    hidden_units=4, kernel_size=6, kernel_std=0.5
+                )
+            _fully_connected(
+                hidden, 3, 'output', 'l2_test', activation_fn=None
+            )
+
+        l2_ops = get_l2_ops_list(num_layers=n_layers, l2_ratio=l2_ratio)
+        expected_ops = [l2_norm(get_model_weights(range(1, n_layers + 1)))] \
+            + [l2_norm(get_model_weights([i])) for i in range(1, n_layers + 1)]
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            ours, expected = sess.run([l2_ops, expected_ops])
+
+        self.assertTrue(len(ours) == n_layers + 1)
+        self.assertTrue(
+            np.all(np.isclose(ours, np.array(expected) * l2_ratio))
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
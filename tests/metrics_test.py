@@ -0,0 +1,40 @@
+import tensorflow as tf
+import numpy as np
+
+from training.run_ops import build_metric_ops
+
+import unittest
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_accumulated_means(self):
+        losses = [tf.placeholder(shape=(), dtype=tf.float32) for _ in range(2)]
+        l2s = [tf.placeholder(shape=(), dtype=tf.float32) for _ in range(2)]
+        acc = tf.placeholder(shape=(), dtype=tf.float32)
+        metric_ops = build_metric_ops(losses, acc, l2s)
+
+        values = np.random.random((5, 3))
+
+        with tf.Session() as sess:
+            sess.run(tf.local_variables_initializer())
+
+            # Values from a previous epoch must not count
+            sess.run(
+                metric_ops.update_ops[0],
+                feed_dict={losses[0]: 100.0, acc: 100.0, l2s[0]: 100.0}
+            )
+            sess.run(metric_ops.reset_op)
+
+            for loss, acc_value, l2 in values:
+                sess.run(
+                    metric_ops.update_ops[1],
+                    feed_dict={losses[1]: loss, acc: acc_value, l2s[1]: l2}
+                )
+            means = sess.run(metric_ops.mean_ops)
+
+        self.assertTrue(np.all(np.isclose(means, np.mean(values, axis=0))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import tensorflow as tf
+import numpy as np
+
+from kernels import NystromFeatures, LANDMARK_ASSIGN_OPS
+
+import unittest
+
+N_SAMPLES = 20
+INPUT_DIMS = 3
+N_LANDMARKS = 5
+KERNEL_STD = 0.5
+
+
+def _gaussian_kernel(x, y):
+    dists = np.sum((x[:, None, :] - y[None, :, :]) ** 2, axis=-1)
+    return np.exp(-0.5 * KERNEL_STD ** 2 * dists)
+
+
+class NystromTestCase(unittest.TestCase):
+
+    def _map(self, selection, n_samples=N_SAMPLES):
+        x = np.random.random((n_samples, INPUT_DIMS))
+
+        with tf.Graph().as_default():
+            inputs = tf.placeholder(
+                shape=[None, INPUT_DIMS], dtype=tf.float32
+            )
+            kernel = NystromFeatures(
+                name='layer_nystrom',
+                input_dims=INPUT_DIMS,
+                kernel_std=KERNEL_STD,
+                kernel_size=N_LANDMARKS,
+                landmark_selection=selection
+            )
+            z_op = kernel.apply_kernel(inputs, 'training')
+
+            with tf.Session() as sess:
+                sess.run(
+                    tf.get_collection(LANDMARK_ASSIGN_OPS),
+                    feed_dict={inputs: x}
+                )
+                landmarks = sess.run(kernel._landmarks)
+                z = sess.run(z_op, feed_dict={inputs: landmarks})
+
+        return landmarks, z
+
+    def test_uniform(self):
+        landmarks, z = self._map('uniform')
+        self.assertTrue(landmarks.shape == (N_LANDMARKS, INPUT_DIMS))
+        self.assertTrue(z.shape == (N_LANDMARKS, N_LANDMARKS))
+
+    def test_distinct_landmarks(self):
+        # As many rows as landmarks, so every row is drawn exactly once
+        landmarks, _ = self._map('uniform', n_samples=N_LANDMARKS)
+        self.assertEqual(
+            len(np.unique(landmarks, axis=0)), N_LANDMARKS
+        )
+
+    def test_small_batch(self):
+        with self.assertRaises(tf.errors.InvalidArgumentError):
+            self._map('uniform', n_samples=N_LANDMARKS - 1)
+
+    def test_exact_on_landmarks(self):
+        # Nystrom reproduces the kernel exactly between landmarks
+        landmarks, z = self._map('kmeans++')
+        exact = _gaussian_kernel(landmarks, landmarks)
+        self.assertTrue(np.all(np.isclose(np.dot(z, z.T), exact, atol=1e-3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import tensorflow as tf
+import numpy as np
+
+from kernels import OrthogonalRFF, StructuredORF, sample_w
+
+import unittest
+
+INPUT_DIMS = 8
+KERNEL_SIZE = 20
+KERNEL_STD = 0.5
+
+
+class OrthogonalTestCase(unittest.TestCase):
+
+    def _draw(self, kernel_fn):
+        kernel = kernel_fn(
+            name='layer_kernel',
+            input_dims=INPUT_DIMS,
+            kernel_std=KERNEL_STD,
+            kernel_size=KERNEL_SIZE,
+        )
+        with tf.Session() as sess:
+            return sess.run(kernel.draw_w())
+
+    def _assert_orthogonal_blocks(self, w):
+        for start in range(0, KERNEL_SIZE, INPUT_DIMS):
+            block = w[start:start + INPUT_DIMS]
+            gram = np.dot(block, block.T)
+            off_diagonal = gram - np.diag(np.diag(gram))
+            self.assertTrue(np.all(np.isclose(off_diagonal, 0.0, atol=1e-4)))
+
+    def test_orf(self):
+        w = self._draw(OrthogonalRFF)
+        self.assertTrue(w.shape == (KERNEL_SIZE, INPUT_DIMS))
+        self._assert_orthogonal_blocks(w)
+
+    def test_sorf(self):
+        w = self._draw(StructuredORF)
+        self.assertTrue(w.shape == (KERNEL_SIZE, INPUT_DIMS))
+        self._assert_orthogonal_blocks(w)
+
+        # Every row has norm std * sqrt(d)
+        norms = np.linalg.norm(w, axis=1)
+        self.assertTrue(
+            np.all(np.isclose(norms, KERNEL_STD * np.sqrt(INPUT_DIMS)))
+        )
+
+    def test_resample(self):
+        var = tf.placeholder(shape=[KERNEL_SIZE, INPUT_DIMS], dtype=tf.float32)
+        for kernel_fn in [OrthogonalRFF, StructuredORF]:
+            sample = sample_w(
+                kernel_fn, var, kernel_size=KERNEL_SIZE, kernel_std=KERNEL_STD
+            )
+            self.assertTrue(
+                sample.get_shape().as_list() == [KERNEL_SIZE, INPUT_DIMS]
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
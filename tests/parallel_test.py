@@ -0,0 +1,106 @@
+import unittest
+import os
+import threading
+import time
+import numpy as np
+from unittest import mock
+
+from hyperopt import hp, rand, Trials, STATUS_OK, space_eval
+
+from validation.parallel import parallel_fmin
+from validation.tuning import _parallel_runs, _parallel_folds, \
+                              _split_replicas
+
+N_TRIALS = 5
+
+
+def _evaluate(params):
+    return {
+        'loss': (params['x'] - 1) ** 2,
+        'averaged': {'x': params['x']},
+        'threads': params['intra_op_threads'],
+        'status': STATUS_OK
+    }
+
+
+def _run(i, cores=None):
+    # Later runs finish first so order depends on the pool
+    time.sleep(0.1 * (N_TRIALS - i))
+    return {'run': i, 'cores': cores, 'affinity': os.sched_getaffinity(0)}
+
+
+def _validate_fold(dataset, settings_fn, val_fold, **params):
+    time.sleep(0.2)
+    return {
+        'val_error': val_fold,
+        'thread': threading.current_thread().name,
+        'threads': params['intra_op_threads']
+    }
+
+
+class ParallelTestCase(unittest.TestCase):
+
+    def test_parallel_trials(self):
+        space = {'x': hp.uniform('x', -2, 2)}
+        trials = Trials()
+
+        best = parallel_fmin(
+            evaluate_fn=_evaluate,
+            space=space,
+            algo=rand.suggest,
+            max_evals=N_TRIALS,
+            trials=trials,
+            rstate=np.random.RandomState(0),
+            n_workers=2,
+            threads_per_worker=3
+        )
+
+        self.assertEqual(len(trials.trials), N_TRIALS)
+        self.assertTrue(all(r['threads'] == 3 for r in trials.results))
+
+        # History behaves as the one of a sequential search
+        losses = [r['loss'] for r in trials.results]
+        self.assertEqual(trials.best_trial['result']['loss'], min(losses))
+        self.assertEqual(
+            space_eval(space, best)['x'],
+            trials.best_trial['result']['averaged']['x']
+        )
+
+    def test_parallel_runs(self):
+        stats = _parallel_runs(_run, N_TRIALS, n_workers=2)
+
+        self.assertEqual([s['run'] for s in stats], list(range(N_TRIALS)))
+        for run_stats in stats:
+            self.assertEqual(set(run_stats['cores']), run_stats['affinity'])
+
+    def test_replicated_runs(self):
+        stats = _split_replicas(
+            {'test_error': [0.1, 0.2], 'num_layers': 2, 'time(s)': 10.0}, 2
+        )
+
+        self.assertEqual([s['test_error'] for s in stats], [0.1, 0.2])
+        # Only training time is shared among the replicas
+        self.assertTrue(all(s['num_layers'] == 2 for s in stats))
+        self.assertTrue(all(s['time(s)'] == 5.0 for s in stats))
+
+    def test_parallel_folds(self):
+        with mock.patch(
+            'validation.tuning._incremental_validation', _validate_fold
+        ):
+            before = time.time()
+            timed = _parallel_folds(
+                None, None, range(4), 2, intra_op_threads=8
+            )
+            elapsed = time.time() - before
+
+        results = [best for best, _ in timed]
+        self.assertEqual([r['val_error'] for r in results], list(range(4)))
+        self.assertTrue(all(r['threads'] == 4 for r in results))
+
+        # Folds run two at a time in separate threads
+        self.assertEqual(len(set(r['thread'] for r in results)), 2)
+        self.assertLess(elapsed, 0.2 * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import tensorflow as tf
+import numpy as np
+
+from training.handoff import StageWeights
+from training.population import PopulationAdamOptimizer, \
+                                merge_population_params, select_members, \
+                                population_shape_key
+from validation.population import group_trials
+
+import unittest
+
+N_STEPS = 5
+
+
+class PopulationTestCase(unittest.TestCase):
+
+    def _train(self, lrs, mask):
+        """ Minimizes a quadratic with one weight row per member """
+        with tf.Graph().as_default():
+            weights = tf.get_variable(
+                'weights', initializer=tf.ones([len(lrs), 3])
+            )
+            loss = tf.reduce_sum(tf.square(weights - 2.0))
+            member_mask = tf.constant(mask, dtype=tf.float32)
+            optimizer = PopulationAdamOptimizer(
+                tf.constant(lrs, dtype=tf.float32), member_mask
+            )
+            train_op = optimizer.minimize(loss)
+
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                for _ in range(N_STEPS):
+                    sess.run(train_op)
+                return sess.run(weights)
+
+    def _adam(self, lr):
+        with tf.Graph().as_default():
+            weights = tf.get_variable('weights', initializer=tf.ones([3]))
+            loss = tf.reduce_sum(tf.square(weights - 2.0))
+            train_op = tf.train.AdamOptimizer(lr).minimize(loss)
+
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                for _ in range(N_STEPS):
+                    sess.run(train_op)
+                return sess.run(weights)
+
+    def test_member_learning_rates(self):
+        lrs = [0.1, 0.01]
+        trained = self._train(lrs, [1.0, 1.0])
+        for member, lr in enumerate(lrs):
+            np.testing.assert_allclose(
+                trained[member], self._adam(lr), rtol=1e-5
+            )
+
+    def test_stopped_members(self):
+        trained = self._train([0.1, 0.1], [1.0, 0.0])
+        self.assertFalse(np.allclose(trained[0], 1.0))
+        np.testing.assert_allclose(trained[1], 1.0)
+
+    def test_member_params(self):
+        members = [
+            {'lr': 0.1, 'l2_ratio': 0.01, 'hidden_units': 8},
+            {'lr': 0.2, 'l2_ratio': 0.02, 'hidden_units': 8},
+            {'lr': 0.3, 'l2_ratio': 0.03, 'hidden_units': 8}
+        ]
+        self.assertEqual(len(set(population_shape_key(m) for m in members)), 1)
+        self.assertNotEqual(
+            population_shape_key(members[0]),
+            population_shape_key(dict(members[0], hidden_units=16))
+        )
+
+        params = merge_population_params(members)
+        self.assertEqual(params['replicas'], 3)
+        self.assertEqual(params['lr'], [0.1, 0.2, 0.3])
+
+        selected = select_members(params, [0, 2])
+        self.assertEqual(selected['replicas'], 2)
+        self.assertEqual(selected['l2_ratio'], [0.01, 0.03])
+        self.assertEqual(selected['hidden_units'], 8)
+
+    def test_group_trials(self):
+        params = [
+            {'lr': 0.1, 'hidden_units': 8},
+            {'lr': 0.2, 'hidden_units': 8, 'watchdog': True},
+            {'lr': 0.3, 'hidden_units': 8},
+            {'lr': 0.4, 'hidden_units': 8, 'watchdog': True}
+        ]
+        # Trials that cannot share a population are trained alone
+        self.assertEqual(group_trials(params), [[0, 2], [1], [3]])
+
+    def test_member_weights(self):
+        best = StageWeights({'w': np.zeros((3, 2)), 'step': np.int64(4)})
+        current = StageWeights({'w': np.ones((3, 2)), 'step': np.int64(7)})
+
+        merged = best.with_member(current, 1)
+        np.testing.assert_array_equal(
+            merged._values['w'], [[0, 0], [1, 1], [0, 0]]
+        )
+        self.assertEqual(merged._values['step'], 4)
+
+        selected = merged.select([1, 2])
+        np.testing.assert_array_equal(
+            selected._values['w'], [[1, 1], [0, 0]]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
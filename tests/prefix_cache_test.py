@@ -0,0 +1,87 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+
+from training.prefix_cache import PrefixCache, CachedFeeder, \
+                                  can_cache_prefix, closing_cache
+from training.watchdog import TrialAborted
+
+BATCH_SIZE = 4
+
+ACTIVATIONS = {
+    0: np.zeros((6, 3)),
+    1: np.ones((5, 3)),
+    2: np.full((7, 3), 2.0)
+}
+
+LABELS = {
+    0: np.zeros((6, 1)),
+    1: np.ones((5, 1)),
+    2: np.full((7, 1), 2)
+}
+
+
+class PrefixCacheTestCase(unittest.TestCase):
+
+    def test_feeder(self):
+        cache = PrefixCache(ACTIVATIONS, LABELS)
+        feeder = CachedFeeder(cache, [0, 2], BATCH_SIZE, 'prefix', 'labels')
+
+        seen = []
+        for _ in range(10):
+            feed = feeder.next_feed()
+            self.assertTrue(feed['prefix'].shape == (BATCH_SIZE, 3))
+            self.assertTrue(feed['labels'].shape == (BATCH_SIZE, 1))
+
+            # Activations and labels stay aligned
+            self.assertTrue(
+                np.array_equal(feed['prefix'][:, 0], feed['labels'][:, 0])
+            )
+            seen.extend(feed['labels'][:, 0])
+
+        # Only rows from the requested folds are used
+        self.assertTrue(set(seen) == set([0, 2]))
+
+    def test_feeder_rows(self):
+        # Every row holds its own position among the rows of the folds
+        values = np.arange(13, dtype=np.float64)[:, None]
+        cache = PrefixCache({0: values[:6], 1: values[6:]},
+                            {0: values[:6], 1: values[6:]})
+        feeder = CachedFeeder(cache, [1, 0], BATCH_SIZE, 'prefix', 'labels')
+
+        for _ in range(5):
+            # Rows are not repeated within a pass over the folds
+            epoch = np.concatenate([
+                feeder.next_feed()['prefix'][:, 0] for _ in range(3)
+            ])
+            self.assertEqual(len(set(epoch)), len(epoch))
+            self.assertTrue(set(epoch) <= set(range(13)))
+
+    def test_disabled(self):
+        base = {'cache_prefix': True, 'train_only': 2, 'num_layers': 2}
+        self.assertTrue(can_cache_prefix(**base))
+
+        for extra in [{'cache_prefix': False},
+                      {'train_only': 1, 'num_layers': 1},
+                      {'train_only': 0},
+                      {'batch_norm': True},
+                      {'fc_dropout_keep_prob': 0.5},
+                      {'layerwise': True}]:
+            params = base.copy()
+            params.update(extra)
+            self.assertFalse(can_cache_prefix(**params))
+
+    def test_closed_on_abort(self):
+        folder = tempfile.mkdtemp()
+        cache = PrefixCache(ACTIVATIONS, LABELS, folder)
+
+        with self.assertRaises(TrialAborted):
+            with closing_cache(cache):
+                raise TrialAborted('Loss is nan')
+
+        self.assertFalse(os.path.exists(folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
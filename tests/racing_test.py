@@ -0,0 +1,44 @@
+import numpy as np
+
+from validation.racing import FoldRacing
+
+import unittest
+
+N_FOLDS = 10
+
+
+class RacingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._racing = FoldRacing(alpha=0.05, min_folds=3)
+        self._incumbent = np.linspace(0.1, 0.2, N_FOLDS)
+        self._racing.update(self._incumbent, N_FOLDS)
+
+    def test_no_incumbent(self):
+        self.assertFalse(FoldRacing().is_hopeless([0.9, 0.9, 0.9]))
+
+    def test_min_folds(self):
+        self.assertFalse(self._racing.is_hopeless([0.9, 0.9]))
+
+    def test_hopeless(self):
+        errors = self._incumbent[:4] + [0.5, 0.55, 0.45, 0.5]
+        self.assertTrue(self._racing.is_hopeless(errors))
+
+        # Abandoned settings do not beat the incumbent
+        loss = self._racing.update(errors, N_FOLDS)
+        self.assertGreater(loss, np.mean(self._incumbent))
+
+    def test_close_setting(self):
+        errors = self._incumbent[:4] + [0.01, -0.01, 0.02, -0.02]
+        self.assertFalse(self._racing.is_hopeless(errors))
+
+    def test_new_incumbent(self):
+        better = self._incumbent - 0.05
+        self.assertAlmostEqual(
+            self._racing.update(better, N_FOLDS), np.mean(better)
+        )
+        self.assertTrue(self._racing.is_hopeless(self._incumbent[:3] + 0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import tensorflow as tf
+import numpy as np
+
+from layout.replicated import replicate_input, replicated_kernel_block, \
+                              replicated_fully_connected
+from ops import loss_ops_list, get_accuracy_op, init_kernel_ops
+from training.run_ops import RunStatus
+
+N_REPLICAS = 3
+N_ROWS = 8
+N_COLS = 5
+N_CLASSES = 4
+PARAMS = {
+    'hidden_units': 6,
+    'kernel_size': 10,
+    'kernel_std': 0.5,
+    'l2_ratio': 0.1,
+    'replicas': N_REPLICAS
+}
+
+
+class ReplicatedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+        self._x = np.random.random((N_ROWS, N_COLS))
+        self._y = np.random.randint(N_CLASSES, size=(N_ROWS, 1))
+
+    def test_replica_losses(self):
+        x = tf.placeholder(shape=[None, N_COLS], dtype=tf.float32)
+        y = tf.placeholder(shape=[None, 1], dtype=tf.int32)
+
+        with tf.variable_scope('network'):
+            hidden = replicated_kernel_block(
+                replicate_input(x, N_REPLICAS), '1_nk', 'replicated_test',
+                False, **PARAMS
+            )
+            logits = replicated_fully_connected(
+                hidden, N_CLASSES, 'output', 'replicated_test',
+                activation_fn=None
+            )
+
+        loss_ops = loss_ops_list(
+            logits=logits,
+            y=y,
+            sum_collection='replicated_test',
+            n_classes=N_CLASSES,
+            num_layers=1,
+            **PARAMS
+        )
+        acc_op = get_accuracy_op(logits, y, N_CLASSES)
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            init_kernel_ops(sess)
+            all_logits, losses, acc = sess.run(
+                [logits, loss_ops, acc_op],
+                feed_dict={x: self._x, y: self._y}
+            )
+
+        # Each loss has a value per replica
+        for loss in losses:
+            self.assertEqual(loss.shape, (N_REPLICAS,))
+        self.assertEqual(acc.shape, (N_REPLICAS,))
+
+        # Replicas do not share weights
+        self.assertFalse(np.allclose(all_logits[0], all_logits[1]))
+
+        expected_acc = np.mean(
+            np.argmax(all_logits, -1) == self._y.reshape(1, -1), axis=-1
+        )
+        np.testing.assert_allclose(acc, expected_acc, rtol=1e-5)
+
+    def test_replica_status(self):
+        status = RunStatus()
+        status.update(np.array([1.0, 3.0]), np.array([0.5, 1.0]), 0.0)
+        status.update(np.array([3.0, 5.0]), np.array([0.5, 0.0]), 0.0)
+
+        replicas = status.replicas()
+        self.assertEqual(len(replicas), 2)
+        self.assertAlmostEqual(replicas[0].loss(), 2.0)
+        self.assertAlmostEqual(replicas[1].loss(), 4.0)
+        self.assertAlmostEqual(replicas[1].error(), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
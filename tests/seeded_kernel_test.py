@@ -0,0 +1,141 @@
+import tensorflow as tf
+import numpy as np
+
+from kernels import GaussianRFF, KERNEL_ASSIGN_OPS, SEEDED_KERNEL_COLLECTION
+from layout.base import kernel_block
+from ops import get_kernel_assign_ops_list, init_kernel_ops, \
+                replay_kernel_ops
+from variables import get_checkpoint_variables
+
+import shutil
+import tempfile
+import unittest
+
+INPUT_DIMS = 4
+KERNEL_SIZE = 8
+PARAMS = {
+    'num_layers': 1,
+    'kernel_size': KERNEL_SIZE,
+    'kernel_std': 0.5,
+    'kernel_seed': 7,
+    'kernel_dropout_rate': 0.5
+}
+
+
+def _build_kernel(name='1_kernel'):
+    inputs = tf.placeholder(shape=[None, INPUT_DIMS], dtype=tf.float32)
+    with tf.variable_scope('network'):
+        kernel = GaussianRFF(
+            name=name,
+            input_dims=INPUT_DIMS,
+            **PARAMS
+        )
+        kernel.apply_kernel(inputs, 'training')
+        dropout_ops = get_kernel_assign_ops_list(**PARAMS)
+    return kernel, dropout_ops
+
+
+def _build_block():
+    inputs = tf.placeholder(shape=[None, INPUT_DIMS], dtype=tf.float32)
+    with tf.variable_scope('network'):
+        mapped = kernel_block(
+            inputs, 1, 'training', is_training=True, hidden_units=6, **PARAMS
+        )
+        dropout_ops = get_kernel_assign_ops_list(**PARAMS)
+    return inputs, mapped, dropout_ops
+
+
+class SeededKernelTestCase(unittest.TestCase):
+
+    def _initial_w(self, name):
+        with tf.Graph().as_default():
+            kernel, _ = _build_kernel(name)
+            with tf.Session() as sess:
+                sess.run(tf.get_collection(KERNEL_ASSIGN_OPS))
+                return sess.run(kernel._w)
+
+    def test_deterministic(self):
+        first = self._initial_w('1_kernel')
+        second = self._initial_w('1_kernel')
+        self.assertTrue(np.array_equal(first, second))
+
+        other = self._initial_w('2_kernel')
+        self.assertFalse(np.array_equal(first, other))
+
+    def test_not_checkpointed(self):
+        with tf.Graph().as_default():
+            kernel, _ = _build_kernel()
+            saved = get_checkpoint_variables()
+            self.assertTrue(kernel._w not in saved)
+            self.assertTrue(kernel._b not in saved)
+
+    def test_replay(self):
+        generations = 3
+
+        with tf.Graph().as_default():
+            kernel, dropout_ops = _build_kernel()
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                init_kernel_ops(sess)
+                for _ in range(generations):
+                    sess.run(dropout_ops[1])
+                trained = sess.run(kernel._w)
+
+        with tf.Graph().as_default():
+            kernel, _ = _build_kernel()
+            generation = [
+                v for v in tf.global_variables() if 'generation' in v.name
+            ][0]
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                init_kernel_ops(sess)
+                # Emulates restoring the counter from a checkpoint
+                sess.run(generation.assign(generations))
+                replay_kernel_ops(sess)
+                replayed = sess.run(kernel._w)
+
+        self.assertTrue(np.array_equal(trained, replayed))
+
+    def test_block_checkpoint(self):
+        folder = tempfile.mkdtemp()
+        path = folder + '/model.ckpt'
+        x = np.random.RandomState(0).randn(5, INPUT_DIMS)
+
+        try:
+            with tf.Graph().as_default():
+                inputs, mapped, dropout_ops = _build_block()
+                seeded = tf.get_collection(SEEDED_KERNEL_COLLECTION)
+                self.assertEqual(len(seeded), 2)
+
+                saver = tf.train.Saver(get_checkpoint_variables())
+                with tf.Session() as sess:
+                    sess.run(tf.global_variables_initializer())
+                    init_kernel_ops(sess)
+                    for _ in range(3):
+                        sess.run(dropout_ops[1])
+                    trained_w = sess.run(seeded[0])
+                    trained = sess.run(mapped, feed_dict={inputs: x})
+                    saver.save(sess, path)
+
+            # Restores as predict_fn does
+            with tf.Graph().as_default():
+                inputs, mapped, _ = _build_block()
+                seeded = tf.get_collection(SEEDED_KERNEL_COLLECTION)
+
+                saver = tf.train.Saver(get_checkpoint_variables())
+                with tf.Session() as sess:
+                    sess.run(tf.global_variables_initializer())
+                    init_kernel_ops(sess)
+                    saver.restore(sess, path)
+                    replay_kernel_ops(sess)
+                    restored_w = sess.run(seeded[0])
+                    restored = sess.run(mapped, feed_dict={inputs: x})
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertTrue(np.array_equal(trained_w, restored_w))
+        self.assertTrue(np.allclose(trained, restored))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import numpy as np
+
+from training.handoff import StageWeights
+from validation.stage_cache import StageCache
+from validation.tuning import _incremental_validation
+
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+PARAMS = {
+    'lr': 0.01,
+    'hidden_units': 32,
+    'kernel_size': 64,
+    'max_layers': 3,
+    'activation_fn': np.tanh
+}
+
+
+class _Settings(object):
+
+    def __init__(self, data_location):
+        pass
+
+    def get_fold_num(self):
+        return 2
+
+
+class _Run(object):
+
+    def __init__(self):
+        self.stopped = False
+        self.updates = []
+
+    def strip_update(self, epoch, val_error):
+        self.updates.append((epoch, val_error))
+        return self.stopped
+
+
+class _Scheduler(object):
+    """ Stops every run during its first stage, if enabled """
+
+    def __init__(self, stop):
+        self._stop = stop
+        self.run = _Run()
+        self.fits = 0
+
+    def new_run(self):
+        return self.run
+
+    def fit(self, **params):
+        self.fits += 1
+        self.run.stopped = self._stop
+        return {'val_error': 0.25, 'epoch': 10}
+
+
+class StageCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+        self._cache = StageCache(self._folder)
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def test_keys(self):
+        key = self._cache.key(PARAMS, 0, 1)
+        self.assertEqual(key, self._cache.key(dict(PARAMS), 0, 1))
+
+        # Number of stages does not change each of them
+        self.assertEqual(
+            key, self._cache.key(dict(PARAMS, max_layers=5), 0, 1)
+        )
+
+        self.assertNotEqual(key, self._cache.key(PARAMS, 1, 1))
+        self.assertNotEqual(key, self._cache.key(PARAMS, 0, 2))
+        self.assertNotEqual(key, self._cache.key(dict(PARAMS, lr=0.1), 0, 1))
+
+    def test_round_trip(self):
+        key = self._cache.key(PARAMS, 0, 1)
+        self.assertIsNone(self._cache.get(key))
+
+        best = {'val_error': np.float32(0.25), 'epoch': np.int64(40)}
+        weights = StageWeights({'network/1_nk_fc/weights': np.ones((2, 3))})
+        self._cache.put(key, best, weights)
+
+        cached_best, cached_weights = self._cache.get(key)
+        self.assertAlmostEqual(cached_best['val_error'], 0.25)
+        self.assertEqual(cached_best['epoch'], 40)
+        np.testing.assert_array_equal(
+            cached_weights._values['network/1_nk_fc/weights'], np.ones((2, 3))
+        )
+
+    def _validate(self, scheduler):
+        model = mock.Mock()
+        model.fit.side_effect = scheduler.fit
+        model.stage_weights.return_value = StageWeights(
+            {'network/1_nk_fc/weights': np.ones((2, 3))}
+        )
+
+        with mock.patch('validation.tuning.get_data_location'), \
+                mock.patch(
+                    'validation.tuning.DeepNetworkValidation',
+                    return_value=model):
+            _incremental_validation(
+                None, _Settings, 0, stage_handoff=True,
+                stage_cache=self._folder, scheduler=scheduler,
+                **dict(PARAMS, max_layers=1)
+            )
+
+    def test_scheduler_stop(self):
+        key = self._cache.key(PARAMS, 0, 1)
+
+        # Stages cut short would be served as complete ones
+        self._validate(_Scheduler(stop=True))
+        self.assertIsNone(self._cache.get(key))
+
+        self._validate(_Scheduler(stop=False))
+        self.assertIsNotNone(self._cache.get(key))
+
+    def test_cached_stage_reported(self):
+        self._validate(_Scheduler(stop=False))
+
+        # Cached stages still report their result to the scheduler
+        scheduler = _Scheduler(stop=False)
+        self._validate(scheduler)
+        self.assertEqual(scheduler.fits, 0)
+        self.assertEqual(scheduler.run.updates, [(10, 0.25)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+
+from hyperopt import hp, rand, Trials, STATUS_OK
+
+from validation.trial_queue import SQLiteQueue, run_worker, queue_fmin, \
+    DONE, FAILED, QUEUED
+
+N_TRIALS = 6
+SPACE = {'x': hp.uniform('x', -2, 2)}
+
+
+def _evaluate(params):
+    return {
+        'loss': (params['x'] - 1) ** 2,
+        'parameters': params,
+        'status': STATUS_OK
+    }
+
+
+def _crash(params):
+    raise RuntimeError('Out of memory')
+
+
+class TrialQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+        self._queue = SQLiteQueue(
+            os.path.join(self._folder, 'queue.db'), max_attempts=2
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def test_expired_lease(self):
+        job_id = self._queue.post('test', (_evaluate, {'x': 1.0}))
+        self.assertEqual(self._queue.claim('dead', 0.1)[0], job_id)
+        self.assertIsNone(self._queue.claim('alive', 0.1))
+
+        # Job is taken over once the lease of the dead worker expires
+        time.sleep(0.2)
+        self.assertEqual(run_worker(self._queue, 'alive', max_jobs=1), 1)
+        self.assertFalse(self._queue.renew(job_id, 'dead', 0.1))
+
+        state, result, _ = self._queue.status(job_id)
+        self.assertEqual(state, DONE)
+        self.assertEqual(result['loss'], 0.0)
+
+    def test_retries(self):
+        job_id = self._queue.post('test', (_crash, {}))
+
+        run_worker(self._queue, 'worker', max_jobs=1)
+        self.assertEqual(self._queue.status(job_id)[0], QUEUED)
+
+        run_worker(self._queue, 'worker', max_jobs=1)
+        state, _, error = self._queue.status(job_id)
+        self.assertEqual(state, FAILED)
+        self.assertIn('Out of memory', error)
+
+    def test_queue_fmin(self):
+        workers = [
+            threading.Thread(
+                target=run_worker,
+                args=(self._queue, 'worker-%d' % i),
+                kwargs={'poll_secs': 0.05, 'max_idle_secs': 1}
+            )
+            for i in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+
+        trials = Trials()
+        queue_fmin(
+            evaluate_fn=_evaluate,
+            space=SPACE,
+            algo=rand.suggest,
+            max_evals=N_TRIALS,
+            trials=trials,
+            rstate=np.random.RandomState(0),
+            queue=self._queue,
+            max_pending=2,
+            poll_secs=0.05
+        )
+
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(trials.trials), N_TRIALS)
+        self.assertEqual(trials.statuses(), [STATUS_OK] * N_TRIALS)
+        self.assertAlmostEqual(
+            trials.best_trial['result']['loss'], np.min(trials.losses())
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from hyperopt import fmin, hp, rand, STATUS_OK
+
+from validation.trial_store import TrialStore, StoredTrials, import_log
+
+N_TRIALS = 6
+SPACE = {'x': hp.uniform('x', -2, 2)}
+
+LOG = (
+    "2018-03-07 22:04:56,343 INFO     Finished evaluation on "
+    "{'lr': 0.01, 'network_fn': <function layout_fn at 0x7f60db71eea0>}\n"
+    "2018-03-07 22:04:56,344 INFO     Obtained results "
+    "{'val_error': 0.25, 'train_epochs': [140, 165]}\n"
+    "2018-03-07 22:05:00,000 INFO     Running training [0] in motor/1\n"
+)
+
+
+def _evaluate(params):
+    return {
+        'loss': (params['x'] - 1) ** 2,
+        'parameters': params,
+        'status': STATUS_OK
+    }
+
+
+class TrialStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+        self._store = TrialStore(os.path.join(self._folder, 'trials.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def _search(self, n_trials, experiment='test', warm_start=None):
+        trials = StoredTrials(self._store, experiment, warm_start)
+        fmin(
+            fn=_evaluate,
+            algo=rand.suggest,
+            space=SPACE,
+            max_evals=n_trials + trials.warm_start_trials,
+            trials=trials,
+            rstate=np.random.RandomState(0)
+        )
+        return trials
+
+    def test_resume(self):
+        self._search(N_TRIALS // 2)
+        self.assertEqual(len(self._store.records('test')), N_TRIALS // 2)
+
+        # Only the missing trials are run
+        trials = self._search(N_TRIALS)
+        records = self._store.records('test')
+        self.assertEqual(len(trials.trials), N_TRIALS)
+        self.assertEqual([r['tid'] for r in records], list(range(N_TRIALS)))
+        self.assertAlmostEqual(
+            trials.best_trial['result']['loss'],
+            np.min([r['result']['loss'] for r in records])
+        )
+
+    def test_warm_start(self):
+        self._search(N_TRIALS // 2, experiment='previous')
+        trials = self._search(N_TRIALS, warm_start=['previous'])
+
+        # Warm start trials do not count towards the evaluations
+        self.assertEqual(len(trials.trials), N_TRIALS + N_TRIALS // 2)
+        self.assertEqual(len(self._store.records('test')), N_TRIALS)
+
+        # The best trial is one of the experiment
+        records = self._store.records('test')
+        self.assertGreaterEqual(trials.best_trial['tid'], N_TRIALS // 2)
+        self.assertAlmostEqual(
+            trials.best_trial['result']['loss'],
+            np.min([r['result']['loss'] for r in records])
+        )
+
+        # Resuming does not duplicate the warm start trials
+        trials = self._search(N_TRIALS, warm_start=['previous'])
+        self.assertEqual(len(trials.trials), N_TRIALS + N_TRIALS // 2)
+        self.assertEqual(len(self._store.records('test')), N_TRIALS)
+
+    def test_import_log(self):
+        path = os.path.join(self._folder, 'motor.log')
+        with open(path, 'w') as f:
+            f.write(LOG)
+
+        self.assertEqual(import_log(self._store, path, 'motor'), 1)
+        self.assertEqual(import_log(self._store, path, 'motor'), 1)
+
+        records = self._store.records('motor')
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['params']['lr'], 0.01)
+        self.assertAlmostEqual(records[0]['result']['loss'], 0.25)
+        self.assertEqual(
+            records[0]['result']['averaged']['train_epochs'], [140, 165]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
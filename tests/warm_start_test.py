@@ -0,0 +1,71 @@
+import unittest
+import collections
+import numpy as np
+
+from training.warm_start import _ridge, _irls
+
+N_BATCHES = 8
+BATCH_SIZE = 32
+DIMS = 4
+
+Context = collections.namedtuple(
+    'Context', ['steps_per_epoch', 'labels_op', 'is_training_op', 'feeder']
+)
+
+
+class FakeSession(object):
+    """
+    Returns the same epoch of batches each time it is iterated
+    """
+
+    def __init__(self, features, labels):
+        self._features, self._labels = features, labels
+        self._i = 0
+
+    def run(self, ops, feed_dict=None):
+        i = self._i % len(self._features)
+        self._i += 1
+        return self._features[i], self._labels[i]
+
+
+class WarmStartTestCase(unittest.TestCase):
+
+    def setUp(self):
+        state = np.random.RandomState(3)
+        self._w = state.normal(size=(DIMS, 1))
+        self._z = [state.normal(size=(BATCH_SIZE, DIMS))
+                   for _ in range(N_BATCHES)]
+        self._context = Context(N_BATCHES, 'labels', 'is_training', None)
+
+    def test_ridge(self):
+        # Noise-free linear targets in {-1, 1} are recovered exactly
+        labels = [(np.dot(z, self._w) > 0).astype(int) for z in self._z]
+        sess = FakeSession(self._z, labels)
+        w = _ridge(sess, self._context, 'features', 2, 0.0)
+
+        z = np.vstack([np.hstack([x, np.ones((len(x), 1))]) for x in self._z])
+        t = 2.0 * np.vstack(labels) - 1.0
+        expected = np.linalg.lstsq(z, t, rcond=None)[0]
+        self.assertTrue(np.all(np.isclose(w, expected, atol=1e-6)))
+
+    def test_irls(self):
+        state = np.random.RandomState(5)
+        labels = [
+            (state.uniform(size=(BATCH_SIZE, 1))
+             < 1 / (1 + np.exp(-np.dot(z, self._w)))).astype(int)
+            for z in self._z
+        ]
+        sess = FakeSession(self._z, labels)
+        w = _irls(sess, self._context, 'features', 1e-3, 10)
+
+        # Gradient of the regularized mean logistic loss vanishes
+        z = np.vstack([np.hstack([x, np.ones((len(x), 1))]) for x in self._z])
+        y = np.vstack(labels)
+        p = 1 / (1 + np.exp(-np.dot(z, w)))
+        reg = np.vstack([w[:-1], [[0.0]]]) * 1e-3
+        grad = np.dot(z.T, p - y) / len(z) + reg
+        self.assertTrue(np.linalg.norm(grad) < 1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
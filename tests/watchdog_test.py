@@ -0,0 +1,68 @@
+from training.watchdog import Watchdog, TrialAborted, build_watchdog
+
+import threading
+import unittest
+
+N_CLASSES = 10
+
+
+class WatchdogTestCase(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertIsNone(build_watchdog(N_CLASSES))
+
+    def test_nan_loss(self):
+        watchdog = Watchdog(N_CLASSES)
+        watchdog.check_loss(2.3)
+        with self.assertRaises(TrialAborted):
+            watchdog.check_loss(float('nan'))
+
+    def test_infinite_loss(self):
+        with self.assertRaises(TrialAborted):
+            Watchdog(N_CLASSES).check_loss(float('inf'))
+
+    def test_exploding_loss(self):
+        watchdog = Watchdog(N_CLASSES, explode_factor=10.0)
+        watchdog.check_loss(2.0)
+        watchdog.check_loss(1.0)
+        watchdog.check_loss(9.0)
+        with self.assertRaises(TrialAborted):
+            watchdog.check_loss(11.0)
+
+    def test_chance_level(self):
+        watchdog = Watchdog(N_CLASSES, chance_window=3, chance_margin=0.01)
+        watchdog.epoch_update(0.9)
+        watchdog.epoch_update(0.895)
+
+        # Progress restarts the window
+        watchdog.epoch_update(0.5)
+        watchdog.epoch_update(0.9)
+        watchdog.epoch_update(0.9)
+        with self.assertRaises(TrialAborted):
+            watchdog.epoch_update(0.9)
+
+    def test_class_prior(self):
+        # Always predicting the majority class gives a 0.2 error
+        watchdog = Watchdog(2, chance_window=2, class_prior=[80, 20])
+        watchdog.epoch_update(0.2)
+        with self.assertRaises(TrialAborted):
+            watchdog.epoch_update(0.2)
+
+    def test_shared_abort(self):
+        event = threading.Event()
+        first, second = [
+            build_watchdog(N_CLASSES, watchdog=True, abort_event=event)
+            for _ in range(2)
+        ]
+        second.check_aborted()
+
+        with self.assertRaises(TrialAborted):
+            first.check_loss(float('nan'))
+
+        # Aborting one run stops the others
+        with self.assertRaises(TrialAborted):
+            second.check_aborted()
+
+
+if __name__ == '__main__':
+    unittest.main()
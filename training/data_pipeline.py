@@ -0,0 +1,265 @@
+import tensorflow as tf
+import numpy as np
+
+import functools
+import logging
+import threading
+
+from ops import get_session_config
+
+from protodata.reading_ops import DataReader
+
+logger = logging.getLogger(__name__)
+
+
+QUEUE_PIPELINE = 'queue'
+DATASET_PIPELINE = 'dataset'
+
+# Elements kept in the shuffle buffer per unit of memory factor
+SHUFFLE_BATCHES = 10
+
+# Examples decoded per session call when filling the fold cache
+DECODE_BATCH = 1024
+
+# Decoded folds shared by all the graphs built in the process. Each fold
+# has its own lock so different folds are decoded concurrently
+_FOLD_CACHE = {}
+_FOLD_LOCKS = {}
+_FOLD_CACHE_LOCK = threading.Lock()
+
+
+def build_reader(dataset, data_location=None, **params):
+    """
+    Returns the reader selected by the 'input_pipeline' parameter: either
+    protodata's queue-based reader (default) or the tf.data one. If
+    'share_folds' is set, the tf.data reader serves folds from the
+    process-wide cache of the given data location
+    """
+    pipeline = params.get('input_pipeline', QUEUE_PIPELINE)
+    if pipeline == QUEUE_PIPELINE:
+        return DataReader(dataset)
+    elif pipeline == DATASET_PIPELINE:
+        share_folds = params.get('share_folds', False) \
+            and data_location is not None
+        return DatasetReader(
+            dataset,
+            cache=params.get('cache_folds', True),
+            prefetch=params.get('prefetch_batches', 2),
+            shared_key=_shared_key(data_location, **params)
+            if share_folds else None,
+            session_config=get_session_config(**params)
+        )
+    else:
+        raise ValueError('Unknown input pipeline %s' % pipeline)
+
+
+def clear_fold_cache():
+    with _FOLD_CACHE_LOCK:
+        _FOLD_CACHE.clear()
+        _FOLD_LOCKS.clear()
+
+
+def _shared_fold(key, decode_fn):
+    """
+    Returns the decoded fold of the process-wide cache under the key,
+    decoding it with decode_fn if no graph did it before
+    """
+    with _FOLD_CACHE_LOCK:
+        lock = _FOLD_LOCKS.setdefault(key, threading.Lock())
+
+    with lock:
+        with _FOLD_CACHE_LOCK:
+            if key in _FOLD_CACHE:
+                return _FOLD_CACHE[key]
+
+        decoded = decode_fn()
+        with _FOLD_CACHE_LOCK:
+            _FOLD_CACHE[key] = decoded
+        return decoded
+
+
+def _shared_key(data_location, **params):
+    # Batch size is added to the image specs but does not affect decoding
+    specs = params.get('image_specs', None)
+    if specs is not None:
+        specs = tuple(sorted(
+            (k, v) for k, v in specs.items() if k != 'batch_size'
+        ))
+    return data_location, specs
+
+
+class DatasetReader(object):
+    """
+    Reads folded batches with tf.data instead of queue runners. Each fold
+    is decoded once by protodata's DataReader, so records are parsed as the
+    dataset settings define, and then served from memory, shuffled and
+    prefetched. Exposes the same reading interface as DataReader
+    """
+
+    def __init__(self,
+                 dataset,
+                 cache=True,
+                 prefetch=2,
+                 shared_key=None,
+                 session_config=None):
+        self._dataset = dataset
+        self._cache = cache
+        self._prefetch = prefetch
+        self._shared_key = shared_key
+        self._session_config = session_config
+        self._folds = {}
+
+    def read_folded_batch(self,
+                          batch_size,
+                          data_mode,
+                          folds,
+                          memory_factor=None,
+                          reader_threads=None,
+                          train_mode=True,
+                          shuffle=True):
+        """
+        Returns the features and labels of the next batch. In train mode
+        the data is repeated indefinitely, otherwise an OutOfRangeError is
+        raised once all the instances have been read
+        """
+        data = _array_dataset(
+            self._decoded_folds(data_mode, folds, reader_threads)
+        )
+
+        if shuffle:
+            factor = memory_factor if memory_factor is not None else 1
+            data = data.shuffle(
+                buffer_size=batch_size * SHUFFLE_BATCHES * factor
+            )
+
+        if train_mode:
+            data = data.repeat()
+
+        data = data.batch(batch_size).prefetch(self._prefetch)
+        return data.make_one_shot_iterator().get_next()
+
+    def _decoded_folds(self, data_mode, folds, reader_threads):
+        """
+        Returns the decoded features and labels of the given folds as
+        NumPy arrays. With a shared key, folds decoded by any graph of the
+        process are reused. Otherwise, if caching, the ones decoded by this
+        reader (e.g. for training and then validation) are
+        """
+        # Data without folds is identified by its mode
+        keys = [(data_mode, None)] if folds is None \
+            else [(None, f) for f in folds]
+
+        decoded = []
+        for mode, fold in keys:
+            if self._shared_key is not None:
+                decoded.append(_shared_fold(
+                    self._shared_key + (mode, fold),
+                    functools.partial(
+                        self._decode_fold, data_mode, fold, reader_threads
+                    )
+                ))
+            elif self._cache:
+                if (mode, fold) not in self._folds:
+                    self._folds[(mode, fold)] = self._decode_fold(
+                        data_mode, fold, reader_threads
+                    )
+                decoded.append(self._folds[(mode, fold)])
+            else:
+                decoded.append(
+                    self._decode_fold(data_mode, fold, reader_threads)
+                )
+
+        return _concatenate(decoded)
+
+    def _decode_fold(self, data_mode, fold, reader_threads):
+        folds = [fold] if fold is not None else None
+
+        # Separate graph so the caller graph does not keep the decoding ops
+        with tf.Graph().as_default():
+            # Outside train mode every example is read exactly once, as
+            # when evaluating
+            batch_op = DataReader(self._dataset).read_folded_batch(
+                batch_size=DECODE_BATCH,
+                data_mode=data_mode,
+                folds=folds,
+                memory_factor=1,
+                reader_threads=reader_threads or 1,
+                train_mode=False,
+                shuffle=False
+            )
+
+            batches = []
+            with tf.Session(config=self._session_config) as sess:
+                sess.run([
+                    tf.global_variables_initializer(),
+                    tf.local_variables_initializer()
+                ])
+                coord = tf.train.Coordinator()
+                threads = tf.train.start_queue_runners(
+                    coord=coord, sess=sess
+                )
+                try:
+                    while True:
+                        batches.append(sess.run(batch_op))
+                except tf.errors.OutOfRangeError:
+                    pass
+                finally:
+                    coord.request_stop()
+                    coord.join(threads)
+
+        features, labels = _concatenate(batches)
+
+        logger.debug(
+            'Decoded %d examples of fold %s'
+            % (len(labels), fold if fold is not None else data_mode)
+        )
+        return features, labels
+
+
+def _array_dataset(arrays):
+    """
+    Returns a dataset with the examples of the given (features, labels)
+    arrays. They are read through a generator, so graphs only reference
+    the arrays instead of embedding a copy as constants, which would hit
+    the GraphDef size limit for large folds
+    """
+    features, labels = arrays
+
+    def chunks():
+        for start in range(0, len(labels), DECODE_BATCH):
+            end = start + DECODE_BATCH
+            yield _map_arrays(lambda a: a[start:end], features), \
+                labels[start:end]
+
+    def types(a):
+        return tf.as_dtype(a.dtype)
+
+    def shapes(a):
+        return tf.TensorShape([None] + list(a.shape[1:]))
+
+    data = tf.data.Dataset.from_generator(
+        chunks,
+        (_map_arrays(types, features), types(labels)),
+        (_map_arrays(shapes, features), shapes(labels))
+    )
+    return data.flat_map(
+        lambda f, l: tf.data.Dataset.from_tensor_slices((f, l))
+    )
+
+
+def _map_arrays(fn, features):
+    if isinstance(features, dict):
+        return {k: fn(v) for k, v in features.items()}
+    return fn(features)
+
+
+def _concatenate(pairs):
+    """ Joins a list of (features, labels) arrays along the first axis """
+    features = pairs[0][0]
+    if isinstance(features, dict):
+        features = {
+            k: np.concatenate([f[k] for f, _ in pairs]) for k in features
+        }
+    else:
+        features = np.concatenate([f for f, _ in pairs])
+    return features, np.concatenate([l for _, l in pairs])
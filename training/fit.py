@@ -7,13 +7,19 @@ from sklearn.base import BaseEstimator, ClassifierMixin
 from training.run_ops import run_training_epoch, build_run_context, \
                              image_spec_from_params
 from training.predict import predict_fn
-
-from variables import get_all_variables
-from ops import save_model, init_kernel_ops, get_global_step
+from training.data_pipeline import build_reader
+from training.warm_start import warm_start_output
+from training.handoff import capture_weights
+from training.prefix_cache import can_cache_prefix, build_prefix_cache, \
+                                  attach_cache, closing_cache
+
+from variables import get_all_variables, get_checkpoint_variables
+from ops import save_model, init_kernel_ops, \
+                init_landmark_ops, replay_kernel_ops, get_global_step, \
+                get_session_config
 from visualization import write_epoch
 
 from protodata.data_ops import DataMode
-from protodata.reading_ops import DataReader
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +35,7 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
         self._settings_fn = settings_fn
         self._data_location = data_location
         self._aux_saver, self._restore_vars = None, None
+        self._stage_weights = None
 
     def _initialize_fit(self, is_layerwise, **params):
         if is_layerwise:
@@ -44,9 +51,15 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
     def _init_session(self, sess, **params):
         init_kernel_ops(sess)
 
-        # If folder provided, restore variables
+        # If weights or folder provided, restore variables
         restore_folder = params.get('restore_folder')
-        if restore_folder is not None:
+        restore_weights = params.get('restore_weights')
+        if restore_weights is not None:
+            # Handed over in memory by the previous stage
+            restore_weights.load(sess, self._restore_vars)
+            replay_kernel_ops(sess)
+            init_landmark_ops(sess, self._restore_vars)
+        elif restore_folder is not None:
             ckpt = tf.train.get_checkpoint_state(restore_folder)
             if ckpt and ckpt.model_checkpoint_path:
                 logger.debug(
@@ -56,20 +69,25 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
                     )
                 )
                 self._aux_saver.restore(sess, ckpt.model_checkpoint_path)
+                replay_kernel_ops(sess)
             else:
                 raise ValueError('No model found in %s' % restore_folder)
+            init_landmark_ops(sess, self._restore_vars)
         else:
             logger.debug("Starting model from scratch")
+            init_landmark_ops(sess)
 
     def _init_savers(self, step, **params):
-        saver = tf.train.Saver()
-        if params.get('restore_folder', None) is not None:
+        saver = tf.train.Saver(get_checkpoint_variables())
+        if params.get('restore_folder', None) is not None \
+                or params.get('restore_weights', None) is not None:
             self._restore_vars = get_all_variables(
                 params.get('restore_layers'),
                 include_output=False
             )
             self._restore_vars.append(step)
-            self._aux_saver = tf.train.Saver(self._restore_vars)
+            if params.get('restore_folder', None) is not None:
+                self._aux_saver = tf.train.Saver(self._restore_vars)
         return saver
 
     def fit(self, max_epochs, **params):
@@ -82,7 +100,14 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
             if is_layerwise else None
         summary_epochs = params.get('summary_epochs', 1)
 
-        with tf.Graph().as_default() as graph:
+        # Frozen layers are computed once instead of at every step
+        prefix_cache = build_prefix_cache(
+            self._settings_fn,
+            self._data_location,
+            **params
+        ) if can_cache_prefix(**params) else None
+
+        with tf.Graph().as_default() as graph, closing_cache(prefix_cache):
 
             step = get_global_step()
 
@@ -90,7 +115,9 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
                 dataset_location=self._data_location,
                 image_specs=image_spec_from_params(**params)
             )
-            reader = DataReader(dataset)
+            reader = build_reader(
+                dataset, data_location=self._data_location, **params
+            )
 
             # Get training operations
             train_flds = range(dataset.get_fold_num())
@@ -98,6 +125,11 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
                 dataset, reader, DataMode.TRAINING, train_flds, step, **params
             )
 
+            if prefix_cache is not None:
+                context = attach_cache(
+                    context, prefix_cache, train_flds, **params
+                )
+
             # Initialize writers and summaries
             writer = tf.summary.FileWriter(self._folder, graph)
 
@@ -108,7 +140,8 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
             with tf.train.MonitoredTrainingSession(
                     save_checkpoint_secs=None,
                     save_summaries_steps=None,
-                    save_summaries_secs=None) as sess:
+                    save_summaries_secs=None,
+                    config=get_session_config(**params)) as sess:
 
                 self._init_session(sess, **params)
 
@@ -116,6 +149,11 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
                 coord = tf.train.Coordinator()
                 threads = tf.train.start_queue_runners(coord=coord, sess=sess)
 
+                if params.get('output_warm_start') is not None:
+                    warm_start_output(
+                        sess, context, dataset.get_num_classes(), **params
+                    )
+
                 while(True):
 
                     if sess.run(step) >= max_epochs:
@@ -153,13 +191,32 @@ class DeepNetworkTraining(BaseEstimator, ClassifierMixin):
                         switch_epochs = switch_epochs[1:]
 
                 logger.debug('Finished training at step %d' % max_epochs)
-                model_path = save_model(sess, saver, self._folder, max_epochs)
+
+                if params.get('stage_handoff', False):
+                    self._stage_weights = capture_weights(sess)
+
+                model_path = save_model(
+                    sess, saver, self._folder, max_epochs
+                ) if params.get('save_checkpoints', True) else None
 
                 coord.request_stop()
                 coord.join(threads)
 
+        if params.get('replicas') is not None:
+            # Metrics of each replica
+            replicas = run.replicas()
+            return model_path, [r.loss() for r in replicas], \
+                [r.error() for r in replicas], [r.l2() for r in replicas]
+
         return model_path, run.loss(), run.error(), run.l2()
 
+    def stage_weights(self):
+        """
+        Returns the weights at the end of the last fit, if it was run with
+        'stage_handoff'
+        """
+        return self._stage_weights
+
     def predict(self, **params):
         return predict_fn(
             self._settings_fn, self._data_location, self._folder, **params
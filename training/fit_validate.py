@@ -8,14 +8,21 @@ from sklearn.base import BaseEstimator, ClassifierMixin
 from training.run_ops import eval_epoch, run_training_epoch, build_run_context, \
                              image_spec_from_params
 from training.predict import predict_fn
-from validation.early_stop import EarlyStop
-
-from variables import get_all_variables
-from ops import get_global_step, save_model, init_kernel_ops
+from training.data_pipeline import build_reader
+from training.warm_start import warm_start_output
+from training.handoff import capture_weights
+from training.population import check_population
+from training.watchdog import build_watchdog, TrialAborted
+from training.prefix_cache import can_cache_prefix, build_prefix_cache, \
+                                  attach_cache, closing_cache
+from validation.early_stop import EarlyStop, PopulationStop
+
+from variables import get_all_variables, get_checkpoint_variables
+from ops import get_global_step, save_model, init_kernel_ops, \
+                init_landmark_ops, replay_kernel_ops, get_session_config
 from visualization import get_writer, write_epoch, write_scalar
 
 from protodata.data_ops import DataMode
-from protodata.reading_ops import DataReader
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +40,7 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
         self._train_writer, self._val_writer = None, None
         self._epochs = None
         self._aux_saver, self._restore_vars = None, None
+        self._stage_weights = None
 
     def _init_writers(self, graph):
         self._train_writer = get_writer(
@@ -67,10 +75,16 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
     def _init_session(self, sess, **params):
         init_kernel_ops(sess)
 
-        # If folder provided, restore variables
+        # If weights or folder provided, restore variables
         restore_folder = params.get('restore_folder')
-
-        if restore_folder is not None:
+        restore_weights = params.get('restore_weights')
+
+        if restore_weights is not None:
+            # Handed over in memory by the previous stage
+            restore_weights.load(sess, self._restore_vars)
+            replay_kernel_ops(sess)
+            init_landmark_ops(sess, self._restore_vars)
+        elif restore_folder is not None:
             ckpt = tf.train.get_checkpoint_state(restore_folder)
             if ckpt and ckpt.model_checkpoint_path:
                 logger.debug(
@@ -80,21 +94,26 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
                     )
                 )
                 self._aux_saver.restore(sess, ckpt.model_checkpoint_path)
+                replay_kernel_ops(sess)
             else:
                 raise ValueError('No model found in %s' % restore_folder)
+            init_landmark_ops(sess, self._restore_vars)
         else:
             logger.debug("Training model from scratch")
+            init_landmark_ops(sess)
 
     def _init_savers(self, step, **params):
-        saver = tf.train.Saver()
-        if params.get('restore_folder', None) is not None:
+        saver = tf.train.Saver(get_checkpoint_variables())
+        if params.get('restore_folder', None) is not None \
+                or params.get('restore_weights', None) is not None:
             # Note that output layer is randomly initialized, not restored
             self._restore_vars = get_all_variables(
                 params.get('restore_layers'),
                 include_output=False
             )
             self._restore_vars.append(step)
-            self._aux_saver = tf.train.Saver(self._restore_vars)
+            if params.get('restore_folder', None) is not None:
+                self._aux_saver = tf.train.Saver(self._restore_vars)
         return saver
 
     def _should_save(self):
@@ -108,6 +127,31 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
         self._epochs.append(epoch)
         logger.debug('Switching to layer %d' % self._layer_idx)
 
+    def _population_update(self,
+                           sess,
+                           train_context,
+                           early_stop,
+                           train_run,
+                           val_run,
+                           epoch):
+        """
+        Keeps the best weights of each member of the population and freezes
+        the members that stopped. Returns whether all members stopped
+        """
+        improved, stop = early_stop.strip_update(train_run, val_run, epoch)
+
+        if len(improved) > 0:
+            current = capture_weights(sess)
+            for member in improved:
+                self._stage_weights = current \
+                    if self._stage_weights is None \
+                    else self._stage_weights.with_member(current, member)
+
+        train_context.member_mask.load(
+            early_stop.active().astype(np.float32), sess
+        )
+        return stop
+
     def _epoch_summary(self,
                        sess,
                        train_context,
@@ -131,7 +175,7 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
         # Write learning rate
         lr_val = sess.run(train_context.lr_op)
         write_scalar(
-            self._train_writer, 'lr', lr_val, epoch
+            self._train_writer, 'lr', np.mean(lr_val), epoch
         )
 
         # Write epoch statistics
@@ -147,10 +191,22 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
         progress_thresh = params.get('progress_thresh', 0.1)
         max_successive_strips = params.get('max_successive_strips', 3)
         is_layerwise = params.get('layerwise', False)
+        replicas = params.get('replicas', None)
+        halving = params.get('halving', None)
+
+        if replicas is not None:
+            check_population(**params)
 
         self._initialize_training(is_layerwise, **params)
 
-        with tf.Graph().as_default() as graph:
+        # Frozen layers are computed once instead of at every step
+        prefix_cache = build_prefix_cache(
+            self._settings_fn,
+            self._data_location,
+            **params
+        ) if can_cache_prefix(**params) else None
+
+        with tf.Graph().as_default() as graph, closing_cache(prefix_cache):
 
             step = get_global_step()
 
@@ -158,21 +214,40 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
                 dataset_location=self._data_location,
                 image_specs=image_spec_from_params(**params)
             )
-            reader = DataReader(dataset)
+            reader = build_reader(
+                dataset, data_location=self._data_location, **params
+            )
 
             # Get training operations
             train_context = build_run_context(
                 dataset, reader, DataMode.TRAINING, train_folds, step, **params
             )
-            early_stop = EarlyStop(
-                'global', progress_thresh, max_successive_strips
-            )
+            if replicas is not None:
+                # Each member of the population stops on its own
+                early_stop = PopulationStop(
+                    'global', progress_thresh, max_successive_strips, replicas
+                )
+                self._stage_weights = None
+            else:
+                early_stop = EarlyStop(
+                    'global', progress_thresh, max_successive_strips
+                )
 
             # Get validation operations
             val_context = build_run_context(
                 dataset, reader, DataMode.VALIDATION, val_folds, step, True, **params  # noqa
             )
 
+            if prefix_cache is not None:
+                train_context = attach_cache(
+                    train_context, prefix_cache, train_folds, **params
+                )
+                val_context = attach_cache(
+                    val_context, prefix_cache, val_folds, **params
+                )
+
+            watchdog = build_watchdog(dataset.get_num_classes(), **params)
+
             if self._should_save():
                 self._init_writers(graph)
 
@@ -181,7 +256,8 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
             with tf.train.MonitoredTrainingSession(
                     save_checkpoint_secs=None,
                     save_summaries_steps=None,
-                    save_summaries_secs=None) as sess:
+                    save_summaries_secs=None,
+                    config=get_session_config(**params)) as sess:
 
                 self._init_session(sess, **params)
 
@@ -189,16 +265,30 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
                 coord = tf.train.Coordinator()
                 threads = tf.train.start_queue_runners(coord=coord, sess=sess)
 
+                if params.get('output_warm_start') is not None:
+                    warm_start_output(
+                        sess, train_context, dataset.get_num_classes(),
+                        **params
+                    )
+
                 while(True):
 
                     if sess.run(step) >= max_epochs:
                         logger.debug('Max epochs %d reached' % max_epochs)
                         break
 
-                    train_run = run_training_epoch(
-                        sess, train_context, self._layer_idx
+                    try:
+                        train_run = run_training_epoch(
+                            sess, train_context, self._layer_idx, watchdog
+                        )
+                    except TrialAborted:
+                        coord.request_stop()
+                        coord.join(threads)
+                        raise
+                    early_stop.epoch_update(
+                        train_run if replicas is not None
+                        else train_run.error()
                     )
-                    early_stop.epoch_update(train_run.error())
 
                     epoch = train_run.epoch
 
@@ -229,13 +319,31 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
                                 epoch
                             )
 
+                        if replicas is not None:
+                            # Best epochs differ among members, so their
+                            # weights are only kept in memory
+                            if self._population_update(
+                                    sess, train_context, early_stop,
+                                    train_run, val_run, epoch):
+                                break
+                            continue
+
                         is_best, stop, train_errors = early_stop.strip_update(
                             train_run, val_run, epoch
                         )
 
-                        if is_best and self._should_save():
+                        if is_best and params.get('stage_handoff', False):
+                            self._stage_weights = capture_weights(sess)
+
+                        if is_best and self._should_save() \
+                                and params.get('save_checkpoints', True):
                             save_model(sess, saver, self._folder, epoch)
 
+                        if halving is not None and halving.strip_update(
+                                epoch, val_run.error()):
+                            # Worse than most runs that got this far
+                            break
+
                         if stop and is_layerwise:
 
                             self._iterate_layer(epoch, train_errors)
@@ -260,6 +368,14 @@ class DeepNetworkValidation(BaseEstimator, ClassifierMixin):
 
         return best_model
 
+    def stage_weights(self):
+        """
+        Returns the weights of the best model of the last fit, if it was
+        run with 'stage_handoff'. For populations, each member holds the
+        weights of its own best model
+        """
+        return self._stage_weights
+
     def predict(self, **params):
         return predict_fn(
             self._settings_fn, self._data_location, self._folder, **params
@@ -0,0 +1,129 @@
+import tensorflow as tf
+
+import collections
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+DEQUEUE_OPS = [
+    'QueueDequeueMany', 'QueueDequeueManyV2',
+    'QueueDequeueUpTo', 'QueueDequeueUpToV2'
+]
+
+
+FusedLoop = collections.namedtuple(
+    'FusedLoop', ['loop_op', 'layer_op', 'steps_op', 'steps_per_call']
+)
+
+
+def fused_tag(tag):
+    return '_'.join([tag, 'fused'])
+
+
+def build_fused_loop(features, labels, step_fn, steps_per_call):
+    """
+    Wraps step_fn into an in-graph loop so a single session call runs
+    several training steps. step_fn receives a new batch and the position
+    to train and returns the ops of a single step. Ops added to graph
+    collections by step_fn (kernel assign ops, summaries...) are discarded,
+    since they live inside the loop and cannot be run on their own
+    """
+    layer_pl = tf.placeholder(shape=(), dtype=tf.int32)
+    steps_pl = tf.placeholder(shape=(), dtype=tf.int32)
+    dequeue_fn = _dequeue_fn(features, labels)
+
+    def body(i):
+        with _isolated_collections():
+            batch_features, batch_labels = dequeue_fn()
+            step_ops = step_fn(batch_features, batch_labels, layer_pl)
+        with tf.control_dependencies(step_ops):
+            return i + 1
+
+    loop_op = tf.while_loop(
+        lambda i: i < steps_pl,
+        body,
+        [tf.constant(0)],
+        parallel_iterations=1,
+        back_prop=False
+    )
+
+    return FusedLoop(
+        loop_op=loop_op,
+        layer_op=layer_pl,
+        steps_op=steps_pl,
+        steps_per_call=steps_per_call
+    )
+
+
+def run_fused_steps(sess, fused_loop, layer_idx, steps):
+    """
+    Runs the given number of training steps on the layer in as few
+    session calls as the loop allows
+    """
+    done = 0
+    while done < steps:
+        n = min(fused_loop.steps_per_call, steps - done)
+        sess.run(
+            fused_loop.loop_op,
+            feed_dict={fused_loop.layer_op: layer_idx, fused_loop.steps_op: n}
+        )
+        done += n
+
+
+def _dequeue_fn(features, labels):
+    """
+    Returns a function that reads a new batch from the queue the given
+    batch was dequeued from, with the same structure
+    """
+    names = sorted(features.keys()) if isinstance(features, dict) else None
+    flat = [features[n] for n in names] if names is not None else [features]
+    flat.append(labels)
+
+    op = labels.op
+    if op.type not in DEQUEUE_OPS or any(t.op is not op for t in flat):
+        raise ValueError(
+            'Fused steps need batches read directly from a queue, got %s'
+            % op.type
+        )
+
+    queue = tf.QueueBase(
+        dtypes=[t.dtype for t in op.outputs],
+        shapes=None,
+        names=None,
+        queue_ref=op.inputs[0]
+    )
+
+    def dequeue():
+        if op.type.startswith('QueueDequeueUpTo'):
+            outputs = queue.dequeue_up_to(op.inputs[1])
+        else:
+            outputs = queue.dequeue_many(op.inputs[1])
+
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+
+        batch = []
+        for t in flat:
+            output = outputs[t.value_index]
+            output.set_shape(t.get_shape())
+            batch.append(output)
+
+        if names is None:
+            return batch[0], batch[1]
+        return dict(zip(names, batch[:-1])), batch[-1]
+
+    return dequeue
+
+
+@contextlib.contextmanager
+def _isolated_collections():
+    graph = tf.get_default_graph()
+    before = {
+        key: list(graph.get_collection(key))
+        for key in graph.get_all_collection_keys()
+    }
+    yield
+    for key in graph.get_all_collection_keys():
+        graph.get_collection_ref(key)[:] = before.get(key, [])
@@ -0,0 +1,91 @@
+import tensorflow as tf
+import numpy as np
+
+import logging
+
+from variables import get_checkpoint_variables
+
+logger = logging.getLogger(__name__)
+
+
+class StageWeights(object):
+    """
+    Values of the checkpoint variables of a trained stage kept in memory,
+    so the next stage can start from them without a checkpoint round-trip
+    """
+
+    def __init__(self, values):
+        self._values = values
+
+    def load(self, sess, variables):
+        """
+        Feeds the stored values into the initializers of the given
+        variables of the current graph, matched by name
+        """
+        for var in variables:
+            name = var.op.name
+            if name not in self._values:
+                raise ValueError('No value stored for variable %s' % name)
+            var.load(self._values[name], sess)
+        logger.debug('Loaded {} from memory'.format(variables))
+
+    def save(self, path):
+        """ Stores the values in a NumPy archive """
+        np.savez(path, **self._values)
+
+    @staticmethod
+    def from_file(path):
+        """ Returns the values stored with save """
+        with np.load(path) as archive:
+            return StageWeights({
+                name: archive[name] for name in archive.files
+            })
+
+    @staticmethod
+    def from_checkpoint(folder):
+        """
+        Returns the values stored in the latest checkpoint of the folder or
+        None if there is no checkpoint
+        """
+        path = tf.train.latest_checkpoint(folder)
+        if path is None:
+            return None
+        reader = tf.train.NewCheckpointReader(path)
+        return StageWeights({
+            name: reader.get_tensor(name)
+            for name in reader.get_variable_to_shape_map()
+        })
+
+    def with_member(self, other, member):
+        """
+        Returns a copy where the given replica of a replicated network takes
+        its values from other. Variables without replica axis are kept
+        """
+        values = {}
+        for name, value in self._values.items():
+            if np.ndim(value) > 0:
+                value = value.copy()
+                value[member] = other._values[name][member]
+            values[name] = value
+        return StageWeights(values)
+
+    def select(self, members):
+        """
+        Returns the values of the given replicas of a replicated network
+        """
+        return StageWeights({
+            name: value[members] if np.ndim(value) > 0 else value
+            for name, value in self._values.items()
+        })
+
+
+def capture_weights(sess):
+    """
+    Returns the current values of the variables that would be stored in
+    a checkpoint
+    """
+    variables = get_checkpoint_variables()
+    values = sess.run(variables)
+    return StageWeights(
+        {var.op.name: value for var, value in zip(variables, values)}
+    )
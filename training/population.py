@@ -0,0 +1,141 @@
+import tensorflow as tf
+
+import logging
+
+from layout.replicated import check_replicated
+
+logger = logging.getLogger(__name__)
+
+
+# Hyperparameters that may differ among the members of a population, since
+# they do not change the shapes of the graph
+POPULATION_PARAMS = ['lr', 'lr_decay', 'l2_ratio', 'kernel_std']
+
+
+def build_member_mask(replicas):
+    """
+    Returns a local variable with a one for each member still training and
+    a zero for those already stopped
+    """
+    return tf.Variable(
+        tf.ones([replicas]),
+        name='active_members',
+        trainable=False,
+        collections=[tf.GraphKeys.LOCAL_VARIABLES]
+    )
+
+
+class PopulationAdamOptimizer(tf.train.Optimizer):
+    """
+    Adam optimizer for replicated networks where each member has its own
+    learning rate, given as a vector broadcast along the leading replica
+    axis of the variables. Members whose mask entry is zero keep their
+    weights unchanged. Steps are counted per variable, so layers trained
+    at different times get their own bias correction
+    """
+
+    def __init__(self,
+                 learning_rate,
+                 member_mask,
+                 beta1=0.9,
+                 beta2=0.999,
+                 epsilon=1e-8,
+                 name='PopulationAdam'):
+        super(PopulationAdamOptimizer, self).__init__(False, name)
+        self._lr = learning_rate
+        self._mask = member_mask
+        self._beta1 = beta1
+        self._beta2 = beta2
+        self._epsilon = epsilon
+
+    def _create_slots(self, var_list):
+        for v in var_list:
+            self._zeros_slot(v, 'm', self._name)
+            self._zeros_slot(v, 'v', self._name)
+            self._get_or_make_slot(
+                v, tf.constant(0.0, dtype=v.dtype.base_dtype), 't', self._name
+            )
+
+    def _apply_dense(self, grad, var):
+        dtype = var.dtype.base_dtype
+        m = self.get_slot(var, 'm')
+        v = self.get_slot(var, 'v')
+        t = tf.assign_add(self.get_slot(var, 't'), 1.0)
+
+        m_t = tf.assign(m, self._beta1 * m + (1 - self._beta1) * grad)
+        v_t = tf.assign(
+            v, self._beta2 * v + (1 - self._beta2) * tf.square(grad)
+        )
+
+        # Learning rate and mask of each member
+        ndims = var.get_shape().ndims
+        lr = tf.reshape(
+            tf.cast(self._lr, dtype) * self._mask, [-1] + [1] * (ndims - 1)
+        )
+        lr_t = lr * tf.sqrt(1 - tf.pow(self._beta2, t)) \
+            / (1 - tf.pow(self._beta1, t))
+
+        update = tf.assign_sub(
+            var, lr_t * m_t / (tf.sqrt(v_t) + self._epsilon)
+        )
+        return tf.group(update, m_t, v_t)
+
+    def _apply_sparse(self, grad, var):
+        raise NotImplementedError(
+            'Sparse gradients are not supported by populations'
+        )
+
+
+def check_population(**params):
+    """
+    Raises an error if the parameters cannot be trained as a member of a
+    population
+    """
+    check_replicated(**params)
+
+    if params.get('layerwise', False):
+        # Members would need to switch layers at different epochs
+        raise ValueError('Populations cannot be trained layerwise')
+
+    if params.get('watchdog', False):
+        # A diverging member would abort the whole population
+        raise ValueError('Populations cannot be watched')
+
+
+def merge_population_params(members):
+    """
+    Returns the parameters of a population whose members share all
+    parameters but POPULATION_PARAMS, which become lists with the value of
+    each member
+    """
+    params = members[0].copy()
+    for name in POPULATION_PARAMS:
+        if name in params:
+            params[name] = [member[name] for member in members]
+    params['replicas'] = len(members)
+    return params
+
+
+def select_members(params, members):
+    """
+    Returns the parameters of the population formed by the given members
+    """
+    selected = params.copy()
+    for name in POPULATION_PARAMS:
+        if isinstance(selected.get(name, None), list):
+            selected[name] = [selected[name][i] for i in members]
+    selected['replicas'] = len(members)
+    return selected
+
+
+def population_shape_key(params):
+    """
+    Returns a key identifying the graph shape of the given trial
+    parameters, so trials with equal keys can be trained together. Unset
+    population parameters (e.g. no L2 term) change the graph as well
+    """
+    return repr(sorted(
+        (k, v) if k not in POPULATION_PARAMS else (k, v is None)
+        for k, v in params.items()
+    ))
+
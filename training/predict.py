@@ -1,12 +1,14 @@
 import tensorflow as tf
 import logging
 
-from ops import get_global_step
+from ops import get_global_step, init_kernel_ops, replay_kernel_ops, \
+                get_session_config
+from variables import get_checkpoint_variables
 from visualization import get_writer
+from training.data_pipeline import build_reader
 from training.run_ops import build_run_context, test_step, RunStatus, \
                              image_spec_from_params
 from protodata.data_ops import DataMode
-from protodata.reading_ops import DataReader
 
 
 logger = logging.getLogger(__name__)
@@ -24,7 +26,9 @@ def predict_fn(data_settings_fn, data_location, folder, **params):
             dataset_location=data_location,
             image_specs=image_spec_from_params(**params)
         )
-        reader = DataReader(dataset)
+        reader = build_reader(
+            dataset, data_location=data_location, **params
+        )
 
         test_context = build_run_context(
             dataset=dataset,
@@ -38,12 +42,16 @@ def predict_fn(data_settings_fn, data_location, folder, **params):
         if store_summaries:
             writer = get_writer(graph, folder, DataMode.TEST)
 
-        saver = tf.train.Saver()
+        saver = tf.train.Saver(get_checkpoint_variables())
 
         with tf.train.MonitoredTrainingSession(
                 save_checkpoint_secs=None,
                 save_summaries_steps=None,
-                save_summaries_secs=None) as sess:
+                save_summaries_secs=None,
+                config=get_session_config(**params)) as sess:
+
+            # Seeded kernel matrices are not in the checkpoint
+            init_kernel_ops(sess)
 
             ckpt = tf.train.get_checkpoint_state(folder)
             if ckpt and ckpt.model_checkpoint_path:
@@ -55,6 +63,7 @@ def predict_fn(data_settings_fn, data_location, folder, **params):
                     )
                 )
                 saver.restore(sess, ckpt.model_checkpoint_path)
+                replay_kernel_ops(sess)
             else:
                 raise ValueError('No model found in %s' % folder)
 
@@ -85,4 +94,13 @@ def predict_fn(data_settings_fn, data_location, folder, **params):
             coord.request_stop()
             coord.join(threads)
 
+    if params.get('replicas') is not None:
+        # Metrics of each replica
+        replicas = status.replicas()
+        return {
+            'loss': [r.loss() for r in replicas],
+            'l2': [r.l2() for r in replicas],
+            'error': [r.error() for r in replicas]
+        }
+
     return {'loss': status.loss(), 'l2': status.l2(), 'error': status.error()}
@@ -0,0 +1,279 @@
+import tensorflow as tf
+import numpy as np
+
+import contextlib
+import os
+import shutil
+import tempfile
+import logging
+
+from layout import kernel_example_layout_fn, example_layout_fn
+from layout.base import layer_outputs_key
+from ops import get_kernel_assign_ops_list, init_kernel_ops, \
+                replay_kernel_ops, get_session_config
+from variables import get_all_variables
+from training.run_ops import image_spec_from_params
+from training.data_pipeline import build_reader
+
+from protodata.data_ops import DataMode
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_TAG = 'prefix_cache'
+
+
+def can_cache_prefix(**params):
+    """
+    Whether the outputs of the layers below the trained one are frozen,
+    so they can be computed once and reused in every epoch
+    """
+    layer = params.get('train_only', 0)
+    network_fn = params.get('network_fn', kernel_example_layout_fn)
+
+    if not params.get('cache_prefix', False):
+        return False
+    elif network_fn not in [kernel_example_layout_fn, example_layout_fn]:
+        # Only fully connected layouts record their layer outputs
+        return False
+    elif layer <= 1 or params.get('num_layers') != layer:
+        # Nothing below or layers other than the last one are trained
+        return False
+    elif params.get('layerwise', False) \
+            or params.get('switch_epochs') is not None:
+        # Lower layers are trained at some point
+        return False
+    elif params.get('batch_norm', False) \
+            or params.get('fc_dropout_keep_prob') is not None:
+        # Outputs depend on the batch or change between steps
+        logger.debug('Prefix cache disabled due to batch norm or dropout')
+        return False
+    else:
+        return True
+
+
+class PrefixCache(object):
+    """
+    Outputs of the frozen layers and labels for each fold, either in memory
+    or memory-mapped in disk
+    """
+
+    def __init__(self, activations, labels, folder=None):
+        self._activations = activations
+        self._labels = labels
+        self._folder = folder
+
+    def get(self, folds):
+        activations = [self._activations[f] for f in folds]
+        labels = [self._labels[f] for f in folds]
+        return activations, labels
+
+    def close(self):
+        self._activations, self._labels = None, None
+        if self._folder is not None:
+            shutil.rmtree(self._folder)
+
+
+class CachedFeeder(object):
+    """
+    Produces feed dictionaries that replace the output of the frozen layers
+    and the labels by shuffled batches from the cache
+    """
+
+    def __init__(self, cache, folds, batch_size, prefix_op, labels_op):
+        activations, labels = cache.get(folds)
+        # Rows are numbered across folds so memory-maps are not copied
+        self._offsets = np.cumsum([0] + [len(x) for x in activations])
+        self._activations, self._labels = activations, labels
+        self._batch_size = batch_size
+        self._prefix_op, self._labels_op = prefix_op, labels_op
+        self._order, self._pos = None, 0
+        self._shuffle()
+
+    def _shuffle(self):
+        self._order = np.random.permutation(self._offsets[-1])
+        self._pos = 0
+
+    def next_feed(self):
+        if self._pos + self._batch_size > len(self._order):
+            self._shuffle()
+
+        rows = self._order[self._pos:self._pos + self._batch_size]
+        self._pos += self._batch_size
+        folds = np.searchsorted(self._offsets, rows, side='right') - 1
+
+        return {
+            self._prefix_op: self._gather(self._activations, folds, rows),
+            self._labels_op: self._gather(self._labels, folds, rows)
+        }
+
+    def _gather(self, arrays, folds, rows):
+        """ Returns the given rows, reading those of each fold at once """
+        batch = np.empty(
+            (len(rows),) + arrays[0].shape[1:], dtype=arrays[0].dtype
+        )
+        for fold in np.unique(folds):
+            selected = folds == fold
+            fold_rows = rows[selected] - self._offsets[fold]
+            batch[selected] = arrays[fold][fold_rows]
+        return batch
+
+
+def attach_cache(context, cache, folds, **params):
+    """
+    Returns the run context fed from the cache of the given folds
+    """
+    # Output of the layer right below the trained one
+    prefix_op = context.layer_outputs[params.get('train_only') - 2]
+    feeder = CachedFeeder(
+        cache, folds, params.get('batch_size'), prefix_op, context.labels_op
+    )
+    return context._replace(feeder=feeder)
+
+
+@contextlib.contextmanager
+def closing_cache(cache):
+    """ Closes the prefix cache, if any, however the block exits """
+    try:
+        yield cache
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def build_prefix_cache(settings_fn,
+                       data_location,
+                       restore_folder=None,
+                       restore_weights=None,
+                       **params):
+    """
+    Runs the layers below the trained one once over every fold using the
+    weights handed over in memory or, if not given, stored in
+    restore_folder. If 'prefix_cache_dir' is given, the outputs are
+    memory-mapped into a temporary folder inside it
+    """
+    layer = params.get('train_only')
+    batch_size = params.get('batch_size')
+    network_fn = params.get('network_fn', kernel_example_layout_fn)
+    network_params = params.copy()
+    network_params.update({'num_layers': layer - 1})
+
+    cache_dir = params.get('prefix_cache_dir', None)
+    folder = tempfile.mkdtemp(dir=cache_dir) \
+        if cache_dir is not None else None
+
+    activations, labels = {}, {}
+
+    with tf.Graph().as_default():
+
+        dataset = settings_fn(
+            dataset_location=data_location,
+            image_specs=image_spec_from_params(**params)
+        )
+        reader = build_reader(
+            dataset, data_location=data_location, **params
+        )
+        fold_size = dataset.get_fold_size()
+        fold_ops = {}
+
+        for fold in range(dataset.get_fold_num()):
+
+            features, fold_labels = reader.read_folded_batch(
+                batch_size=batch_size,
+                data_mode=DataMode.TRAINING,
+                folds=[fold],
+                memory_factor=params.get('memory_factor'),
+                reader_threads=params.get('n_threads'),
+                train_mode=False,
+                shuffle=False
+            )
+
+            tag = '_'.join([CACHE_TAG, str(fold)])
+            with tf.variable_scope('network', reuse=fold > 0):
+                network_fn(
+                    features,
+                    dataset,
+                    tag=tag,
+                    is_training=False,
+                    **network_params
+                )
+
+                # Needed to rebuild seeded kernels modified by dropout
+                if fold == 0 and params.get('kernel_seed') is not None \
+                        and params.get('kernel_dropout_rate') is not None:
+                    get_kernel_assign_ops_list(**network_params)
+
+            prefix_op = tf.get_collection(layer_outputs_key(tag))[-1]
+            fold_ops[fold] = (prefix_op, fold_labels)
+
+        restore_vars = get_all_variables(range(1, layer), include_output=False)
+        saver = tf.train.Saver(restore_vars)
+
+        with tf.train.MonitoredTrainingSession(
+                save_checkpoint_secs=None,
+                save_summaries_steps=None,
+                save_summaries_secs=None,
+                config=get_session_config(**params)) as sess:
+
+            init_kernel_ops(sess)
+            ckpt = tf.train.get_checkpoint_state(restore_folder) \
+                if restore_weights is None else None
+            if restore_weights is not None:
+                restore_weights.load(sess, restore_vars)
+                replay_kernel_ops(sess)
+            elif ckpt and ckpt.model_checkpoint_path:
+                saver.restore(sess, ckpt.model_checkpoint_path)
+                replay_kernel_ops(sess)
+            else:
+                raise ValueError('No model found in %s' % restore_folder)
+
+            coord = tf.train.Coordinator()
+            threads = tf.train.start_queue_runners(coord=coord, sess=sess)
+
+            for fold, ops in fold_ops.items():
+                stored_acts, stored_labels, n = None, None, 0
+                while n < fold_size:
+                    try:
+                        batch_acts, batch_labels = sess.run(ops)
+                    except tf.errors.OutOfRangeError:
+                        break
+
+                    if stored_acts is None:
+                        stored_acts = _allocate(
+                            folder, 'activations_%d' % fold,
+                            batch_acts, fold_size
+                        )
+                        stored_labels = _allocate(
+                            folder, 'labels_%d' % fold,
+                            batch_labels, fold_size
+                        )
+
+                    # Write batches directly into the (mapped) storage
+                    size = min(len(batch_acts), fold_size - n)
+                    stored_acts[n:n + size] = batch_acts[:size]
+                    stored_labels[n:n + size] = batch_labels[:size]
+                    n += size
+
+                activations[fold] = stored_acts[:n]
+                labels[fold] = stored_labels[:n]
+                logger.debug(
+                    'Cached %d outputs of layer %d for fold %d'
+                    % (len(labels[fold]), layer - 1, fold)
+                )
+
+            coord.request_stop()
+            coord.join(threads)
+
+    return PrefixCache(activations, labels, folder)
+
+
+def _allocate(folder, name, batch, rows):
+    shape = (rows,) + batch.shape[1:]
+    if folder is None:
+        return np.empty(shape, dtype=batch.dtype)
+    return np.lib.format.open_memmap(
+        os.path.join(folder, name + '.npy'),
+        mode='w+',
+        dtype=batch.dtype,
+        shape=shape
+    )
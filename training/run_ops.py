@@ -5,8 +5,15 @@ import logging
 import collections
 
 from layout import kernel_example_layout_fn
+from layout.base import layer_outputs_key
+from layout.replicated import member_values
 from ops import get_model_weights, loss_ops_list, get_accuracy_op, \
-                train_ops_list, get_l2_ops_list, get_kernel_assign_ops_list
+                train_ops_list, get_l2_ops_list, get_kernel_assign_ops_list, \
+                apply_layer_gradients
+from variables import get_trainable_params
+from training.fused import build_fused_loop, run_fused_steps, fused_tag
+from training.data_pipeline import QUEUE_PIPELINE
+from training.population import build_member_mask, PopulationAdamOptimizer
 
 from protodata.data_ops import DataMode
 from protodata.image_ops import DataSpec
@@ -19,11 +26,17 @@ RunContext = collections.namedtuple(
     [
         'logits_op', 'train_ops', 'loss_ops', 'acc_op', 'step_op',
         'steps_per_epoch', 'l2_ops', 'lr_op', 'summary_op',
-        'kernel_assign_ops', 'is_training_op'
+        'kernel_assign_ops', 'is_training_op', 'layer_outputs', 'labels_op',
+        'feeder', 'metric_ops', 'fused_loop', 'member_mask'
     ]
 )
 
 
+MetricOps = collections.namedtuple(
+    'MetricOps', ['update_ops', 'mean_ops', 'reset_op', 'accumulators']
+)
+
+
 class RunStatus(object):
 
     def __init__(self, loss=None, acc=None, l2=None):
@@ -52,6 +65,21 @@ class RunStatus(object):
     def error(self):
         return 1 - np.mean(self._acc)
 
+    def replicas(self):
+        """
+        Returns the status of each replica of a replicated network, whose
+        updates hold one value per replica
+        """
+        n_replicas = len(np.atleast_1d(self._acc[0]))
+        return [
+            RunStatus(
+                loss=[np.atleast_1d(x)[i] for x in self._loss],
+                acc=[np.atleast_1d(x)[i] for x in self._acc],
+                l2=[np.broadcast_to(x, n_replicas)[i] for x in self._l2]
+            )
+            for i in range(n_replicas)
+        ]
+
 
 def run_training_epoch_debug_weights(sess, context, layer_idx, num_layers):
     status = RunStatus()
@@ -141,22 +169,45 @@ def run_training_epoch_debug_l2(sess, context, layer_idx, num_layers):
     return status
 
 
-def run_training_epoch(sess, context, layer_idx):
+def run_training_epoch(sess, context, layer_idx, watchdog=None):
+    """
+    Trains the layer for an epoch and returns its metrics. If a watchdog
+    is given, the running loss is checked while the epoch goes on
+    """
     status = RunStatus()
 
     logger.debug('Running training epoch on {} layer'.format(layer_idx))
 
-    for i in range(context.steps_per_epoch):
-        _, loss, acc, l2 = sess.run(
-            [
-                context.train_ops[layer_idx],
-                context.loss_ops[layer_idx],
-                context.acc_op,
-                context.l2_ops[layer_idx]
-            ],
-            feed_dict={context.is_training_op: True}
+    if watchdog is not None:
+        watchdog.check_aborted()
+
+    sess.run(context.metric_ops.reset_op)
+    if context.fused_loop is not None and context.feeder is None:
+        run_fused_steps(
+            sess, context.fused_loop, layer_idx, context.steps_per_epoch
         )
-        status.update(loss, acc, l2)
+    else:
+        for i in range(context.steps_per_epoch):
+            sess.run(
+                [
+                    context.train_ops[layer_idx],
+                    context.metric_ops.update_ops[layer_idx]
+                ],
+                feed_dict=_feed_dict(context, True)
+            )
+
+            if watchdog is None:
+                continue
+
+            # Other runs of the trial may have been aborted meanwhile
+            watchdog.check_aborted()
+            if (i + 1) % watchdog.check_steps == 0:
+                watchdog.check_loss(sess.run(context.metric_ops.mean_ops[0]))
+    status.update(*sess.run(context.metric_ops.mean_ops))
+
+    if watchdog is not None:
+        watchdog.check_loss(status.loss())
+        watchdog.epoch_update(status.error())
 
     if context.kernel_assign_ops is not None:
         logger.info("Kernel dropout in %d layer" % layer_idx)
@@ -172,21 +223,25 @@ def run_training_epoch(sess, context, layer_idx):
 def eval_epoch(sess, context, layer_idx):
     status = RunStatus()
 
+    sess.run(context.metric_ops.reset_op)
     for _ in range(context.steps_per_epoch):
-        loss, acc, l2 = sess.run(
-            [
-                context.loss_ops[layer_idx],
-                context.acc_op,
-                context.l2_ops[layer_idx]
-            ],
-            feed_dict={context.is_training_op: False}
+        sess.run(
+            context.metric_ops.update_ops[layer_idx],
+            feed_dict=_feed_dict(context, False)
         )
-
-        status.update(loss, acc, l2)
+    status.update(*sess.run(context.metric_ops.mean_ops))
 
     return status
 
 
+def _feed_dict(context, is_training):
+    feed_dict = {context.is_training_op: is_training}
+    if context.feeder is not None:
+        # Cached inputs replace the ones computed from the queues
+        feed_dict.update(context.feeder.next_feed())
+    return feed_dict
+
+
 def test_step(sess, test_context):
     return sess.run([
         test_context.loss_ops[0],
@@ -196,6 +251,58 @@ def test_step(sess, test_context):
     feed_dict={test_context.is_training_op: False})
 
 
+def build_metric_ops(loss_ops, acc_op, l2_ops):
+    """
+    Returns in-graph accumulators of the loss, accuracy and L2 terms so
+    steps do not need to fetch them. The ith update op accumulates the
+    values of the ith loss and L2 positions and the mean ops return the
+    averages since the last reset
+    """
+    with tf.name_scope('metrics'):
+        # Replicated networks keep one value per replica
+        loss_sum = _accumulator('loss_sum', loss_ops[0].get_shape())
+        acc_sum = _accumulator('acc_sum', acc_op.get_shape())
+        l2_sum = _accumulator('l2_sum', l2_ops[0].get_shape())
+        count = _accumulator('count', [])
+
+        accumulators = [loss_sum, acc_sum, l2_sum, count]
+
+        update_ops = [
+            accumulate_metrics(accumulators, loss_op, acc_op, l2_op)
+            for loss_op, l2_op in zip(loss_ops, l2_ops)
+        ]
+
+        mean_ops = [loss_sum / count, acc_sum / count, l2_sum / count]
+        reset_op = tf.variables_initializer(accumulators)
+
+    return MetricOps(
+        update_ops=update_ops,
+        mean_ops=mean_ops,
+        reset_op=reset_op,
+        accumulators=accumulators
+    )
+
+
+def accumulate_metrics(accumulators, loss_op, acc_op, l2_op):
+    loss_sum, acc_sum, l2_sum, count = accumulators
+    return tf.group(
+        tf.assign_add(loss_sum, loss_op),
+        tf.assign_add(acc_sum, acc_op),
+        tf.assign_add(l2_sum, l2_op),
+        tf.assign_add(count, 1.0)
+    )
+
+
+def _accumulator(name, shape):
+    # Local so they are neither checkpointed nor restored
+    return tf.Variable(
+        tf.zeros(shape),
+        name=name,
+        trainable=False,
+        collections=[tf.GraphKeys.LOCAL_VARIABLES]
+    )
+
+
 def build_run_context(dataset,
                       reader,
                       tag,
@@ -212,6 +319,10 @@ def build_run_context(dataset,
     n_threads = params.get('n_threads')
     n_layers = params.get('num_layers')
 
+    if params.get('replicas') is not None:
+        # Learning rates may differ among replicas
+        lr, lr_decay = member_values(lr, 1), member_values(lr_decay, 1)
+
     if folds is not None:
         fold_size = dataset.get_fold_size()
         steps_per_epoch = int(fold_size * len(folds) / batch_size)
@@ -233,7 +344,8 @@ def build_run_context(dataset,
     scope_params = {'reuse': reuse}
     with tf.variable_scope("network", **scope_params):
 
-        is_training_pl = tf.placeholder(shape=(), dtype=tf.bool)
+        # Defaults to inference so kernel initialization needs no feed
+        is_training_pl = tf.placeholder_with_default(False, shape=())
 
         logits = network_fn(features,
                             dataset,
@@ -241,11 +353,13 @@ def build_run_context(dataset,
                             is_training=is_training_pl,
                             **params)
 
+        l2_ops = get_l2_ops_list(**params)
         loss_ops = loss_ops_list(
             logits=logits,
             y=labels,
             sum_collection=tag,
             n_classes=dataset.get_num_classes(),
+            l2_ops=l2_ops,
             **params
         )
 
@@ -267,13 +381,28 @@ def build_run_context(dataset,
                 staircase=True
             )
 
-            train_ops = train_ops_list(lr_op, loss_ops, n_layers, tag)
+            if params.get('replicas') is not None:
+                # Each replica may have its own learning rate and stop
+                member_mask = build_member_mask(params.get('replicas'))
+                optimizer = PopulationAdamOptimizer(lr_op, member_mask)
+            else:
+                member_mask = None
+                optimizer = tf.train.AdamOptimizer(learning_rate=lr_op)
+            train_ops = train_ops_list(
+                lr_op, loss_ops, n_layers, tag, optimizer=optimizer
+            )
             kernel_assign_ops = get_kernel_assign_ops_list(**params) \
                 if params.get('kernel_dropout_rate', None) is not None \
                 else None
+        elif tag == DataMode.TEST and _replays_kernel_dropout(**params):
+            # Needed to rebuild seeded kernels modified by kernel dropout
+            train_ops, lr_op, step_op = None, None, None
+            kernel_assign_ops = get_kernel_assign_ops_list(**params)
+            member_mask = None
         else:
             train_ops, lr_op, step_op = None, None, None
             kernel_assign_ops = None
+            member_mask = None
 
         # Evaluate model
         accuracy_op = get_accuracy_op(
@@ -282,6 +411,34 @@ def build_run_context(dataset,
 
         summary_op = tf.summary.merge_all(tag)
 
+        metric_ops = build_metric_ops(loss_ops, accuracy_op, l2_ops)
+
+        steps_per_call = params.get('steps_per_call', 1) \
+            if tag == DataMode.TRAINING else 1
+        if steps_per_call > 1 and params.get(
+                'input_pipeline', QUEUE_PIPELINE) != QUEUE_PIPELINE:
+            # The loop dequeues its own batches from the reader queue
+            logger.warning(
+                'Fused steps need the queue pipeline, running one step '
+                'per call'
+            )
+            steps_per_call = 1
+
+        if steps_per_call > 1:
+            # Reuses the variables and optimizer slots built above
+            with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+                fused_loop = build_fused_loop(
+                    features,
+                    labels,
+                    _fused_step_fn(
+                        dataset, optimizer, metric_ops.accumulators, tag,
+                        **params
+                    ),
+                    min(steps_per_call, steps_per_epoch)
+                )
+        else:
+            fused_loop = None
+
     return RunContext(
         logits_op=logits,
         train_ops=train_ops,
@@ -290,13 +447,93 @@ def build_run_context(dataset,
         acc_op=accuracy_op,
         steps_per_epoch=steps_per_epoch,
         summary_op=summary_op,
-        l2_ops=get_l2_ops_list(**params),
+        l2_ops=l2_ops,
         step_op=step_op,
         kernel_assign_ops=kernel_assign_ops,
-        is_training_op=is_training_pl
+        is_training_op=is_training_pl,
+        layer_outputs=tf.get_collection(layer_outputs_key(tag)),
+        labels_op=labels,
+        feeder=None,
+        metric_ops=metric_ops,
+        fused_loop=fused_loop,
+        member_mask=member_mask
     )
 
 
+def _fused_step_fn(dataset, optimizer, accumulators, tag, **params):
+    """
+    Returns a function that builds a training step of the layer given by
+    a tensor, for the in-graph loop. Kernel dropout and the epoch counter
+    are left out, as they only change between epochs
+    """
+    network_fn = params.get('network_fn', kernel_example_layout_fn)
+    n_layers = params.get('num_layers')
+    n_classes = dataset.get_num_classes()
+
+    def step_fn(features, labels, layer_op):
+        # Moving averages of the step (e.g. batch norm), not the outer ones
+        n_updates = len(tf.get_collection(tf.GraphKeys.UPDATE_OPS))
+        logits = network_fn(features,
+                            dataset,
+                            tag=fused_tag(tag),
+                            is_training=True,
+                            **params)
+
+        l2_ops = get_l2_ops_list(**params)
+        loss_ops = loss_ops_list(
+            logits=logits,
+            y=labels,
+            sum_collection=tag,
+            n_classes=n_classes,
+            l2_ops=l2_ops,
+            **params
+        )
+
+        update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)[n_updates:]
+
+        def apply_fn(layer_idx):
+            # Gradients are built in the branch, as tensors captured by the
+            # case would run for every position, including frozen layers
+            def fn():
+                var_list = tf.trainable_variables() if layer_idx == 0 \
+                    else get_trainable_params([layer_idx], True)
+                with tf.control_dependencies(update_ops):
+                    grads = optimizer.compute_gradients(
+                        tf.reduce_sum(loss_ops[0]), var_list=var_list
+                    )
+                    apply_op = apply_layer_gradients(
+                        optimizer, grads, layer_idx
+                    )
+                with tf.control_dependencies([apply_op]):
+                    return tf.constant(0)
+            return fn
+
+        train_op = tf.case(
+            [
+                (tf.equal(layer_op, i), apply_fn(i))
+                for i in range(1, n_layers + 1)
+            ],
+            default=apply_fn(0),
+            exclusive=True
+        )
+
+        metrics_op = accumulate_metrics(
+            accumulators,
+            tf.gather(tf.stack(loss_ops), layer_op),
+            get_accuracy_op(logits, labels, n_classes),
+            tf.gather(tf.stack(l2_ops), layer_op)
+        )
+
+        return [train_op, metrics_op]
+
+    return step_fn
+
+
+def _replays_kernel_dropout(**params):
+    return params.get('kernel_seed', None) is not None \
+        and params.get('kernel_dropout_rate', None) is not None
+
+
 def image_spec_from_params(**params):
     if 'image_specs' not in params:
         return None
@@ -0,0 +1,111 @@
+import numpy as np
+import logging
+
+from training.run_ops import _feed_dict
+from variables import get_output_variables
+
+logger = logging.getLogger(__name__)
+
+
+def warm_start_output(sess, context, n_classes, **params):
+    """
+    Solves the output layer in closed form over the features of the last
+    hidden layer, streaming one epoch of training batches per pass and
+    accumulating the D x D Gram matrix. Modes ('output_warm_start'):
+        - 'ridge': ridge regression onto {-1, 1} (binary) or one-hot targets
+        - 'irls': L2-regularized logistic regression by Newton (IRLS)
+          steps, one pass each. Multiclass problems fall back to ridge
+    """
+    mode = params.get('output_warm_start')
+    l2_ratio = params.get('l2_ratio', None) or 0.0
+
+    if len(context.layer_outputs) == 0:
+        raise ValueError('Warm start needs a fully connected layout')
+    features_op = context.layer_outputs[-1]
+
+    weights, biases = get_output_variables()
+
+    if mode == 'irls' and n_classes == 2:
+        w = _irls(
+            sess, context, features_op, l2_ratio,
+            params.get('warm_start_iterations', 5)
+        )
+    elif mode in ['ridge', 'irls']:
+        w = _ridge(sess, context, features_op, n_classes, l2_ratio)
+    else:
+        raise ValueError('Unknown warm start mode %s' % mode)
+
+    weights.load(w[:-1], sess)
+    biases.load(w[-1], sess)
+    logger.debug('Output layer warm started using %s' % mode)
+
+
+def _batches(sess, context, features_op):
+    """
+    Yields one epoch of (features with a bias column, labels) batches
+    """
+    for _ in range(context.steps_per_epoch):
+        z, y = sess.run(
+            [features_op, context.labels_op],
+            feed_dict=_feed_dict(context, False)
+        )
+        z = np.reshape(z, [z.shape[0], -1])
+        yield np.hstack([z, np.ones((z.shape[0], 1))]), np.ravel(y)
+
+
+def _regularizer(dims, l2_ratio, n):
+    # Matches l2_ratio * l2_loss(w) over a mean loss. Bias is not penalized
+    reg = np.eye(dims) * l2_ratio * n
+    reg[-1, -1] = 0.0
+    return reg
+
+
+def _ridge(sess, context, features_op, n_classes, l2_ratio):
+    gram, cross, n = None, None, 0
+
+    for z, y in _batches(sess, context, features_op):
+        if n_classes == 2:
+            targets = 2.0 * y[:, None] - 1.0
+        else:
+            targets = np.eye(n_classes)[y.astype(int)]
+
+        if gram is None:
+            gram = np.zeros((z.shape[1], z.shape[1]))
+            cross = np.zeros((z.shape[1], targets.shape[1]))
+
+        gram += np.dot(z.T, z)
+        cross += np.dot(z.T, targets)
+        n += z.shape[0]
+
+    return np.linalg.solve(
+        gram + _regularizer(gram.shape[0], l2_ratio, n), cross
+    )
+
+
+def _irls(sess, context, features_op, l2_ratio, iterations):
+    w = None
+
+    for i in range(iterations):
+        hessian, grad, n = None, None, 0
+
+        for z, y in _batches(sess, context, features_op):
+            if w is None:
+                w = np.zeros((z.shape[1], 1))
+            if hessian is None:
+                hessian = np.zeros((z.shape[1], z.shape[1]))
+                grad = np.zeros((z.shape[1], 1))
+
+            p = 1.0 / (1.0 + np.exp(-np.dot(z, w)))
+            s = p * (1.0 - p)
+
+            hessian += np.dot(z.T, z * s)
+            grad += np.dot(z.T, p - y[:, None])
+            n += z.shape[0]
+
+        reg = _regularizer(hessian.shape[0], l2_ratio, n)
+        w -= np.linalg.solve(hessian + reg, grad + np.dot(reg, w))
+
+        logger.debug('IRLS iteration %d, gradient norm %f'
+                     % (i, np.linalg.norm(grad)))
+
+    return w
@@ -0,0 +1,99 @@
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TrialAborted(Exception):
+    """ Raised when training is found to be hopeless """
+
+
+def build_watchdog(n_classes, **params):
+    """
+    Returns the watchdog configured by the parameters or None if the
+    'watchdog' parameter is not set
+    """
+    if not params.get('watchdog', False):
+        return None
+
+    return Watchdog(
+        n_classes,
+        check_steps=params.get('watchdog_steps', 10),
+        explode_factor=params.get('explode_factor', 10.0),
+        chance_window=params.get('chance_window', 20),
+        chance_margin=params.get('chance_margin', 0.01),
+        class_prior=params.get('class_prior', None),
+        abort_event=params.get('abort_event', None)
+    )
+
+
+class Watchdog(object):
+    """
+    Aborts training when the loss becomes NaN or infinite, when it grows
+    above explode_factor times the lowest loss seen or when the training
+    error stays at chance level for chance_window epochs. Losses are checked
+    every check_steps steps, so diverging runs stop within the epoch.
+
+    Chance level is the error of always predicting the most frequent class,
+    taken from class_prior (class frequencies or counts). Classes are
+    assumed balanced if it is not given, so on imbalanced data the level is
+    too high and stuck runs are not detected. Watchdogs sharing an
+    abort_event (e.g. those of the folds of a trial) stop as soon as any of
+    them aborts
+    """
+
+    def __init__(self,
+                 n_classes,
+                 check_steps=10,
+                 explode_factor=10.0,
+                 chance_window=20,
+                 chance_margin=0.01,
+                 class_prior=None,
+                 abort_event=None):
+        self.check_steps = check_steps
+        self._explode_factor = explode_factor
+        prior = np.asarray(class_prior, dtype=np.float64) \
+            if class_prior is not None else np.ones(n_classes)
+        self._chance_error = 1.0 - np.max(prior) / np.sum(prior)
+        self._chance_window = chance_window
+        self._chance_margin = chance_margin
+        self._min_loss = float('inf')
+        self._chance_epochs = 0
+        self._abort_event = abort_event
+
+    def check_aborted(self):
+        """ Stops if another run sharing the abort event was aborted """
+        if self._abort_event is not None and self._abort_event.is_set():
+            raise TrialAborted('Another run of the trial was aborted')
+
+    def check_loss(self, loss):
+        """ Checks the current training loss """
+        if not np.all(np.isfinite(loss)):
+            self._abort('Training loss is %s' % loss)
+
+        loss = np.mean(loss)
+        if 0 < self._min_loss < loss / self._explode_factor:
+            self._abort(
+                'Training loss exploded from %f to %f'
+                % (self._min_loss, loss)
+            )
+        self._min_loss = min(self._min_loss, loss)
+
+    def epoch_update(self, train_error):
+        """ Checks the training error at the end of an epoch """
+        if train_error >= self._chance_error - self._chance_margin:
+            self._chance_epochs += 1
+        else:
+            self._chance_epochs = 0
+
+        if self._chance_epochs >= self._chance_window:
+            self._abort(
+                'Training error at chance level (%f) for %d epochs'
+                % (self._chance_error, self._chance_epochs)
+            )
+
+    def _abort(self, message):
+        if self._abort_event is not None:
+            self._abort_event.set()
+        raise TrialAborted(message)
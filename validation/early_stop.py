@@ -77,6 +77,52 @@ class EarlyStop(object):
         return self._best
 
 
+class PopulationStop(object):
+    """
+    Early stopping of each member of a population on its own. Runs hold one
+    value per member and members stay stopped once their criteria are met
+    """
+
+    def __init__(self, name, progress_thresh, max_succ_errors, n_members):
+        self._stops = [
+            EarlyStop('%s_%d' % (name, i), progress_thresh, max_succ_errors)
+            for i in range(n_members)
+        ]
+        self._active = np.ones(n_members, dtype=bool)
+
+    def epoch_update(self, train_run):
+        for i, member_run in enumerate(train_run.replicas()):
+            if self._active[i]:
+                self._stops[i].epoch_update(member_run.error())
+
+    def strip_update(self, train_run, val_run, epoch):
+        """
+        Returns the members with a new best model and whether all of them
+        have stopped
+        """
+        improved = []
+        member_runs = zip(train_run.replicas(), val_run.replicas())
+        for i, (member_train, member_val) in enumerate(member_runs):
+            if not self._active[i]:
+                continue
+
+            is_best, stop, _ = self._stops[i].strip_update(
+                member_train, member_val, epoch
+            )
+            if is_best:
+                improved.append(i)
+            if stop:
+                self._active[i] = False
+
+        return improved, not np.any(self._active)
+
+    def active(self):
+        return self._active.copy()
+
+    def get_best(self):
+        return [stop.get_best() for stop in self._stops]
+
+
 def progress(strip):
     """
     As detailed in:
@@ -8,15 +8,22 @@ from protodata.utils import get_data_location
 logger = logging.getLogger(__name__)
 
 
+# Defined at module level, under their own names, so that settings can be
+# pickled and sent to worker processes
+ExtraEpochRefining = collections.namedtuple(
+    'ExtraEpochRefining', ['epochs']
+)
+
+ExtraLayerwise = collections.namedtuple(
+    'ExtraLayerwise', ['epochs_per_layer', 'policy']
+)
+
+
 class FineTuningType(object):
 
-    ExtraEpoch = collections.namedtuple(
-        'ExtraEpochRefining', ['epochs']
-    )
+    ExtraEpoch = ExtraEpochRefining
 
-    ExtraLayerwise = collections.namedtuple(
-        'ExtraLayerwise', ['epochs_per_layer', 'policy']
-    )
+    ExtraLayerwise = ExtraLayerwise
 
 
 def fine_tune_training(dataset,
@@ -24,7 +31,13 @@ def fine_tune_training(dataset,
                        run_folder,
                        fine_tune,
                        num_layers,
+                       restore_weights=None,
                        **params):
+    """
+    Trains the whole network stored in run_folder for some extra epochs.
+    If the weights of the last stage are given, they are used instead of
+    the checkpoint in the folder
+    """
 
     model = DeepNetworkTraining(
         settings_fn=settings_fn,
@@ -33,6 +46,7 @@ def fine_tune_training(dataset,
     )
 
     last_epoch = params['train_epochs'][-1]
+    restore_folder = run_folder if restore_weights is None else None
 
     if isinstance(fine_tune, FineTuningType.ExtraLayerwise):
 
@@ -51,7 +65,8 @@ def fine_tune_training(dataset,
             max_epochs=last_epoch + fine_tune.epochs_per_layer * num_layers,
             switch_epochs=switches,
             switch_policy=fine_tune.policy,
-            restore_folder=run_folder,
+            restore_folder=restore_folder,
+            restore_weights=restore_weights,
             restore_layers=[x for x in range(1, num_layers+1)],
             **params
         )
@@ -66,7 +81,8 @@ def fine_tune_training(dataset,
         return model.fit(
             num_layers=num_layers,
             max_epochs=last_epoch + fine_tune.epochs,
-            restore_folder=run_folder,
+            restore_folder=restore_folder,
+            restore_weights=restore_weights,
             restore_layers=[x for x in range(1, num_layers+1)],
             **params
         )
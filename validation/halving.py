@@ -0,0 +1,91 @@
+import numpy as np
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHalving(object):
+    """
+    Asynchronous successive halving (ASHA) as detailed in:
+        A System for Massively Parallel Hyperparameter Tuning.
+        Li et al. (2020)
+
+    Rungs are placed at min_epochs * eta^k epochs. When a run reaches a rung
+    at the end of a strip, its validation error is compared with the ones
+    of all runs that reached the rung before and the run is stopped unless
+    it is within the best 1/eta of them. Runs are never waited for, so
+    early runs are judged against fewer results
+    """
+
+    def __init__(self, eta=3, min_epochs=10, max_rungs=None):
+        if eta < 2:
+            raise ValueError('Reduction factor must be at least 2')
+        self._eta = eta
+        self._min_epochs = min_epochs
+        self._max_rungs = max_rungs
+        self._rungs = []
+        self._lock = threading.Lock()
+
+    def new_run(self):
+        """ Returns the handle a new run reports its strips to """
+        return HalvingRun(self)
+
+    def rung_epoch(self, rung):
+        return self._min_epochs * self._eta ** rung
+
+    def report(self, rung, val_error):
+        """
+        Records the error of a run at the given rung and returns whether
+        the run should continue
+        """
+        with self._lock:
+            while len(self._rungs) <= rung:
+                self._rungs.append([])
+            self._rungs[rung].append(val_error)
+            cutoff = np.percentile(self._rungs[rung], 100.0 / self._eta)
+            n_results = len(self._rungs[rung])
+
+        keep = val_error <= cutoff
+        logger.debug(
+            'Rung %d: error %f against cutoff %f of %d runs. %s'
+            % (rung, val_error, cutoff, n_results,
+               'Promoting' if keep else 'Stopping')
+        )
+        return keep
+
+    def is_last(self, rung):
+        return self._max_rungs is not None and rung >= self._max_rungs - 1
+
+
+class HalvingRun(object):
+    """
+    Progress of a single run through the rungs of an AsyncHalving scheduler
+    """
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._rung = 0
+        self._promoted_last = False
+        self.stopped = False
+
+    def strip_update(self, epoch, val_error):
+        """ Returns whether the run must stop after the current strip """
+        if self.stopped:
+            return True
+
+        while not self._promoted_last \
+                and epoch >= self._scheduler.rung_epoch(self._rung):
+            if not self._scheduler.report(self._rung, val_error):
+                logger.info(
+                    'Run stopped at epoch %d by successive halving' % epoch
+                )
+                self.stopped = True
+                break
+
+            # Runs promoted from the last rung train until early stop
+            self._promoted_last = self._scheduler.is_last(self._rung)
+            self._rung += 1
+
+        return self.stopped
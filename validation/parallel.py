@@ -0,0 +1,113 @@
+from hyperopt import base, space_eval
+from hyperopt.utils import coarse_utcnow
+
+import functools
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+
+def parallel_fmin(evaluate_fn,
+                  space,
+                  algo,
+                  max_evals,
+                  trials,
+                  rstate,
+                  n_workers,
+                  threads_per_worker=None):
+    """
+    Equivalent to hyperopt's fmin but evaluating up to n_workers trials at
+    once, each in its own process. Suggestions are requested in batches of
+    n_workers and results are stored in the given Trials object, so the
+    history can be used as if trials had been run sequentially.
+
+    evaluate_fn receives the sampled parameters and must be picklable (e.g.
+    a module function or a partial of one). Each worker runs TensorFlow with
+    intra and inter op pools of threads_per_worker threads, by default the
+    available cores divided among the workers
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, multiprocessing.cpu_count() // n_workers)
+
+    domain = base.Domain(evaluate_fn, space)
+    worker_fn = functools.partial(
+        _run_trial, evaluate_fn, threads_per_worker
+    )
+
+    # Fresh interpreters and one trial per process so memory used by
+    # TensorFlow is released after each trial
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(processes=n_workers, maxtasksperchild=1)
+
+    try:
+        while len(trials.trials) < max_evals:
+            n_batch = min(n_workers, max_evals - len(trials.trials))
+            new_trials = suggest_trials(
+                domain, algo, trials, rstate, n_batch
+            )
+
+            params = [
+                space_eval(space, base.spec_from_misc(t['misc']))
+                for t in new_trials
+            ]
+
+            logger.info(
+                'Running trials {} in {} workers with {} threads each'.format(
+                    [t['tid'] for t in new_trials],
+                    n_workers,
+                    threads_per_worker
+                )
+            )
+
+            for t in new_trials:
+                t['state'] = base.JOB_STATE_RUNNING
+                t['book_time'] = t['refresh_time'] = coarse_utcnow()
+
+            results = [pool.apply_async(worker_fn, (p,)) for p in params]
+            for trial, result in zip(new_trials, results):
+                _store_result(trial, result)
+
+            trials.refresh()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return trials.argmin
+
+
+def suggest_trials(domain, algo, trials, rstate, n_trials):
+    """
+    Adds n_trials new trials suggested by the algorithm to the history and
+    returns their documents
+    """
+    new_ids = trials.new_trial_ids(n_trials)
+    trials.refresh()
+    new_trials = algo(new_ids, domain, trials, rstate.randint(2 ** 31 - 1))
+    trials.insert_trial_docs(new_trials)
+    trials.refresh()
+
+    # Work with the stored documents so results end up in the history
+    return [t for t in trials._dynamic_trials if t['tid'] in new_ids]
+
+
+def _store_result(trial, async_result):
+    try:
+        result = async_result.get()
+    except Exception as e:
+        logger.error('Trial %d failed: %s' % (trial['tid'], str(e)))
+        trial['state'] = base.JOB_STATE_ERROR
+        trial['misc']['error'] = (str(type(e)), str(e))
+    else:
+        trial['state'] = base.JOB_STATE_DONE
+        trial['result'] = result
+    trial['refresh_time'] = coarse_utcnow()
+
+
+def _run_trial(evaluate_fn, threads, params):
+    params = dict(params)
+    params.update({
+        'intra_op_threads': threads,
+        'inter_op_threads': threads
+    })
+    return evaluate_fn(params)
@@ -0,0 +1,92 @@
+from hyperopt import base, space_eval
+from hyperopt.utils import coarse_utcnow
+
+import collections
+import logging
+
+from training.population import check_population, population_shape_key
+from validation.parallel import suggest_trials
+
+logger = logging.getLogger(__name__)
+
+
+def population_fmin(evaluate_fn,
+                    space,
+                    algo,
+                    max_evals,
+                    trials,
+                    rstate,
+                    population_size):
+    """
+    Equivalent to hyperopt's fmin but drawing up to population_size trials
+    at once and evaluating together those whose graphs have the same shapes.
+    evaluate_fn receives the parameters of the trials of a group and must
+    return their results in the same order
+    """
+    domain = base.Domain(evaluate_fn, space)
+
+    while len(trials.trials) < max_evals:
+        n_batch = min(population_size, max_evals - len(trials.trials))
+        new_trials = suggest_trials(domain, algo, trials, rstate, n_batch)
+
+        params = [
+            space_eval(space, base.spec_from_misc(t['misc']))
+            for t in new_trials
+        ]
+
+        for group in group_trials(params):
+            _evaluate_group(
+                evaluate_fn,
+                [new_trials[i] for i in group],
+                [params[i] for i in group]
+            )
+
+        trials.refresh()
+
+    return trials.argmin
+
+
+def group_trials(params):
+    """
+    Returns the indices of the trials grouped by the shapes of their graphs.
+    Trials that cannot be trained as members of a population are grouped
+    on their own
+    """
+    groups = collections.OrderedDict()
+    for i, trial_params in enumerate(params):
+        try:
+            check_population(**trial_params)
+        except ValueError as e:
+            logger.info('Trial {} trained alone: {}'.format(i, e))
+            key = i
+        else:
+            key = population_shape_key(trial_params)
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
+
+
+def _evaluate_group(evaluate_fn, group, params):
+    logger.info(
+        'Training trials {} as a population'.format([t['tid'] for t in group])
+    )
+
+    for trial in group:
+        trial['state'] = base.JOB_STATE_RUNNING
+        trial['book_time'] = trial['refresh_time'] = coarse_utcnow()
+
+    try:
+        results = evaluate_fn(params)
+    except Exception as e:
+        logger.error(
+            'Population {} failed: {}'.format([t['tid'] for t in group], e)
+        )
+        for trial in group:
+            trial['state'] = base.JOB_STATE_ERROR
+            trial['misc']['error'] = (str(type(e)), str(e))
+    else:
+        for trial, result in zip(group, results):
+            trial['state'] = base.JOB_STATE_DONE
+            trial['result'] = result
+
+    for trial in group:
+        trial['refresh_time'] = coarse_utcnow()
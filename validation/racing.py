@@ -0,0 +1,68 @@
+import numpy as np
+from scipy import stats
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FoldRacing(object):
+    """
+    Racing of configurations over the cross-validation folds, in the spirit
+    of:
+        Hoeffding Races: Accelerating Model Selection Search for
+        Classification and Function Approximation. Maron and Moore (1994)
+
+    Folds are validated in a fixed order and, once min_folds are done, the
+    errors of a configuration are compared with those of the best fully
+    validated configuration on the same folds with a one-sided paired
+    t-test. Configurations significantly worse at level alpha are abandoned
+    """
+
+    def __init__(self, alpha=0.05, min_folds=2):
+        if min_folds < 2:
+            raise ValueError('At least two folds are needed for the test')
+        self._alpha = alpha
+        self._min_folds = min_folds
+        self._incumbent = None
+
+    def is_hopeless(self, fold_errors):
+        """
+        Whether the configuration with the given errors, in fold order, is
+        worse than the incumbent
+        """
+        if self._incumbent is None or len(fold_errors) < self._min_folds:
+            return False
+
+        diffs = np.asarray(fold_errors) - self._incumbent[:len(fold_errors)]
+        if np.allclose(diffs, diffs[0]):
+            # The test is undefined when differences do not vary
+            return np.mean(diffs) > 0 and not np.allclose(diffs, 0)
+
+        t, p = stats.ttest_rel(fold_errors, self._incumbent[:len(diffs)])
+        p_worse = p / 2 if t > 0 else 1 - p / 2
+
+        logger.debug(
+            'Racing after %d folds: mean difference %f, p-value %f'
+            % (len(diffs), np.mean(diffs), p_worse)
+        )
+        return p_worse < self._alpha
+
+    def update(self, fold_errors, n_folds):
+        """
+        Records the errors of a configuration and returns its loss. Fully
+        validated configurations may become the incumbent, while abandoned
+        ones get the incumbent loss plus their mean difference with it
+        """
+        fold_errors = np.asarray(fold_errors, dtype=float)
+
+        if len(fold_errors) < n_folds:
+            diffs = fold_errors - self._incumbent[:len(fold_errors)]
+            return np.mean(self._incumbent) + np.mean(diffs)
+
+        if self._incumbent is None \
+                or np.mean(fold_errors) < np.mean(self._incumbent):
+            logger.debug('New incumbent with errors {}'.format(fold_errors))
+            self._incumbent = fold_errors
+
+        return np.mean(fold_errors)
@@ -0,0 +1,102 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from training.handoff import StageWeights
+
+logger = logging.getLogger(__name__)
+
+
+# Parameters that do not change the outcome of a validation stage. Stages
+# stopped by the scheduler are never cached, so the scheduler is one of them
+STAGE_INDEPENDENT_PARAMS = [
+    'max_layers', 'tune_folder', 'stage_cache', 'stage_handoff',
+    'save_checkpoints', 'scheduler', 'racing', 'fold_workers',
+    'intra_op_threads', 'inter_op_threads', 'n_threads', 'abort_event'
+]
+
+BEST_FILE = 'best.json'
+WEIGHTS_FILE = 'weights.npz'
+
+
+class StageCache(object):
+    """
+    Content-addressed store of incremental validation stages. Each entry
+    holds the best metrics found by EarlyStop and the weights of the best
+    model, under a hash of everything the stage depends on: the parameters
+    of the trial, the validation fold and the number of layers, since the
+    first layers are restored from the previous stages. Trials sharing a
+    prefix of stages reuse them instead of training them again
+    """
+
+    def __init__(self, folder):
+        self._folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, params, val_fold, layer):
+        stage = {
+            k: v for k, v in params.items()
+            if k not in STAGE_INDEPENDENT_PARAMS
+        }
+        content = _stable_repr([stage, val_fold, layer])
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the best metrics and weights stored for the stage or None
+        """
+        entry = os.path.join(self._folder, key)
+        if not os.path.isdir(entry):
+            return None
+
+        with open(os.path.join(entry, BEST_FILE)) as f:
+            best = json.load(f)
+        weights = StageWeights.from_file(os.path.join(entry, WEIGHTS_FILE))
+
+        logger.debug('Reusing stage %s' % key)
+        return best, weights
+
+    def put(self, key, best, weights):
+        """
+        Stores a stage. Entries are written aside and renamed, so
+        concurrent trials never read partial entries
+        """
+        entry = os.path.join(self._folder, key)
+        if os.path.isdir(entry):
+            return
+
+        tmp = tempfile.mkdtemp(prefix='.' + key, dir=self._folder)
+        with open(os.path.join(tmp, BEST_FILE), 'w') as f:
+            json.dump(best, f, default=lambda x: x.item())
+        weights.save(os.path.join(tmp, WEIGHTS_FILE))
+
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Stored meanwhile by another trial
+            shutil.rmtree(tmp)
+
+
+def _stable_repr(value):
+    """
+    Representation that does not depend on the process, unlike the default
+    one of functions and classes
+    """
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join(
+            '%s: %s' % (_stable_repr(k), _stable_repr(v))
+            for k, v in sorted(value.items(), key=lambda x: repr(x[0]))
+        )
+    elif isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(_stable_repr(v) for v in value)
+    elif isinstance(value, functools.partial):
+        return 'partial(%s)' % _stable_repr(
+            [value.func, value.args, value.keywords]
+        )
+    elif callable(value) and hasattr(value, '__qualname__'):
+        return '%s.%s' % (value.__module__, value.__qualname__)
+    return repr(value)
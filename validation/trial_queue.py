@@ -0,0 +1,365 @@
+from hyperopt import base, space_eval
+from hyperopt.utils import coarse_utcnow
+
+import contextlib
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+
+from validation.parallel import suggest_trials
+
+logger = logging.getLogger(__name__)
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    experiment TEXT,
+    state TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    result BLOB,
+    error TEXT
+)
+"""
+
+
+def connect_queue(url, max_attempts=3):
+    """
+    Returns the queue at the given location: a MongoDB URL such as
+    mongodb://host:27017/tuning or the path of an SQLite file, which serves
+    as a local stand-in when all workers share a file system
+    """
+    if url.startswith('mongodb://'):
+        return MongoQueue.from_url(url, max_attempts=max_attempts)
+    return SQLiteQueue(url, max_attempts=max_attempts)
+
+
+class SQLiteQueue(object):
+    """
+    Trial queue in an SQLite file. Jobs are claimed by a worker for a lease
+    period that the worker keeps renewing while it runs the job. Jobs whose
+    lease expires, because their worker died, are claimed again by other
+    workers until max_attempts is reached
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self._path = path
+        self.max_attempts = max_attempts
+        with self._transaction() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Immediate transactions so claims of concurrent workers serialize
+        conn = sqlite3.connect(self._path, timeout=60, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def post(self, experiment, job):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'INSERT INTO jobs (experiment, state, payload) '
+                'VALUES (?, ?, ?)',
+                (experiment, QUEUED, pickle.dumps(job))
+            )
+            return cursor.lastrowid
+
+    def claim(self, owner, lease_secs):
+        """
+        Returns the id and the job of the oldest job available to the
+        worker or None if there is none
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT id, payload FROM jobs WHERE attempts < ? AND '
+                '(state = ? OR (state = ? AND lease_expires < ?)) '
+                'ORDER BY id LIMIT 1',
+                (self.max_attempts, QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+
+            job_id, payload = row
+            conn.execute(
+                'UPDATE jobs SET state = ?, owner = ?, lease_expires = ?, '
+                'attempts = attempts + 1 WHERE id = ?',
+                (RUNNING, owner, now + lease_secs, job_id)
+            )
+        return job_id, pickle.loads(payload)
+
+    def renew(self, job_id, owner, lease_secs):
+        """ Extends the lease and returns whether the worker still owns it """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET lease_expires = ? '
+                'WHERE id = ? AND owner = ? AND state = ?',
+                (time.time() + lease_secs, job_id, owner, RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, owner, result):
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE jobs SET state = ?, result = ? '
+                'WHERE id = ? AND owner = ? AND state = ?',
+                (DONE, pickle.dumps(result), job_id, owner, RUNNING)
+            )
+
+    def fail(self, job_id, owner, error):
+        """ Requeues the job unless it ran out of attempts """
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE jobs SET state = CASE WHEN attempts < ? THEN ? '
+                'ELSE ? END, owner = NULL, error = ? '
+                'WHERE id = ? AND owner = ? AND state = ?',
+                (self.max_attempts, QUEUED, FAILED, error, job_id, owner,
+                 RUNNING)
+            )
+
+    def reap(self):
+        """ Fails the jobs whose last allowed lease expired """
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE jobs SET state = ?, error = ? WHERE state = ? AND '
+                'lease_expires < ? AND attempts >= ?',
+                (FAILED, 'Lease expired', RUNNING, time.time(),
+                 self.max_attempts)
+            )
+
+    def status(self, job_id):
+        """ Returns the state, result and error of the job """
+        with self._transaction() as conn:
+            state, result, error = conn.execute(
+                'SELECT state, result, error FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+        return state, pickle.loads(result) if result is not None else None, \
+            error
+
+
+class MongoQueue(object):
+    """
+    Trial queue in a MongoDB collection, with the semantics of SQLiteQueue.
+    Claims rely on atomic find-and-modify operations
+    """
+
+    def __init__(self, collection, max_attempts=3):
+        self._jobs = collection
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def from_url(url, max_attempts=3):
+        import pymongo
+        client = pymongo.MongoClient(url)
+        database = client.get_default_database()
+        return MongoQueue(database['jobs'], max_attempts=max_attempts)
+
+    def post(self, experiment, job):
+        return self._jobs.insert_one({
+            'experiment': experiment,
+            'state': QUEUED,
+            'payload': pickle.dumps(job),
+            'attempts': 0
+        }).inserted_id
+
+    def claim(self, owner, lease_secs):
+        import pymongo
+        now = time.time()
+        doc = self._jobs.find_one_and_update(
+            {
+                'attempts': {'$lt': self.max_attempts},
+                '$or': [
+                    {'state': QUEUED},
+                    {'state': RUNNING, 'lease_expires': {'$lt': now}}
+                ]
+            },
+            {
+                '$set': {
+                    'state': RUNNING,
+                    'owner': owner,
+                    'lease_expires': now + lease_secs
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('_id', pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if doc is None:
+            return None
+        return doc['_id'], pickle.loads(doc['payload'])
+
+    def renew(self, job_id, owner, lease_secs):
+        updated = self._jobs.update_one(
+            {'_id': job_id, 'owner': owner, 'state': RUNNING},
+            {'$set': {'lease_expires': time.time() + lease_secs}}
+        )
+        return updated.modified_count == 1
+
+    def complete(self, job_id, owner, result):
+        self._jobs.update_one(
+            {'_id': job_id, 'owner': owner, 'state': RUNNING},
+            {'$set': {'state': DONE, 'result': pickle.dumps(result)}}
+        )
+
+    def fail(self, job_id, owner, error):
+        job = {'_id': job_id, 'owner': owner, 'state': RUNNING}
+        self._jobs.update_one(
+            dict(job, attempts={'$lt': self.max_attempts}),
+            {'$set': {'state': QUEUED, 'owner': None, 'error': error}}
+        )
+        self._jobs.update_one(
+            dict(job, attempts={'$gte': self.max_attempts}),
+            {'$set': {'state': FAILED, 'owner': None, 'error': error}}
+        )
+
+    def reap(self):
+        self._jobs.update_many(
+            {
+                'state': RUNNING,
+                'lease_expires': {'$lt': time.time()},
+                'attempts': {'$gte': self.max_attempts}
+            },
+            {'$set': {'state': FAILED, 'error': 'Lease expired'}}
+        )
+
+    def status(self, job_id):
+        doc = self._jobs.find_one({'_id': job_id})
+        result = pickle.loads(doc['result']) if 'result' in doc else None
+        return doc['state'], result, doc.get('error', None)
+
+
+def run_worker(queue,
+               worker_id=None,
+               lease_secs=600,
+               poll_secs=5,
+               max_jobs=None,
+               max_idle_secs=None):
+    """
+    Runs jobs from the queue until max_jobs have been run or no job has
+    been available for max_idle_secs seconds, if given. Leases are renewed
+    in the background while a job runs. Returns the number of jobs run
+    """
+    worker_id = worker_id or '%s:%d' % (socket.gethostname(), os.getpid())
+    n_jobs, idle_since = 0, time.time()
+
+    while max_jobs is None or n_jobs < max_jobs:
+        claimed = queue.claim(worker_id, lease_secs)
+
+        if claimed is None:
+            if max_idle_secs is not None \
+                    and time.time() - idle_since > max_idle_secs:
+                break
+            time.sleep(poll_secs)
+            continue
+
+        job_id, (evaluate_fn, params) = claimed
+        logger.info('[%s] Running job %s' % (worker_id, job_id))
+
+        stop_renewal = threading.Event()
+        renewal = threading.Thread(
+            target=_renew_lease,
+            args=(queue, job_id, worker_id, lease_secs, stop_renewal)
+        )
+        renewal.daemon = True
+        renewal.start()
+
+        try:
+            result = evaluate_fn(params)
+        except Exception as e:
+            logger.error('[%s] Job %s failed: %s' % (worker_id, job_id, e))
+            queue.fail(job_id, worker_id, '%s: %s' % (type(e).__name__, e))
+        else:
+            queue.complete(job_id, worker_id, result)
+        finally:
+            stop_renewal.set()
+            renewal.join()
+
+        n_jobs, idle_since = n_jobs + 1, time.time()
+
+    return n_jobs
+
+
+def _renew_lease(queue, job_id, worker_id, lease_secs, stop):
+    while not stop.wait(lease_secs / 3.0):
+        if not queue.renew(job_id, worker_id, lease_secs):
+            # Results of jobs taken over by other workers are discarded
+            logger.warning(
+                '[%s] Lost the lease of job %s' % (worker_id, job_id)
+            )
+            return
+
+
+def queue_fmin(evaluate_fn,
+               space,
+               algo,
+               max_evals,
+               trials,
+               rstate,
+               queue,
+               experiment='default',
+               max_pending=1,
+               poll_secs=5):
+    """
+    Equivalent to hyperopt's fmin but posting the trials to a queue served
+    by workers, possibly on other nodes. Up to max_pending trials are kept
+    in the queue and a new one is suggested as soon as one finishes.
+    evaluate_fn receives the sampled parameters and must be picklable and
+    importable by the workers
+    """
+    domain = base.Domain(evaluate_fn, space)
+    pending = {}
+
+    while len(trials.trials) < max_evals or len(pending) > 0:
+
+        while len(pending) < max_pending and len(trials.trials) < max_evals:
+            trial, = suggest_trials(domain, algo, trials, rstate, 1)
+            params = space_eval(space, base.spec_from_misc(trial['misc']))
+
+            job_id = queue.post(experiment, (evaluate_fn, params))
+            trial['state'] = base.JOB_STATE_RUNNING
+            trial['book_time'] = trial['refresh_time'] = coarse_utcnow()
+            pending[job_id] = trial
+            logger.info('Posted trial %d as job %s' % (trial['tid'], job_id))
+
+        queue.reap()
+
+        for job_id in list(pending.keys()):
+            state, result, error = queue.status(job_id)
+            if state not in [DONE, FAILED]:
+                continue
+
+            trial = pending.pop(job_id)
+            if state == DONE:
+                trial['state'] = base.JOB_STATE_DONE
+                trial['result'] = result
+            else:
+                logger.error('Trial %d failed: %s' % (trial['tid'], error))
+                trial['state'] = base.JOB_STATE_ERROR
+                trial['misc']['error'] = ('JobFailed', str(error))
+            trial['refresh_time'] = coarse_utcnow()
+            trials.refresh()
+
+        if len(pending) > 0:
+            time.sleep(poll_secs)
+
+    return trials.argmin
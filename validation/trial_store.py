@@ -0,0 +1,311 @@
+from hyperopt import Trials, base
+from hyperopt.exceptions import AllTrialsFailed
+import numpy as np
+
+import ast
+import contextlib
+import copy
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S,%f'
+LOG_LINE = re.compile(r'^(\S+ \S+) INFO\s+(Finished evaluation on|'
+                      r'Obtained results) (\{.*\})\s*$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    experiment TEXT NOT NULL,
+    tid INTEGER NOT NULL,
+    status TEXT,
+    params TEXT,
+    result TEXT,
+    started TEXT,
+    finished TEXT,
+    doc TEXT,
+    PRIMARY KEY (experiment, tid)
+)
+"""
+
+
+class TrialStore(object):
+    """
+    SQLite file recording the parameters, result and timing of the trials
+    of each experiment. Trials run through StoredTrials also keep their
+    hyperopt document, so searches can resume from them
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._execute(_SCHEMA)
+
+    def _execute(self, sql, args=()):
+        # A connection per operation, so threads and processes can share it
+        with contextlib.closing(sqlite3.connect(self._path, timeout=60)) \
+                as conn:
+            with conn:
+                return conn.execute(sql, args).fetchall()
+
+    def save(self,
+             experiment,
+             tid,
+             status,
+             params,
+             result,
+             started=None,
+             finished=None,
+             doc=None):
+        self._execute(
+            'INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (experiment, tid, status, _dumps(params), _dumps(result),
+             _time_str(started), _time_str(finished),
+             _dumps(doc) if doc is not None else None)
+        )
+
+    def docs(self, experiment):
+        """ Returns the hyperopt documents of the experiment, by tid """
+        rows = self._execute(
+            'SELECT doc FROM trials WHERE experiment = ? '
+            'AND doc IS NOT NULL ORDER BY tid',
+            (experiment,)
+        )
+        return [_loads(doc) for doc, in rows]
+
+    def records(self, experiment):
+        """
+        Returns the parameters, result and timing of every trial of the
+        experiment, including those imported from logs
+        """
+        rows = self._execute(
+            'SELECT tid, status, params, result, started, finished '
+            'FROM trials WHERE experiment = ? ORDER BY tid',
+            (experiment,)
+        )
+        return [
+            {
+                'tid': tid,
+                'status': status,
+                'params': _loads(params),
+                'result': _loads(result),
+                'started': started,
+                'finished': finished
+            }
+            for tid, status, params, result, started, finished in rows
+        ]
+
+    def clear_imported(self, experiment):
+        """ Removes the trials of the experiment imported from logs """
+        self._execute(
+            'DELETE FROM trials WHERE experiment = ? AND doc IS NULL',
+            (experiment,)
+        )
+
+    def next_tid(self, experiment):
+        (last,), = self._execute(
+            'SELECT MAX(tid) FROM trials WHERE experiment = ?',
+            (experiment,)
+        )
+        return 0 if last is None else last + 1
+
+
+class StoredTrials(Trials):
+    """
+    Trials that write every finished trial to a TrialStore and start from
+    the trials of the experiment found in it, so an interrupted search is
+    resumed instead of restarted. Trials of the warm_start experiments,
+    which must share the search space, are added to the history as well,
+    but they are not counted as trials of the experiment nor chosen as its
+    best trial
+    """
+
+    def __init__(self, store, experiment, warm_start=None):
+        super(StoredTrials, self).__init__()
+        self._store = store
+        self._experiment = experiment
+
+        resumed = store.docs(experiment)
+        self._stored = set(doc['tid'] for doc in resumed)
+        self._ids.update(self._stored)
+        self._warm = set()
+
+        warm_docs = []
+        for other in (warm_start or []):
+            warm_docs.extend(store.docs(other))
+
+        if len(resumed) > 0:
+            self.insert_trial_docs(resumed)
+            self.refresh()
+
+        if len(warm_docs) > 0:
+            # Numbered after the trials of the experiment
+            tids = self.new_trial_ids(len(warm_docs))
+            # Marked as stored so refresh does not copy them to experiment
+            self._stored.update(tids)
+            self._warm.update(tids)
+            self.insert_trial_docs([
+                _renumber(doc, tid) for doc, tid in zip(warm_docs, tids)
+            ])
+            self.refresh()
+
+        logger.info(
+            'Resuming %s with %d stored trials and %d warm start trials'
+            % (experiment, len(resumed), len(warm_docs))
+        )
+
+    @property
+    def warm_start_trials(self):
+        """ Number of trials taken from the warm_start experiments """
+        return len(self._warm)
+
+    @property
+    def best_trial(self):
+        candidates = [
+            t for t in self.trials
+            if t['tid'] not in self._warm
+            and t['result']['status'] == base.STATUS_OK
+            and not np.isnan(t['result']['loss'])
+        ]
+        if len(candidates) == 0:
+            raise AllTrialsFailed
+        losses = [float(t['result']['loss']) for t in candidates]
+        return candidates[int(np.argmin(losses))]
+
+    def new_trial_ids(self, N):
+        # Resumed trials may leave gaps, so ids follow the largest one
+        start = max(self._ids) + 1 if len(self._ids) > 0 else 0
+        ids = list(range(start, start + N))
+        self._ids.update(ids)
+        return ids
+
+    def refresh(self):
+        super(StoredTrials, self).refresh()
+        for doc in self._dynamic_trials:
+            finished = doc['state'] in [
+                base.JOB_STATE_DONE, base.JOB_STATE_ERROR
+            ]
+            if finished and doc['tid'] not in self._stored:
+                self._store_doc(doc)
+
+    def _store_doc(self, doc):
+        result = doc.get('result', {})
+        self._store.save(
+            self._experiment,
+            doc['tid'],
+            result.get('status', 'error')
+            if doc['state'] == base.JOB_STATE_DONE else 'error',
+            result.get('parameters', None),
+            result,
+            started=doc.get('book_time', None),
+            finished=doc.get('refresh_time', None),
+            doc=doc
+        )
+        self._stored.add(doc['tid'])
+
+
+def import_logs(store, folder):
+    """
+    Imports the evaluations found in the tuning logs under the folder,
+    using the name of each log file as experiment. Returns the number of
+    trials imported
+    """
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            experiment = os.path.splitext(name)[0]
+            total += import_log(store, os.path.join(root, name), experiment)
+    return total
+
+
+def import_log(store, path, experiment):
+    """
+    Imports the pairs of 'Finished evaluation on' and 'Obtained results'
+    lines of a log. Logs do not record when trials started, and the values
+    sampled by hyperopt cannot be recovered from them, so imported trials
+    are kept for analysis but do not take part in resumed searches.
+    Importing a log again replaces the trials imported before
+    """
+    store.clear_imported(experiment)
+    tid = store.next_tid(experiment)
+    params, n_trials = None, 0
+
+    with open(path) as f:
+        for line in f:
+            match = LOG_LINE.match(line)
+            if match is None:
+                continue
+
+            time_str, kind, values = match.groups()
+            if kind == 'Finished evaluation on':
+                params = _parse_log_dict(values)
+            elif params is not None:
+                result = _parse_log_dict(values)
+                store.save(
+                    experiment,
+                    tid,
+                    'ok',
+                    params,
+                    {'loss': result.get('val_error'), 'averaged': result},
+                    finished=datetime.datetime.strptime(
+                        time_str, LOG_TIME_FORMAT
+                    )
+                )
+                tid, params, n_trials = tid + 1, None, n_trials + 1
+
+    logger.info('Imported %d trials from %s' % (n_trials, path))
+    return n_trials
+
+
+def _parse_log_dict(text):
+    # Functions are logged as <function name at address>
+    text = re.sub(r'<([^<>]*)>', lambda m: repr(m.group(1)), text)
+    text = re.sub(r'\binf\b', '1e999', text)
+    text = re.sub(r'\bnan\b', 'None', text)
+    return ast.literal_eval(text)
+
+
+def _renumber(doc, tid):
+    doc = copy.deepcopy(doc)
+    doc['tid'] = doc['misc']['tid'] = tid
+    for label, idxs in doc['misc']['idxs'].items():
+        doc['misc']['idxs'][label] = [tid] * len(idxs)
+    return doc
+
+
+def _time_str(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) \
+        else value
+
+
+def _to_json(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    elif isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+    # Functions and other objects are only kept for reference
+    return repr(value)
+
+
+def _from_json(value):
+    if '__datetime__' in value:
+        return datetime.datetime.strptime(
+            value['__datetime__'], '%Y-%m-%dT%H:%M:%S.%f'
+            if '.' in value['__datetime__'] else '%Y-%m-%dT%H:%M:%S'
+        )
+    return value
+
+
+def _dumps(value):
+    return json.dumps(value, default=_to_json)
+
+
+def _loads(text):
+    return json.loads(text, object_hook=_from_json) \
+        if text is not None else None
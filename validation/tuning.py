@@ -1,21 +1,37 @@
 import numpy as np
-from hyperopt import fmin, rand, Trials, STATUS_OK, space_eval
+from hyperopt import fmin, rand, Trials, STATUS_OK, STATUS_FAIL, space_eval
 
 import os
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import threading
 import time
+import functools
 import tempfile
 import shutil
 import logging
 
 from training.fit_validate import DeepNetworkValidation
 from training.fit import DeepNetworkTraining
+from training.data_pipeline import clear_fold_cache
+from training.population import merge_population_params, select_members
+from training.watchdog import TrialAborted
+from training.handoff import StageWeights
 from validation.fine_tuning import fine_tune_training
+from validation.parallel import parallel_fmin
+from validation.population import population_fmin
+from validation.stage_cache import StageCache
+from validation.trial_store import TrialStore, StoredTrials
+from validation.trial_queue import connect_queue, queue_fmin
 
 from protodata.utils import get_data_location
 
 
 logger = logging.getLogger(__name__)
 
+# Archive with the weights of each replica, stored in replicated runs
+REPLICA_FILE = 'replica_%d.npz'
+
 
 def tune_model(dataset,
                settings_fn,
@@ -26,22 +42,121 @@ def tune_model(dataset,
                folder=None,
                runs=10,
                test_batch_size=1,
-               seed=None):
+               seed=None,
+               n_workers=1,
+               threads_per_worker=None,
+               run_workers=1,
+               population_size=1,
+               scheduler=None,
+               racing=None,
+               store=None,
+               experiment='default',
+               warm_start=None,
+               queue=None,
+               poll_secs=5,
+               replicated=False):
     """
     Tunes a model on training and returns stats of the model on test after
-    averaging several runs.
+    averaging several runs. If n_workers is greater than one, that many
+    trials are evaluated at once in separate processes. Similarly,
+    run_workers sets the number of test runs executed concurrently. If
+    population_size is greater than one, trials are drawn in groups of that
+    size and those that only differ in POPULATION_PARAMS are trained
+    together as the members of a replicated network. A scheduler (e.g.
+    AsyncHalving) stops unpromising trials at the end of their strips and
+    racing (e.g. FoldRacing) abandons the cross-validation of trials found
+    worse than the best one before all folds are run.
+
+    If store is the path of a trial store, finished trials are recorded
+    under the experiment name and a search interrupted before n_trials
+    resumes from them. Trials of the warm_start experiments, which must
+    share the search space, seed the search. They do not count towards the
+    n_trials of the experiment and the model is only chosen among the
+    trials of the experiment.
+
+    If queue is given (a MongoDB URL, the path of an SQLite queue or a queue
+    object), trials are posted to it under the experiment name and run by
+    the workers serving it (see run_worker), with n_workers trials pending
+    at a time. Results are polled every poll_secs seconds.
+
+    If replicated is set, the test runs are trained at once as the replicas
+    of a single network instead of one after another (see _run_setting)
     """
     validate_fn = _cross_validate if cross_validate else _simple_evaluate
+    distributed = n_workers > 1 or queue is not None
 
-    trials = Trials()
-    best = fmin(
-        fn=lambda x: validate_fn(dataset, settings_fn, **x),
-        algo=rand.suggest,  # tpe.suggest for Tree Parzen Window search
-        space=search_space,
-        max_evals=n_trials,
-        trials=trials,
-        rstate=np.random.RandomState(seed)
-    )
+    if distributed and population_size > 1:
+        raise ValueError('Populations cannot be evaluated in worker processes')
+
+    if (scheduler is not None or racing is not None) \
+            and (distributed or population_size > 1):
+        # Results of previous trials are only shared within the process
+        raise ValueError(
+            'Schedulers and racing need trials evaluated in the main process'
+        )
+
+    if racing is not None and not cross_validate:
+        raise ValueError('Racing is only available for cross validation')
+
+    if store is not None:
+        trials = StoredTrials(TrialStore(store), experiment, warm_start)
+        # Trials of other experiments do not count towards n_trials
+        max_evals = n_trials + trials.warm_start_trials
+    else:
+        trials, max_evals = Trials(), n_trials
+
+    if population_size > 1:
+        best = population_fmin(
+            evaluate_fn=functools.partial(
+                _evaluate_population, cross_validate, dataset, settings_fn
+            ),
+            algo=rand.suggest,
+            space=search_space,
+            max_evals=max_evals,
+            trials=trials,
+            rstate=np.random.RandomState(seed),
+            population_size=population_size
+        )
+    elif queue is not None:
+        best = queue_fmin(
+            evaluate_fn=functools.partial(
+                _evaluate_trial, validate_fn, dataset, settings_fn
+            ),
+            space=search_space,
+            algo=rand.suggest,
+            max_evals=max_evals,
+            trials=trials,
+            rstate=np.random.RandomState(seed),
+            queue=connect_queue(queue) if isinstance(queue, str) else queue,
+            experiment=experiment,
+            max_pending=n_workers,
+            poll_secs=poll_secs
+        )
+    elif n_workers > 1:
+        best = parallel_fmin(
+            evaluate_fn=functools.partial(
+                _evaluate_trial, validate_fn, dataset, settings_fn
+            ),
+            algo=rand.suggest,
+            space=search_space,
+            max_evals=max_evals,
+            trials=trials,
+            rstate=np.random.RandomState(seed),
+            n_workers=n_workers,
+            threads_per_worker=threads_per_worker
+        )
+    else:
+        best = fmin(
+            fn=lambda x: validate_fn(
+                dataset, settings_fn,
+                **_trial_params(x, scheduler=scheduler, racing=racing)
+            ),
+            algo=rand.suggest,  # tpe.suggest for Tree Parzen Window search
+            space=search_space,
+            max_evals=max_evals,
+            trials=trials,
+            rstate=np.random.RandomState(seed)
+        )
 
     params = space_eval(search_space, best)
     stats = trials.best_trial['result']['averaged']
@@ -56,13 +171,19 @@ def tune_model(dataset,
     logger.info('Using model {} for training with results {}'
                 .format(params, stats))
 
-    return _run_setting(dataset=dataset,
-                        settings_fn=settings_fn,
-                        best_params=params,
-                        n_runs=runs,
-                        folder=folder,
-                        test_batch_size=test_batch_size,
-                        fine_tune=fine_tune)
+    try:
+        return _run_setting(dataset=dataset,
+                            settings_fn=settings_fn,
+                            best_params=params,
+                            n_runs=runs,
+                            folder=folder,
+                            test_batch_size=test_batch_size,
+                            fine_tune=fine_tune,
+                            n_workers=run_workers,
+                            replicated=replicated)
+    finally:
+        # Folds shared by the graphs of this tuning are no longer needed
+        clear_fold_cache()
 
 
 def _run_setting(dataset,
@@ -71,70 +192,239 @@ def _run_setting(dataset,
                  folder=None,
                  n_runs=10,
                  test_batch_size=1,
-                 fine_tune=None):
+                 fine_tune=None,
+                 n_workers=1,
+                 replicated=False):
     """
     Fits a model with the training set and evaluates it on the test
     for a given number of times. Then returns the summarized metrics
-    on the test set.
+    on the test set. If n_workers is greater than one, runs are executed
+    concurrently in processes pinned to disjoint sets of cores. If
+    replicated is set, all runs are trained at once as replicas of a single
+    network and the weights of each replica are stored in an archive of
+    the run folder (see REPLICA_FILE)
     """
     if folder is None:
         out_folder = tempfile.mkdtemp()
     else:
         out_folder = folder
 
-    total_stats = []
+    if replicated:
+        best_params = best_params.copy()
+        best_params['replicas'] = n_runs
+
+    run_fn = functools.partial(
+        _run_once,
+        dataset,
+        settings_fn,
+        best_params,
+        out_folder,
+        test_batch_size,
+        fine_tune
+    )
 
-    for i in range(n_runs):
+    if replicated:
+        total_stats = _split_replicas(run_fn(0), n_runs)
+    elif n_workers > 1:
+        total_stats = _parallel_runs(run_fn, n_runs, n_workers)
+    else:
+        total_stats = [run_fn(i) for i in range(n_runs)]
+
+    if folder is None:
+        shutil.rmtree(out_folder)
 
-        # Train model for current simulation
-        run_folder = os.path.join(out_folder, str(_get_millis_time()))
-        logger.info('Running training [{}] in {}'.format(i, run_folder))
+    return total_stats
 
-        before = time.time()
-        _, fit_loss, fit_error, fit_l2 = _incremental_training(
-            dataset, settings_fn, run_folder, **best_params
+
+def _run_once(dataset,
+              settings_fn,
+              best_params,
+              out_folder,
+              test_batch_size,
+              fine_tune,
+              i,
+              cores=None):
+    """
+    Trains and evaluates the i-th model of a setting. If cores are given,
+    the current process is pinned to them
+    """
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+        best_params = best_params.copy()
+        best_params.update({
+            'intra_op_threads': len(cores),
+            'inter_op_threads': len(cores)
+        })
+
+    # Train model for current simulation
+    run_folder = os.path.join(
+        out_folder, '%d_%d' % (_get_millis_time(), i)
+        if cores is not None else str(_get_millis_time())
+    )
+    logger.info('Running training [{}] in {}'.format(i, run_folder))
+
+    before = time.time()
+    training_stats, weights = _incremental_training(
+        dataset, settings_fn, run_folder, **best_params
+    )
+    _, fit_loss, fit_error, fit_l2 = training_stats
+
+    if fine_tune is not None:
+        _, fit_loss, fit_error, fit_l2 = fine_tune_training(
+            dataset, settings_fn, run_folder, fine_tune,
+            restore_weights=weights, **best_params
         )
 
-        if fine_tune is not None:
-            _, fit_loss, fit_error, fit_l2 = fine_tune_training(
-                dataset, settings_fn, run_folder, fine_tune, **best_params
-            )
+    diff = time.time() - before
+
+    if best_params.get('replicas', None) is not None:
+        _save_replicas(run_folder, best_params['replicas'])
+
+    logger.info('Running prediction [%s] from on %s' % (i, run_folder))
+
+    run_stats = {
+        'train_loss': fit_loss,
+        'train_error': fit_error,
+        'train_l2': fit_l2,
+        'time(s)': diff
+    }
 
-        diff = time.time() - before
+    # Evaluate test for current simulation
+    model = DeepNetworkTraining(
+        folder=run_folder,
+        settings_fn=settings_fn,
+        data_location=get_data_location(dataset, folded=True)
+    )
+
+    test_params = best_params.copy()
+    del test_params['batch_size']
+
+    test_stats = model.predict(
+        batch_size=test_batch_size,
+        **test_params
+    )
+
+    run_stats.update(test_stats)
 
-        logger.info('Running prediction [%s] from on %s' % (i, run_folder))
+    logger.info('Training [{}] got results {}'.format(i, run_stats))
+    return run_stats
 
-        run_stats = {
-            'train_loss': fit_loss,
-            'train_error': fit_error,
-            'train_l2': fit_l2,
-            'time(s)': diff
+
+def _split_replicas(run_stats, n_runs):
+    """
+    Splits the stats of a replicated run into the stats of each replica.
+    Training time is shared evenly among the replicas
+    """
+    replica_stats = []
+    for i in range(n_runs):
+        stats = {
+            k: v[i] if isinstance(v, list) else v
+            for k, v in run_stats.items()
         }
+        stats['time(s)'] = run_stats['time(s)'] / n_runs
+        replica_stats.append(stats)
+    return replica_stats
 
-        # Evaluate test for current simulation
-        model = DeepNetworkTraining(
-            folder=run_folder,
-            settings_fn=settings_fn,
-            data_location=get_data_location(dataset, folded=True)
-        )
 
-        test_params = best_params.copy()
-        del test_params['batch_size']
+def _save_replicas(run_folder, n_replicas):
+    """
+    Stores the weights of each replica found in the checkpoint of a
+    replicated run in its own archive, which can be loaded into a network
+    with a single replica
+    """
+    weights = StageWeights.from_checkpoint(run_folder)
+    for i in range(n_replicas):
+        weights.select([i]).save(os.path.join(run_folder, REPLICA_FILE % i))
+
 
-        test_stats = model.predict(
-            batch_size=test_batch_size,
-            **test_params
+def _parallel_runs(run_fn, n_runs, n_workers):
+    """
+    Executes the runs in a pool of processes and returns their stats in
+    run order. Every worker pins itself to a free set of cores while it
+    runs, so concurrent runs do not compete for the same cores
+    """
+    cores = sorted(os.sched_getaffinity(0))
+    n_workers = min(n_workers, len(cores), n_runs)
+
+    context = multiprocessing.get_context('spawn')
+    manager = context.Manager()
+    free_cores = manager.Queue()
+    for worker in range(n_workers):
+        free_cores.put(cores[worker::n_workers])
+
+    pool = context.Pool(processes=n_workers, maxtasksperchild=1)
+    try:
+        # One run per task, so each run gets a fresh worker
+        return pool.map(
+            functools.partial(_pinned_run, run_fn, free_cores),
+            range(n_runs),
+            chunksize=1
         )
+    finally:
+        pool.terminate()
+        pool.join()
+        manager.shutdown()
 
-        run_stats.update(test_stats)
 
-        logger.info('Training [{}] got results {}'.format(i, run_stats))
-        total_stats.append(run_stats)
+def _pinned_run(run_fn, free_cores, i):
+    cores = free_cores.get()
+    try:
+        return run_fn(i, cores=cores)
+    finally:
+        free_cores.put(cores)
 
-    if folder is None:
-        shutil.rmtree(out_folder)
 
-    return total_stats
+def _trial_params(params, **helpers):
+    """ Adds the tuning helpers that are set to the parameters of a trial """
+    trial_params = params.copy()
+    trial_params.update({k: v for k, v in helpers.items() if v is not None})
+    return trial_params
+
+
+def _evaluate_trial(validate_fn, dataset, settings_fn, params):
+    """
+    Picklable evaluation of a trial for worker processes and queue workers
+    """
+    return validate_fn(dataset, settings_fn, **params)
+
+
+def _evaluate_population(cross_validate, dataset, settings_fn, members):
+    """
+    Validates the given trials, which share the shapes of their graphs, as
+    the members of a single population and returns the result of each
+    """
+    if len(members) == 1:
+        validate_fn = _cross_validate if cross_validate else _simple_evaluate
+        return [validate_fn(dataset, settings_fn, **members[0])]
+
+    data_location = get_data_location(dataset, folded=True)
+    n_folds = settings_fn(data_location).get_fold_num()
+    val_folds = range(n_folds) if cross_validate \
+        else [np.random.randint(n_folds)]
+
+    params = merge_population_params(members)
+    fold_results = [
+        _population_validation(dataset, settings_fn, val_fold, **params)
+        for val_fold in val_folds
+    ]
+
+    results = []
+    for i, member in enumerate(members):
+        member_results = [fold[i] for fold in fold_results]
+        avg_results = _average_results(member_results)
+
+        logger.info('Finished evaluation on {}'.format(member))
+        logger.info('Obtained results {}'.format(avg_results))
+
+        results.append({
+            'loss': avg_results['val_error'],
+            'averaged': avg_results,
+            'parameters': member,
+            'all': member_results,
+            'status': STATUS_OK
+        })
+
+    return results
 
 
 def _simple_evaluate(dataset, settings_fn, **params):
@@ -145,9 +435,12 @@ def _simple_evaluate(dataset, settings_fn, **params):
     n_folds = settings_fn(data_location).get_fold_num()
     validation_fold = np.random.randint(n_folds)
 
-    best = _incremental_validation(
-        dataset, settings_fn, validation_fold, **params
-    )
+    try:
+        best = _incremental_validation(
+            dataset, settings_fn, validation_fold, **params
+        )
+    except TrialAborted as e:
+        return _aborted_result(e, params)
 
     logger.info('Finished evaluation on {}'.format(params))
     logger.info('Obtained results {}'.format(best))
@@ -163,24 +456,47 @@ def _simple_evaluate(dataset, settings_fn, **params):
 def _cross_validate(dataset, settings_fn, **params):
     """
     Returns the average metric over the folds for the
-    given execution setting
+    given execution setting. If 'fold_workers' is greater than one, folds
+    are validated concurrently by that many workers. If 'racing' is set,
+    folds are validated in waves and the remaining ones are skipped once
+    the setting is found worse than the best one so far
     """
     dataset_location = get_data_location(dataset, folded=True)
     n_folds = settings_fn(dataset_location).get_fold_num()
     folds_set = range(n_folds)
-    results = []
+    fold_workers = params.get('fold_workers', 1)
+    racing = params.get('racing', None)
 
     logger.debug('Starting evaluation on {} ...'.format(params))
 
-    for val_fold in folds_set:
+    before = time.time()
 
-        best = _incremental_validation(
-            dataset, settings_fn, val_fold, **params
-        )
+    try:
+        if racing is not None:
+            timed = _raced_folds(
+                dataset, settings_fn, folds_set, fold_workers, racing,
+                **params
+            )
+        elif fold_workers > 1:
+            timed = _parallel_folds(
+                dataset, settings_fn, folds_set, fold_workers, **params
+            )
+        else:
+            timed = [
+                _timed_validation(dataset, settings_fn, val_fold, **params)
+                for val_fold in folds_set
+            ]
+    except TrialAborted as e:
+        return _aborted_result(e, params)
 
-        results.append(best)
+    elapsed = time.time() - before
+    results = [best for best, _ in timed]
+    speedup = np.sum([fold_time for _, fold_time in timed]) / elapsed
 
     avg_results = _average_results(results)
+    loss = avg_results['val_error'] if racing is None else racing.update(
+        [x['val_error'] for x in results], n_folds
+    )
 
     logger.info(
         'Finished cross validaton on: {} \n'.format(params)
@@ -190,15 +506,107 @@ def _cross_validate(dataset, settings_fn, **params):
         'Results: {} \n'.format(avg_results)
     )
 
+    logger.info(
+        'Validated %d of %d folds in %fs with %d workers (%.2fx speedup)'
+        % (len(results), n_folds, elapsed, fold_workers, speedup)
+    )
+
     return {
-        'loss': avg_results['val_error'],
+        'loss': loss,
         'averaged': avg_results,
         'parameters': params,
         'all': results,
+        'speedup': speedup,
         'status': STATUS_OK
     }
 
 
+def _raced_folds(dataset,
+                 settings_fn,
+                 folds_set,
+                 fold_workers,
+                 racing,
+                 **params):
+    """
+    Validates the folds in waves of fold_workers folds, in order, and stops
+    after the first wave that makes racing abandon the setting
+    """
+    timed = []
+    for start in range(0, len(folds_set), fold_workers):
+        wave = folds_set[start:start + fold_workers]
+        if fold_workers > 1:
+            timed.extend(_parallel_folds(
+                dataset, settings_fn, wave, fold_workers, **params
+            ))
+        else:
+            timed.extend([
+                _timed_validation(dataset, settings_fn, val_fold, **params)
+                for val_fold in wave
+            ])
+
+        errors = [best['val_error'] for best, _ in timed]
+        if len(timed) < len(folds_set) and racing.is_hopeless(errors):
+            logger.info(
+                'Abandoning setting after %d folds with errors %s'
+                % (len(timed), errors)
+            )
+            break
+
+    return timed
+
+
+def _aborted_result(error, params):
+    """
+    Returns the failed result of a trial aborted by the watchdog, which
+    hyperopt leaves out when looking for the best trial
+    """
+    logger.info('Aborted evaluation on {}: {}'.format(params, error))
+    return {
+        'status': STATUS_FAIL,
+        'failure': str(error),
+        'parameters': params
+    }
+
+
+def _parallel_folds(dataset, settings_fn, folds_set, fold_workers, **params):
+    """
+    Validates the folds in a bounded pool of threads, each of them running
+    its own graphs with a share of the available CPU threads. Sessions
+    release the interpreter lock so folds train concurrently
+    """
+    total_threads = params.get('intra_op_threads', None) \
+        or multiprocessing.cpu_count()
+    fold_threads = max(1, total_threads // fold_workers)
+
+    fold_params = params.copy()
+    fold_params.update({
+        'intra_op_threads': fold_threads,
+        'inter_op_threads': fold_threads
+    })
+
+    if params.get('watchdog', False):
+        # Folds stop training as soon as one of them is aborted
+        fold_params['abort_event'] = threading.Event()
+
+    pool = ThreadPool(processes=fold_workers)
+    try:
+        return pool.map(
+            lambda fold: _timed_validation(
+                dataset, settings_fn, fold, **fold_params
+            ),
+            folds_set
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _timed_validation(dataset, settings_fn, val_fold, **params):
+    before = time.time()
+    best = _incremental_validation(dataset, settings_fn, val_fold, **params)
+    return best, time.time() - before
+
+
 def _incremental_training(dataset,
                           settings_fn,
                           train_folder,
@@ -206,7 +614,8 @@ def _incremental_training(dataset,
                           train_epochs,
                           **params):
     dataset_location = get_data_location(dataset, folded=True)
-    prev_folder = None
+    handoff = params.get('stage_handoff', False)
+    prev_folder, prev_weights = None, None
 
     for layer in range(1, num_layers+1):
 
@@ -235,13 +644,19 @@ def _incremental_training(dataset,
             max_epochs=epochs_layer,
             switch_epochs=None,
             restore_folder=prev_folder,
+            restore_weights=prev_weights,
             restore_layers=[x for x in range(1, layer)],
+            # Intermediate stages are handed over in memory
+            save_checkpoints=not handoff or layer == num_layers,
             **params
         )
 
-        prev_folder = current_folder
+        if handoff:
+            prev_weights = model.stage_weights()
+        else:
+            prev_folder = current_folder
 
-    return training_stats
+    return training_stats, prev_weights
 
 
 def _incremental_validation(dataset, settings_fn, val_fold, **params):
@@ -251,14 +666,39 @@ def _incremental_validation(dataset, settings_fn, val_fold, **params):
     stats for the best setting found
     """
     dataset_location = get_data_location(dataset, folded=True)
-    n_folds = settings_fn(dataset_location).get_fold_num()
-    folds_set = range(n_folds)
     folder = tempfile.mkdtemp() if 'tune_folder' not in params \
-        else os.path.join(params.get('tune_folder'), str(_get_millis_time()))
+        else _tune_subfolder(params.get('tune_folder'))
 
-    prev_err, prev_folder = float('inf'), None
+    try:
+        return _validate_stages(
+            settings_fn, dataset_location, val_fold, folder, **params
+        )
+    finally:
+        # Also when the trial is aborted
+        if params.get('tune_folder', None) is None:
+            shutil.rmtree(folder)
+
+
+def _validate_stages(settings_fn, dataset_location, val_fold, folder,
+                     **params):
+    """
+    Runs the stages of _incremental_validation, storing the models of
+    each of them under the given folder
+    """
+    n_folds = settings_fn(dataset_location).get_fold_num()
+    folds_set = range(n_folds)
+    handoff = params.get('stage_handoff', False)
+    prev_err, prev_folder, prev_weights = float('inf'), None, None
     epochs, best = [], None
 
+    # Stages share the epoch count, so they go through the same rungs
+    halving = params['scheduler'].new_run() \
+        if params.get('scheduler', None) is not None else None
+
+    # Stages already validated by previous trials are not trained again
+    stage_cache = StageCache(params['stage_cache']) \
+        if params.get('stage_cache', None) is not None else None
+
     for layer in range(1, params.get('max_layers')+1):
 
         logger.debug(
@@ -266,23 +706,47 @@ def _incremental_validation(dataset, settings_fn, val_fold, **params):
         )
 
         current_folder = os.path.join(folder, 'layer_%d' % layer)
+        stage_key = stage_cache.key(params, val_fold, layer) \
+            if stage_cache is not None else None
+        cached = stage_cache.get(stage_key) \
+            if stage_cache is not None else None
+
+        if cached is not None:
+            fitted, stage_weights = cached
+            if halving is not None:
+                # Replayed as the last strip of the stage, so the trial is
+                # still compared with those that trained it
+                halving.strip_update(fitted['epoch'], fitted['val_error'])
+        else:
+            model = DeepNetworkValidation(
+                settings_fn,
+                dataset_location,
+                folder=current_folder
+            )
 
-        model = DeepNetworkValidation(
-            settings_fn,
-            dataset_location,
-            folder=current_folder
-        )
+            fitted = model.fit(
+                train_folds=[x for x in folds_set if x != val_fold],
+                val_folds=[val_fold],
+                num_layers=layer,
+                train_only=layer,
+                restore_folder=prev_folder,
+                restore_weights=prev_weights,
+                restore_layers=[x for x in range(1, layer)],
+                layerwise=False,
+                # Best models are only needed by the next stage
+                save_checkpoints=not handoff,
+                halving=halving,
+                **params
+            )
 
-        fitted = model.fit(
-            train_folds=[x for x in folds_set if x != val_fold],
-            val_folds=[val_fold],
-            num_layers=layer,
-            train_only=layer,
-            restore_folder=prev_folder,
-            restore_layers=[x for x in range(1, layer)],
-            layerwise=False,
-            **params
-        )
+            stage_weights = model.stage_weights() if handoff else None
+            stopped = halving is not None and halving.stopped
+            if stage_cache is not None and not stopped:
+                # Stages cut short by the scheduler are not complete
+                _cache_stage(
+                    stage_cache, stage_key, fitted, stage_weights,
+                    current_folder
+                )
 
         logger.debug(
             '[{}] Training got: {}'.format(layer, fitted)
@@ -291,7 +755,10 @@ def _incremental_validation(dataset, settings_fn, val_fold, **params):
         if prev_err > fitted['val_error']:
             # Update previous fit
             prev_err = fitted['val_error']
-            prev_folder = current_folder
+            if stage_weights is not None:
+                prev_weights, prev_folder = stage_weights, None
+            else:
+                prev_weights, prev_folder = None, current_folder
 
             # Update best model info
             best = fitted
@@ -301,6 +768,12 @@ def _incremental_validation(dataset, settings_fn, val_fold, **params):
             logger.debug(
                 '[%d] Training improved. Going for next layer...' % layer
             )
+
+            if halving is not None and halving.stopped:
+                logger.debug(
+                    '[%d] Stopped by the scheduler. Stopping...' % layer
+                )
+                break
         else:
             # Layer did not improve, let's keep layer - 1 layers
             logger.debug(
@@ -310,11 +783,101 @@ def _incremental_validation(dataset, settings_fn, val_fold, **params):
 
     del best['epoch']
     best.update({'train_epochs': epochs})
+    return best
 
-    if params.get('tune_folder', None) is None:
-        shutil.rmtree(folder)
 
-    return best
+def _population_validation(dataset, settings_fn, val_fold, **params):
+    """
+    Equivalent to _incremental_validation for a population. Members whose
+    new layer does not improve their validation error keep their previous
+    network and drop out of the population trained in the next stage
+    """
+    dataset_location = get_data_location(dataset, folded=True)
+    n_folds = settings_fn(dataset_location).get_fold_num()
+    folds_set = range(n_folds)
+    folder = tempfile.mkdtemp() if 'tune_folder' not in params \
+        else _tune_subfolder(params.get('tune_folder'))
+
+    try:
+        n_members = params.get('replicas')
+        prev_errs = [float('inf')] * n_members
+        epochs = [[] for _ in range(n_members)]
+        best = [None] * n_members
+        active, prev_weights = list(range(n_members)), None
+
+        for layer in range(1, params.get('max_layers')+1):
+
+            logger.debug(
+                '[%d] Starting incremental training of members %s'
+                % (layer, active)
+            )
+
+            model = DeepNetworkValidation(
+                settings_fn,
+                dataset_location,
+                folder=os.path.join(folder, 'layer_%d' % layer)
+            )
+
+            fitted = model.fit(
+                train_folds=[x for x in folds_set if x != val_fold],
+                val_folds=[val_fold],
+                num_layers=layer,
+                train_only=layer,
+                restore_weights=prev_weights,
+                restore_layers=[x for x in range(1, layer)],
+                layerwise=False,
+                **select_members(params, active)
+            )
+
+            improved = []
+            for i, member in enumerate(active):
+                if prev_errs[member] > fitted[i]['val_error']:
+                    prev_errs[member] = fitted[i]['val_error']
+                    best[member] = fitted[i]
+                    best[member].update({'num_layers': layer})
+                    epochs[member].append(fitted[i]['epoch'])
+                    improved.append(i)
+
+            logger.debug(
+                '[%d] Training improved for members %s'
+                % (layer, [active[i] for i in improved])
+            )
+
+            if len(improved) == 0:
+                break
+
+            prev_weights = model.stage_weights().select(improved)
+            active = [active[i] for i in improved]
+
+        for member in range(n_members):
+            del best[member]['epoch']
+            best[member].update({'train_epochs': epochs[member]})
+
+        return best
+    finally:
+        if params.get('tune_folder', None) is None:
+            shutil.rmtree(folder)
+
+
+def _cache_stage(stage_cache, key, fitted, stage_weights, stage_folder):
+    if stage_weights is None:
+        # Best model only stored in the checkpoint of the stage
+        stage_weights = StageWeights.from_checkpoint(stage_folder)
+
+    if stage_weights is not None:
+        stage_cache.put(key, fitted, stage_weights)
+
+
+def _tune_subfolder(tune_folder):
+    """
+    Returns a new folder inside the tuning one. Names start with the current
+    time but are unique even if folds or trials run concurrently
+    """
+    if not os.path.isdir(tune_folder):
+        os.makedirs(tune_folder, exist_ok=True)
+    return tempfile.mkdtemp(
+        prefix='%d_' % _get_millis_time(), dir=tune_folder
+    )
 
 
 def _average_results(results):
@@ -3,20 +3,36 @@ import logging
 import tensorflow as tf
 
 from layout.base import get_layer_id, BATCH_NORM_COLLECTION
-from kernels import KERNEL_COLLECTION
+from kernels import KERNEL_COLLECTION, SEEDED_KERNEL_COLLECTION
 
 logger = logging.getLogger(__name__)
 
+KERNEL_GENERATION_COLLECTION = 'KERNEL_GENERATIONS'
+
 
 def get_variable_name(name):
     return name.split(':')[0]
 
 
 def get_all_variables(layers, include_output=True):
+    """
+    Returns the variables to checkpoint for the given layers. Seeded kernel
+    matrices are left out since they are regenerated at init
+    """
     ws_and_bs = _get_weights_and_biases(layers, include_output=include_output)
-    kernels = get_kernel_vars(layers)
+    seeded = tf.get_collection(SEEDED_KERNEL_COLLECTION)
+    kernels = [k for k in get_kernel_vars(layers) if k not in seeded]
     bns = _get_bn_vars(layers)
-    return ws_and_bs + kernels + bns
+    generations = _get_generation_vars(layers)
+    return ws_and_bs + kernels + bns + generations
+
+
+def get_checkpoint_variables():
+    """
+    Returns all global variables but seeded kernel matrices
+    """
+    seeded = tf.get_collection(SEEDED_KERNEL_COLLECTION)
+    return [v for v in tf.global_variables() if v not in seeded]
 
 
 def get_trainable_params(layers, include_output=True):
@@ -60,6 +76,16 @@ def get_model_weights(layers, include_output=True):
     return weights
 
 
+def get_output_variables():
+    """
+    Returns the weights and biases of the output layer
+    """
+    output_vars = _get_weights_and_biases([], include_output=True)
+    weights = [v for v in output_vars if 'weight' in v.name][0]
+    biases = [v for v in output_vars if 'bias' in v.name][0]
+    return weights, biases
+
+
 def _get_bn_vars(layers):
     selected = []
     bns = tf.get_collection(BATCH_NORM_COLLECTION)
@@ -71,6 +97,20 @@ def _get_bn_vars(layers):
     return selected
 
 
+def _get_generation_vars(layers):
+    selected = []
+    for var in tf.get_collection(KERNEL_GENERATION_COLLECTION):
+        try:
+            layer_name = var.name.split('/')[1]
+            layer_id = get_layer_id(layer_name)
+            if int(layer_id) in layers:
+                selected.append(var)
+        except Exception:
+            # Post CNN blocks FC layer found
+            selected.append(var)
+    return selected
+
+
 def _get_weights_and_biases(layer_list, include_output=True):
     selected = []
     ws_and_bs = tf.get_collection(tf.GraphKeys.WEIGHTS)